@@ -0,0 +1,307 @@
+import argparse
+import json
+import sys
+import tempfile
+import timeit
+import numpy as np
+
+from pathlib import Path
+from scipy.linalg import block_diag
+from typing import Callable, Dict, Tuple
+
+from run_ukf import get_data_for_ukf, perform_ukf
+from src.scripts.get_required_data import get_data
+from src.scripts.read_data import read_data_file
+from src.scripts.synthetic_trace import write_synthetic_trace, write_synthetic_floor_info
+from src.model.unscented_kalman import compute_sigmas, compute_sigma_weights, perform_ut, update
+from src.model.means_and_residuals import state_mean, state_residual
+from src.model.waypoint_measurement_fix import fix_waypoint
+from src.model.state_transition_functions import fx
+from src.model.measurement_functions import hx
+from src.model.rts_smoother import rts_smoother, rts_smoother_from_predictions
+from src.model.noise_stream import NoiseStream
+from src.model.batch_unscented_kalman import perform_ukf_batches
+
+
+def benchmark_parameters(seed: int = 0) -> Tuple[np.ndarray, ...]:
+
+    """
+    Function to get fixed initial state and noise matrices for benchmarks, drawn the same way as
+    in Params but from a seeded generator.
+
+    :param seed: Random seed
+    :return: Initial state, initial covariance, measurement noise and process noise
+    """
+
+    rng = np.random.default_rng(seed)
+
+    initial_mu = np.array([100, 100, 0.5, 3.0, 3.0, 0.01, 0.01, 0.01])
+    a = rng.normal(0.0, 1.0, (8, 8))
+    initial_covariance = a @ a.T + np.eye(8)
+    initial_covariance[0, 0], initial_covariance[1, 1] = 100, 100
+
+    R = rng.normal(0.0, 1.0, (8, 8))
+    Q = block_diag(
+        rng.normal(100.0, 100, (2, 2)),
+        rng.normal(0.0, 5.0, (3, 3)),
+        rng.normal(0.0, 2 * np.pi, (3, 3)),
+    )
+
+    return initial_mu, initial_covariance, R, Q
+
+
+def time_function(function: Callable, repeat: int, number: int) -> Dict[str, float]:
+
+    """
+    Function to time a benchmark.
+
+    :param function: Function without arguments to time
+    :param repeat: Number of timing repetitions
+    :param number: Number of calls per repetition
+    :return: Minimum and median seconds per call
+    """
+
+    times = np.array(timeit.repeat(function, repeat=repeat, number=number)) / number
+
+    return {"min_s": float(times.min()), "median_s": float(np.median(times)), "number": number}
+
+
+def run_micro_benchmarks(
+    data_dir: Path, duration: float, rate: float, repeat: int
+) -> Dict[str, Dict[str, float]]:
+
+    """
+    Function to run microbenchmarks of the filter, smoother and parser hot paths.
+
+    :param data_dir: Directory for synthetic data
+    :param duration: Length of the synthetic trace in seconds
+    :param rate: Sensor sampling rate in Hz
+    :param repeat: Number of timing repetitions
+    :return: Benchmark results keyed by name
+    """
+
+    initial_mu, initial_covariance, R, Q = benchmark_parameters()
+    wm, wc, lambda_ = compute_sigma_weights(0.3, 2.0)
+    sigmas = compute_sigmas(lambda_, initial_mu, initial_covariance)
+    noise_stream = NoiseStream(np.random.default_rng(0), len(wm))
+    fx_noise, hx_noise = noise_stream.next()
+    ukf_mean, ukf_cov, sigmas_f = perform_ut(
+        sigmas, 0.02, fx, wm, wc, Q, True, angle_noise=fx_noise
+    )
+    measurement = np.concatenate((initial_mu[:2], np.zeros(6)))
+
+    trace_file = data_dir / "micro" / "trace.txt"
+    floor_file = data_dir / "micro" / "floor_info.json"
+    write_synthetic_trace(trace_file, duration=duration, rate=rate)
+    write_synthetic_floor_info(floor_file)
+    acc, gyro, way = get_data(trace_file, cache=False)
+
+    # Smoother input is a short filtered stretch of the synthetic trace
+    smoother_steps = 200
+    _, _, dt, measurements = get_data_for_ukf(acc, gyro, way, floor_file)
+    dt = dt[:smoother_steps]
+    states, covariances, *predictions = perform_ukf(
+        measurements[:smoother_steps],
+        dt,
+        initial_mu,
+        initial_covariance,
+        R,
+        Q,
+        record_predictions=True,
+        rng=np.random.default_rng(0),
+    )
+
+    benchmarks = {
+        "compute_sigmas": (lambda: compute_sigmas(lambda_, initial_mu, initial_covariance), 200),
+        "compute_sigma_weights": (lambda: compute_sigma_weights(0.3, 2.0), 1000),
+        "perform_ut": (
+            lambda: perform_ut(sigmas, 0.02, fx, wm, wc, Q, True, angle_noise=fx_noise),
+            200,
+        ),
+        "update": (
+            lambda: update(
+                ukf_mean,
+                ukf_cov,
+                sigmas_f,
+                0.02,
+                measurement,
+                hx,
+                wm,
+                wc,
+                R,
+                angle_noise=hx_noise,
+            ),
+            200,
+        ),
+        "noise_stream_next": (noise_stream.next, 1000),
+        "state_mean": (lambda: state_mean(sigmas_f, wm), 1000),
+        "state_residual": (lambda: state_residual(sigmas_f[1], ukf_mean), 1000),
+        "fix_waypoint": (lambda: fix_waypoint(acc[:, 0], way), 10),
+        "read_data_file": (lambda: read_data_file(trace_file), 1),
+        f"rts_smoother_{smoother_steps}": (lambda: rts_smoother(states, covariances, Q, dt), 1),
+        f"rts_smoother_from_predictions_{smoother_steps}": (
+            lambda: rts_smoother_from_predictions(states, covariances, *predictions),
+            10,
+        ),
+    }
+
+    return {
+        name: time_function(function, repeat, number)
+        for name, (function, number) in benchmarks.items()
+    }
+
+
+def run_end_to_end_benchmark(
+    data_dir: Path, duration: float, rate: float, repeat: int, traces: int = 8
+) -> Dict[str, Dict[str, float]]:
+
+    """
+    Function to run the run_ukf pipeline (parse, measurement fix and filter) over a synthetic
+    trace, and to filter a set of synthetic traces one at a time with perform_ukf and together
+    with the batched engine (perform_ukf_batches), as run_ukf_dataset.py does with and without
+    --batch-size.
+
+    :param data_dir: Directory for synthetic data
+    :param duration: Length of the synthetic trace in seconds
+    :param rate: Sensor sampling rate in Hz
+    :param repeat: Number of timing repetitions
+    :param traces: Number of traces of the multi-trace benchmarks
+    :return: Benchmark results keyed by name
+    """
+
+    initial_mu, initial_covariance, R, Q = benchmark_parameters()
+
+    trace_file = data_dir / "end_to_end" / "trace.txt"
+    floor_file = data_dir / "end_to_end" / "floor_info.json"
+    write_synthetic_trace(trace_file, duration=duration, rate=rate)
+    write_synthetic_floor_info(floor_file)
+
+    def pipeline():
+        acc, gyro, way = get_data(trace_file, cache=False)
+        _, _, timestep, measurements = get_data_for_ukf(acc, gyro, way, floor_file)
+        perform_ukf(
+            measurements,
+            timestep,
+            initial_mu,
+            initial_covariance,
+            R,
+            Q,
+            rng=np.random.default_rng(0),
+        )
+
+    # Traces of a building differ in length, the multi-trace benchmarks use 50% to 100% of duration
+    measurements, timesteps = [], []
+    for i in range(traces):
+        multi_trace_file = data_dir / "end_to_end" / f"trace_{i}.txt"
+        write_synthetic_trace(
+            multi_trace_file, duration=duration * (1 + i / traces) / 2, rate=rate, seed=i
+        )
+        acc, gyro, way = get_data(multi_trace_file, cache=False)
+        _, _, timestep, measurement = get_data_for_ukf(acc, gyro, way, floor_file)
+        measurements.append(measurement)
+        timesteps.append(timestep)
+
+    def sequential():
+        for i, (measurement, timestep) in enumerate(zip(measurements, timesteps)):
+            perform_ukf(
+                measurement,
+                timestep,
+                initial_mu,
+                initial_covariance,
+                R,
+                Q,
+                rng=np.random.default_rng(i),
+            )
+
+    def batched():
+        perform_ukf_batches(
+            measurements,
+            timesteps,
+            initial_mu,
+            initial_covariance,
+            R,
+            Q,
+            batch_size=traces,
+            rng=[np.random.default_rng(i) for i in range(traces)],
+        )
+
+    return {
+        f"run_ukf_{duration:g}s_{rate:g}hz": time_function(pipeline, repeat, 1),
+        f"perform_ukf_{traces}_traces": time_function(sequential, repeat, 1),
+        f"perform_ukf_batches_{traces}_traces": time_function(batched, repeat, 1),
+    }
+
+
+def compare_to_baseline(
+    results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float
+) -> Dict[str, float]:
+
+    """
+    Function to find benchmarks which got slower than the baseline. Minimum times are compared
+    since they are the least affected by other load on the machine.
+
+    :param results: Current benchmark results
+    :param baseline: Baseline benchmark results
+    :param threshold: Allowed relative slowdown, e.g. 0.1 for 10%
+    :return: Relative slowdown of every benchmark above the threshold
+    """
+
+    regressions = {}
+
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        slowdown = result["min_s"] / baseline[name]["min_s"] - 1
+        if slowdown > threshold:
+            regressions[name] = slowdown
+
+    return regressions
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--suite", help="Benchmarks to run", choices=("micro", "e2e", "all"), default="all"
+    )
+    parser.add_argument("--duration", help="Synthetic trace length (s)", type=float, default=60)
+    parser.add_argument("--rate", help="Synthetic sensor rate (Hz)", type=float, default=50)
+    parser.add_argument("--repeat", help="Timing repetitions", type=int, default=5)
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare results to this JSON baseline")
+    parser.add_argument(
+        "--threshold", help="Allowed relative slowdown vs baseline", type=float, default=0.1
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        benchmark_results = {}
+        if args.suite in ("micro", "all"):
+            benchmark_results.update(
+                run_micro_benchmarks(Path(temp_dir), args.duration, args.rate, args.repeat)
+            )
+        if args.suite in ("e2e", "all"):
+            benchmark_results.update(
+                run_end_to_end_benchmark(Path(temp_dir), args.duration, args.rate, args.repeat)
+            )
+
+    for benchmark_name, benchmark_result in benchmark_results.items():
+        print(
+            f"{benchmark_name:<36}min {1000 * benchmark_result['min_s']:>10.3f} ms"
+            f"   median {1000 * benchmark_result['median_s']:>10.3f} ms"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(benchmark_results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline_results = json.load(f)
+
+        slower = compare_to_baseline(benchmark_results, baseline_results, args.threshold)
+        for benchmark_name, benchmark_slowdown in slower.items():
+            print(f"REGRESSION {benchmark_name}: {100 * benchmark_slowdown:.1f}% slower")
+
+        if slower:
+            sys.exit(1)
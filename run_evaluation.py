@@ -0,0 +1,60 @@
+import argparse
+import csv
+import os
+import sys
+
+from pathlib import Path
+
+from src.util.definitions import RESULTS_PATH
+from src.scripts.evaluation import SUMMARY_LEVELS, evaluate_results
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-b", "--building", help="Building glob pattern", default="*")
+    parser.add_argument("-f", "--floor", help="Floor glob pattern", default="*")
+    parser.add_argument(
+        "-l", "--level", help="Group errors by", choices=tuple(SUMMARY_LEVELS), default="floor"
+    )
+    parser.add_argument(
+        "--field",
+        help="Field of the estimates, defaults to smoothed states if a trace has them",
+        choices=("states", "smoothed_states"),
+    )
+    parser.add_argument("-r", "--results", help="Result store directory", default=str(RESULTS_PATH))
+    parser.add_argument(
+        "-w", "--workers", help="Number of worker processes", type=int, default=os.cpu_count()
+    )
+    parser.add_argument("-o", "--output", help="Write the summary to this CSV file", type=Path)
+    args = parser.parse_args()
+
+    evaluation = evaluate_results(
+        args.building, args.floor, Path(args.results), args.field, args.workers
+    )
+
+    if not evaluation.traces:
+        sys.exit("No results with waypoints found")
+
+    summary = evaluation.summary(args.level)
+    if args.level != "all":
+        summary.update(evaluation.summary("all"))
+
+    columns = list(next(iter(summary.values())))
+    print(f"{'group':<48}" + "".join(f"{column:>12}" for column in columns))
+    for key, statistics in summary.items():
+        values = (statistics[column] for column in columns)
+        print(
+            f"{'/'.join(key) or 'all':<48}"
+            + "".join(
+                f"{value:>12.3f}" if isinstance(value, float) else f"{value:>12}"
+                for value in values
+            )
+        )
+
+    if args.output is not None:
+        with args.output.open("w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["group"] + columns)
+            for key, statistics in summary.items():
+                row = [statistics[column] for column in columns]
+                writer.writerow(["/".join(key) or "all"] + row)
@@ -0,0 +1,166 @@
+import argparse
+import os
+import sys
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from src.util.definitions import METADATA_PATH, RESULTS_PATH
+from src.scripts.result_store import ResultReader, list_results
+from src.visualization.result_visualization import *
+
+
+def render_trace(
+    result: Tuple[str, str, str],
+    output_dir: Path,
+    image_format: str = "html",
+    max_points: int = MAX_PLOT_POINTS,
+    results_path: Path = RESULTS_PATH,
+    metadata_path: Path = METADATA_PATH,
+) -> Path:
+
+    """
+    Function to render the waypoints and the estimated trajectory of one trace in the result
+    store to output_dir / building / floor / trace.<format>. Smoothed states are plotted if the
+    trace has them. The floor plan and size come from the LRU caches of the visualization
+    module, so a worker loads every floor once.
+
+    :param result: Building, floor and trace of the result
+    :param output_dir: Report directory
+    :param image_format: "html" for an interactive plotly page, otherwise an image format
+    matplotlib can write (png, svg, pdf, ...)
+    :param max_points: Estimated trajectories are decimated to this many points with lttb
+    :param results_path: Result store directory
+    :param metadata_path: Directory with building / floor / floor metadata layout
+    :return: Path of the written report file
+    """
+
+    building, floor, trace = result
+    reader = ResultReader(building, floor, trace, results_path)
+    states_field = "smoothed_states" if "smoothed_states" in reader.fields else "states"
+    estimate = reader.read(fields=[states_field])[states_field][:, :2]
+    waypoints = reader.attributes()["waypoints"][:, 1:]
+
+    floor_dir = metadata_path / building / floor
+    width_meter, height_meter = load_floor_size(floor_dir / "floor_info.json")
+    estimate = estimate[lttb(estimate, max_points)]
+    title = f"{building} / {floor} / {trace} ({states_field.replace('_', ' ')})"
+
+    output_file = output_dir / building / floor / f"{trace}.{image_format}"
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+
+    if image_format == "html":
+        fig = visualize_trajectory(
+            trajectory=waypoints,
+            estimated_way=estimate,
+            floor_plan_filename=floor_dir / "floor_image.png",
+            width_meter=width_meter,
+            height_meter=height_meter,
+            title=title,
+        )
+        fig.write_html(str(output_file), include_plotlyjs="cdn", auto_open=False)
+    else:
+        save_trajectory_image(
+            waypoints,
+            estimate,
+            floor_dir / "floor_image.png",
+            width_meter,
+            height_meter,
+            output_file,
+            title=title,
+        )
+
+    return output_file
+
+
+def _render_trace_job(job: tuple) -> Tuple[Tuple[str, str, str], Optional[Path], str]:
+
+    """
+    Process pool job to render one trace, errors are returned instead of raised so that one
+    broken result does not stop the report.
+
+    :param job: Arguments of render_trace
+    :return: Result, report file (None on error) and error message
+    """
+
+    try:
+        return job[0], render_trace(*job), ""
+    except Exception as error:
+        return job[0], None, repr(error)
+
+
+def render_report(
+    building: str = "*",
+    floor: str = "*",
+    output_dir: Path = RESULTS_PATH / "reports",
+    image_format: str = "html",
+    max_points: int = MAX_PLOT_POINTS,
+    workers: Optional[int] = None,
+    results_path: Path = RESULTS_PATH,
+    metadata_path: Path = METADATA_PATH,
+) -> List[Path]:
+
+    """
+    Function to render every trace of the result store matching the building and floor glob
+    patterns in a process pool. Traces are ordered by building and floor and handed out in
+    chunks, so consecutive traces of a worker mostly share the cached floor plan. Nothing is
+    shown or opened in a browser.
+
+    :param building: Building glob pattern
+    :param floor: Floor glob pattern
+    :param output_dir: Report directory
+    :param image_format: "html" or an image format matplotlib can write
+    :param max_points: Estimated trajectories are decimated to this many points with lttb
+    :param workers: Number of worker processes, defaults to the number of cores
+    :param results_path: Result store directory
+    :param metadata_path: Directory with building / floor / floor metadata layout
+    :return: Written report files
+    """
+
+    results = list_results(results_path, building, floor)
+    jobs = [
+        (result, output_dir, image_format, max_points, results_path, metadata_path)
+        for result in results
+    ]
+    chunksize = max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1)))
+    report_files = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for result, report_file, error in executor.map(
+            _render_trace_job, jobs, chunksize=chunksize
+        ):
+            if report_file is None:
+                print(f"{'/'.join(result)} failed: {error}", file=sys.stderr)
+            else:
+                report_files.append(report_file)
+
+    return report_files
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-b", "--building", help="Building glob pattern", default="*")
+    parser.add_argument("-f", "--floor", help="Floor glob pattern", default="*")
+    parser.add_argument(
+        "-o", "--output", help="Report directory", type=Path, default=RESULTS_PATH / "reports"
+    )
+    parser.add_argument(
+        "--format", help="html, or an image format such as png or svg", default="html"
+    )
+    parser.add_argument(
+        "--max-points",
+        help="Decimate estimated trajectories to this many points",
+        type=int,
+        default=MAX_PLOT_POINTS,
+    )
+    parser.add_argument(
+        "-w", "--workers", help="Number of worker processes", type=int, default=os.cpu_count()
+    )
+    args = parser.parse_args()
+
+    written = render_report(
+        args.building, args.floor, args.output, args.format, args.max_points, args.workers
+    )
+    print(f"Wrote {len(written)} reports to {args.output}")
@@ -0,0 +1,280 @@
+import argparse
+import os
+import sys
+import zlib
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from run_ukf import perform_ukf
+from run_ukf_dataset import find_traces
+from src.util.parameters import Params
+from src.util.definitions import (
+    TEST_PATH,
+    FINGERPRINT_PATH,
+    SAMPLE_SUBMISSION_PATH,
+    SUBMISSION_PATH,
+    CHECKPOINT_PATH,
+)
+from src.scripts.get_required_data import get_data
+from src.scripts.evaluation import interpolate_positions
+from src.scripts.hyperparameter_sweep import parameters_digest
+from src.scripts.submission import (
+    SubmissionWriter,
+    check_checkpoint_setup,
+    floor_number,
+    read_checkpoint,
+    read_sample_submission,
+    submission_rows,
+    write_checkpoint,
+)
+from src.model.unscented_kalman import fix_measurements
+from src.model.rts_smoother import rts_smoother_from_predictions, smoothing_message
+from src.model.wifi_fingerprint import locate_position_fixes
+
+
+def infer_trace(
+    filepath: Path,
+    building: str,
+    timestamps: np.ndarray,
+    parameters: Params,
+    rng: Optional[np.random.Generator] = None,
+    smooth: bool = False,
+    fingerprint_root: Path = FINGERPRINT_PATH,
+) -> Tuple[str, np.ndarray]:
+
+    """
+    Function to predict the floor and the positions of a test trace at requested timestamps.
+    Test traces have no waypoints, so the floor is located from the Wi-Fi scans and the Wi-Fi
+    fingerprint position fixes of that floor take the place of the waypoints as position
+    measurements of the filter.
+
+    :param filepath: Trace file
+    :param building: Building of the trace
+    :param timestamps: Requested timestamps (ms)
+    :param parameters: Initial system states, noise matrices and sigma point parameters
+    :param rng: Random generator of the fx and hx noise, an unseeded one if None
+    :param smooth: If true, positions are predicted from RTS smoothed states
+    :param fingerprint_root: Fingerprint index directory
+    :return: Floor and predicted positions (x, y) at the requested timestamps
+    """
+
+    acc, gyro, wifi, _ = get_data(filepath, wifi=True)
+    floor, position_fixes = locate_position_fixes(building, wifi, fingerprint_root)
+
+    data = fix_measurements(acc, gyro, position_fixes)
+    estimated_mu, estimated_cov, *predictions = perform_ukf(
+        data[:, 1:],
+        data[:, 0],
+        parameters.initial_mu_,
+        parameters.initial_covariance_,
+        parameters.R_,
+        parameters.process_noise,
+        record_predictions=smooth,
+        rng=rng,
+        alpha=parameters.alpha,
+        beta=parameters.beta,
+        kappa=parameters.kappa,
+    )
+    if smooth:
+        estimated_mu, _, smoothed_fraction = rts_smoother_from_predictions(
+            estimated_mu, estimated_cov, *predictions
+        )
+        message = smoothing_message(smoothed_fraction)
+        if message is not None:
+            print(f"{filepath.stem}: {message}", file=sys.stderr)
+
+    positions = interpolate_positions(
+        acc[:, 0].astype(float),
+        estimated_mu[:, :2],
+        np.array([0, len(acc)]),
+        timestamps.astype(float),
+        np.array([0, len(timestamps)]),
+    )
+    if not np.all(np.isfinite(positions)):
+        raise ValueError("Filter estimates are not finite")
+
+    return floor, positions
+
+
+def _infer_job(job: tuple) -> List[str]:
+
+    """
+    Process pool job to run one test trace and save its submission rows to its checkpoint
+    before they are returned, so a finished trace is never run again.
+
+    :param job: Trace file, building, trace, requested timestamps, parameters, smoothing flag,
+    checkpoint directory and fingerprint index directory
+    :return: Submission rows of the trace
+    """
+
+    filepath, building, trace, timestamps, parameters, smooth, checkpoint_dir, index_root = job
+
+    floor, positions = infer_trace(
+        filepath,
+        building,
+        timestamps,
+        parameters,
+        rng=parameters.generator(zlib.crc32(trace.encode())),
+        smooth=smooth,
+        fingerprint_root=index_root,
+    )
+    rows = submission_rows(building, trace, timestamps, floor_number(floor), positions)
+    write_checkpoint(checkpoint_dir, trace, rows)
+
+    return rows
+
+
+def run_inference(
+    sample_submission: Path,
+    output: Path,
+    checkpoint_dir: Path,
+    parameters: Params,
+    test_root: Path = TEST_PATH,
+    smooth: bool = False,
+    workers: Optional[int] = None,
+    fingerprint_root: Path = FINGERPRINT_PATH,
+    refresh: bool = False,
+) -> List[str]:
+
+    """
+    Function to write a submission for every trace of a sample submission. Traces with a
+    checkpoint from an earlier run are copied into the submission first, the others run in a
+    process pool, longest first, and their rows are streamed into the submission as they
+    finish. Rows are in the order traces finish, not in the order of the sample submission.
+    A trace which fails is reported and gets the rows of the sample submission, without a
+    checkpoint, so it is run again on the next run. Checkpoints are only resumed by runs with
+    the same parameters and smoothing flag.
+
+    :param sample_submission: Sample submission CSV with the requested timestamps
+    :param output: Submission CSV
+    :param checkpoint_dir: Checkpoint directory, one file per finished trace
+    :param parameters: Initial system states, noise matrices, sigma point parameters and seed,
+    shared by all traces
+    :param test_root: Test data directory
+    :param smooth: If true, positions are predicted from RTS smoothed states
+    :param workers: Number of worker processes, defaults to the number of cores
+    :param fingerprint_root: Fingerprint index directory
+    :param refresh: If true, the dataset catalog is refreshed before the traces are looked up
+    :return: List of traces which failed
+    :raises ValueError: If the checkpoints were written with other parameters or smoothing
+    """
+
+    check_checkpoint_setup(
+        checkpoint_dir, {"parameters": parameters_digest(parameters), "smooth": str(smooth)}
+    )
+
+    requests = read_sample_submission(sample_submission)
+    trace_files = {path.stem: path for path in find_traces(test_root, refresh=refresh)}
+    failed = []
+
+    with SubmissionWriter(output) as writer:
+        jobs, resumed = [], 0
+        for (building, trace), (timestamps, _) in requests.items():
+            rows = read_checkpoint(checkpoint_dir, trace)
+            if rows is not None:
+                writer.write(rows)
+                resumed += 1
+            elif trace in trace_files:
+                jobs.append(
+                    (
+                        trace_files[trace],
+                        building,
+                        trace,
+                        timestamps,
+                        parameters,
+                        smooth,
+                        checkpoint_dir,
+                        fingerprint_root,
+                    )
+                )
+            else:
+                failed.append(trace)
+                writer.write(requests[building, trace][1])
+                print(f"Missing {trace}, sample rows written", file=sys.stderr)
+
+        print(f"{resumed} of {len(requests)} traces resumed from checkpoints", file=sys.stderr)
+
+        # Largest trace files first keeps all workers busy until the end
+        jobs.sort(key=lambda job: os.stat(job[0]).st_size, reverse=True)
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_infer_job, job): job for job in jobs}
+
+            for done, future in enumerate(as_completed(futures), 1):
+                _, building, trace, *_ = futures[future]
+                try:
+                    rows = future.result()
+                except Exception as error:
+                    failed.append(trace)
+                    rows = requests[building, trace][1]
+                    print(f"[{done}/{len(jobs)}] Failed {trace}: {error!r}", file=sys.stderr)
+                else:
+                    print(f"[{done}/{len(jobs)}] Done {trace}", file=sys.stderr)
+                writer.write(rows)
+
+    return failed
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i",
+        "--sample-submission",
+        help="Sample submission with the requested timestamps",
+        type=Path,
+        default=SAMPLE_SUBMISSION_PATH,
+    )
+    parser.add_argument("-o", "--output", help="Submission CSV", type=Path, default=SUBMISSION_PATH)
+    parser.add_argument(
+        "-c",
+        "--checkpoints",
+        help="Checkpoint directory, rerun with it to resume",
+        type=Path,
+        default=CHECKPOINT_PATH,
+    )
+    parser.add_argument(
+        "-w", "--workers", help="Number of worker processes", type=int, default=os.cpu_count()
+    )
+    parser.add_argument("-s", "--smooth", help="RTS smooth results", action="store_true")
+    parser.add_argument(
+        "-r", "--refresh", help="Rescan the dataset for new or changed traces", action="store_true"
+    )
+    parser.add_argument(
+        "--seed", help="Seed of the noise matrices and filter noise", type=int, default=0
+    )
+    parser.add_argument(
+        "-p",
+        "--params",
+        help="Parameter file (.npz, .json or .yaml), created from --seed if it does not exist",
+        type=Path,
+    )
+    args = parser.parse_args()
+
+    if not args.sample_submission.exists():
+        sys.exit(f"No sample submission at {args.sample_submission}")
+
+    if args.params is not None:
+        parameters = Params.load_or_create(args.params, args.seed)
+    else:
+        parameters = Params(seed=args.seed)
+
+    try:
+        failed_traces = run_inference(
+            args.sample_submission,
+            args.output,
+            args.checkpoints,
+            parameters,
+            smooth=args.smooth,
+            workers=args.workers,
+            refresh=args.refresh,
+        )
+    except ValueError as error:
+        sys.exit(str(error))
+    print("Submission saved to", args.output)
+
+    if failed_traces:
+        sys.exit(f"{len(failed_traces)} traces failed and got the sample submission rows")
@@ -0,0 +1,107 @@
+import argparse
+import os
+import sys
+
+from pathlib import Path
+
+from run_ukf_dataset import find_traces
+from src.util.definitions import SWEEP_PATH, TRAIN_PATH
+from src.util.parameters import Params
+from src.scripts.hyperparameter_sweep import SweepTable, grid_configs, random_configs, run_sweep
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-b", "--building", help="Building glob pattern", default="*")
+    parser.add_argument("-f", "--floor", help="Floor glob pattern", default="*")
+    parser.add_argument("-n", "--name", help="Sweep name, rerun with it to resume", default="sweep")
+    parser.add_argument(
+        "-r",
+        "--random",
+        help="Random search with this many configurations instead of a grid search",
+        type=int,
+    )
+    parser.add_argument("--alpha", help="Grid values of alpha", type=float, nargs="+")
+    parser.add_argument("--beta", help="Grid values of beta", type=float, nargs="+")
+    parser.add_argument("--kappa", help="Grid values of kappa", type=float, nargs="+")
+    parser.add_argument("--q-scale", help="Grid values of the Q scale", type=float, nargs="+")
+    parser.add_argument("--r-scale", help="Grid values of the R scale", type=float, nargs="+")
+    parser.add_argument(
+        "--min-traces",
+        help="Traces to run before a configuration can be stopped",
+        type=int,
+        default=3,
+    )
+    parser.add_argument(
+        "--margin",
+        help="Stop configurations this much (relative) worse than the best one",
+        type=float,
+        default=0.5,
+    )
+    parser.add_argument(
+        "-w", "--workers", help="Number of worker processes", type=int, default=os.cpu_count()
+    )
+    parser.add_argument(
+        "--seed", help="Seed of the noise matrices, filter noise and search", type=int, default=0
+    )
+    parser.add_argument(
+        "-p",
+        "--params",
+        help="Base parameter file (.npz, .json or .yaml), created from --seed if it does not exist",
+        type=Path,
+    )
+    parser.add_argument(
+        "--best-params", help="Save parameters of the best configuration here", type=Path
+    )
+    args = parser.parse_args()
+
+    if args.params is not None:
+        parameters = Params.load_or_create(args.params, args.seed)
+    else:
+        parameters = Params(seed=args.seed)
+
+    if args.random is not None:
+        configs = random_configs(args.random, args.seed)
+    else:
+        grid = {
+            name: values
+            for name, values in (
+                ("alpha", args.alpha),
+                ("beta", args.beta),
+                ("kappa", args.kappa),
+                ("q_scale", args.q_scale),
+                ("r_scale", args.r_scale),
+            )
+            if values
+        }
+        configs = grid_configs(**grid)
+
+    trace_files = find_traces(TRAIN_PATH, args.building, args.floor)
+    if not trace_files:
+        sys.exit("No traces found")
+
+    sweep_dir = SWEEP_PATH / args.name
+    try:
+        best = run_sweep(
+            configs,
+            trace_files,
+            parameters,
+            sweep_dir,
+            workers=args.workers,
+            min_traces=args.min_traces,
+            margin=args.margin,
+        )
+    except ValueError as error:
+        sys.exit(str(error))
+
+    with SweepTable(sweep_dir / "results.sqlite") as table:
+        for result in table.results(limit=10):
+            status = "" if result.complete else " (stopped)"
+            print(f"{result.score:10.3f}  {result.config}{status}")
+
+    if best is None:
+        sys.exit("No configuration ran every trace")
+
+    if args.best_params is not None:
+        best.config.apply(parameters).save(args.best_params)
+        print("Parameters of the best configuration saved to", args.best_params)
@@ -7,9 +7,16 @@ from src.scripts.get_required_data import *
 from src.util.definitions import *
 from src.model.state_transition_functions import *
 from src.model.unscented_kalman import *
+from src.model.unscented_filter import UnscentedFilter
+from src.util.metrics import FilterObserver, NULL_OBSERVER, MetricsObserver, PrintObserver
+from src.util.metrics import CompositeObserver
 from src.model.measurement_functions import *
-from src.model.rts_smoother import rts_smoother
-from src.visualization.result_visualization import *
+from src.model.rts_smoother import rts_smoother_from_predictions, smoothing_message
+from src.model.fixed_lag_smoother import FixedLagSmoother
+from src.model.measurement_scheduler import perform_scheduled_ukf
+from src.model.square_root_unscented_kalman import check_sigma_weights
+from src.scripts.result_store import ResultWriter
+from src.scripts.evaluation import waypoint_errors
 
 
 def get_data_for_ukf(
@@ -46,7 +53,14 @@ def perform_ukf(
     initial_covariance: np.ndarray,
     R: np.ndarray,
     Q: np.ndarray,
-) -> Tuple[np.ndarray, np.ndarray]:
+    observer: FilterObserver = NULL_OBSERVER,
+    square_root: bool = False,
+    record_predictions: bool = False,
+    rng: Optional[np.random.Generator] = None,
+    alpha: float = 0.3,
+    beta: float = 2.0,
+    kappa: float = -5,
+) -> Tuple[np.ndarray, ...]:
 
     """
     Function to run UKF
@@ -57,38 +71,39 @@ def perform_ukf(
     :param initial_covariance: Initial covariance
     :param R: Measurement covariance matrix
     :param Q: Process noise matrix
+    :param observer: Observer to report to, use PrintObserver to print every step
+    :param square_root: If true, run the square root UKF
+    :param record_predictions: If true, predicted states, predicted covariances and cross
+    covariances are returned as well, see rts_smoother_from_predictions
+    :param rng: Random generator of the fx and hx noise, an unseeded one if None
+    :param alpha: Parameter to decide the spread of sigma points
+    :param beta: Parameter to incorporate prior knowledge of the distribution of state
+    :param kappa: Secondary scaling parameter of the sigma points
     :return: Array of estimated states and covariance
     """
 
-    new_state = []
-    new_covariance = []
+    ukf = UnscentedFilter(
+        initial_mu,
+        initial_covariance,
+        R,
+        Q,
+        alpha=alpha,
+        beta=beta,
+        kappa=kappa,
+        record_history=True,
+        observer=observer,
+        square_root=square_root,
+        record_predictions=record_predictions,
+        rng=rng,
+    )
 
     for i, measure in enumerate(measurements):
+        ukf.step(measure, dt[i])
 
-        if i == 0:  # Initial state belief
-            mu = initial_mu
-            cov = initial_covariance
-        else:
-            mu = new_state[-1]
-            cov = new_covariance[-1]
-
-        wm, wc, lambda_ = compute_sigma_weights(0.3, 2.0)
-        sigmas = compute_sigmas(lambda_, mu, cov)
-
-        # PREDICT STEP
-        ukf_mean, ukf_cov, sigmas_f = perform_ut(sigmas, dt[i], fx, wm, wc, Q, True)
-        # UPDATE STEP
-        estimated_state, estimated_covariance = update(
-            ukf_mean, ukf_cov, sigmas_f, dt[i], measure, hx, wm, wc, R
-        )
-
-        print("Measurement: ", "(", measure[0], measure[1], ")")
-        print("predictions: ", "(", estimated_state[0], estimated_state[1], ")")
-
-        new_state.append(estimated_state)
-        new_covariance.append(estimated_covariance)
+    if record_predictions:
+        return ukf.history() + ukf.predictions()
 
-    return np.array(new_state), np.array(new_covariance)
+    return ukf.history()
 
 
 if __name__ == "__main__":
@@ -103,60 +118,229 @@ if __name__ == "__main__":
     parser.add_argument("-f", "--floor", help="Any floor of the selected building", default="B1")
     parser.add_argument("-t", "--trace", help="Trace file", default="5e158ee91506f2000638fd17.txt")
     parser.add_argument("-s", "--smooth", help="RTS smooth results", default="False")
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        help="Print measurement and prediction of every step",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-m", "--metrics", help="Print timing and filter metrics summary", action="store_true"
+    )
+    parser.add_argument(
+        "--square-root", help="Run the square root UKF and smoother", action="store_true"
+    )
+    parser.add_argument(
+        "-l", "--lag", help="Fixed-lag smooth with this lag (samples) instead of RTS", type=int
+    )
+    parser.add_argument(
+        "--save", help="Save states and covariances to the result store", action="store_true"
+    )
+    parser.add_argument(
+        "-e",
+        "--event-driven",
+        help="Only use positions at waypoints (and --update-rate), IMU updates in between",
+        action="store_true",
+    )
+    parser.add_argument("--update-rate", help="Event-driven position fixes per second", type=float)
+    parser.add_argument(
+        "--decimate", help="Event-driven: keep every n-th IMU sample", type=int, default=1
+    )
+    parser.add_argument(
+        "-w",
+        "--wifi",
+        help="Use Wi-Fi fingerprint position fixes instead of waypoints as position measurements",
+        action="store_true",
+    )
+    parser.add_argument("--seed", help="Seed of the noise matrices and filter noise", type=int)
+    parser.add_argument(
+        "-p",
+        "--params",
+        help="Parameter file (.npz, .json or .yaml), created from --seed if it does not exist",
+        type=Path,
+    )
+    parser.add_argument(
+        "--no-plot", help="Do not plot, skips loading the plotting libraries", action="store_true"
+    )
     args = parser.parse_args()
     building = args.building
     floor = args.floor
     trace = args.trace
-    smooth = args.smooth
+    smooth = args.smooth in ("True", "true")
+
+    metrics = MetricsObserver()
+    observers = [metrics] if args.metrics else []
+    if args.verbose:
+        observers.append(PrintObserver())
+    observer = CompositeObserver(observers) if observers else NULL_OBSERVER
 
     if not (TRAIN_PATH / building / floor / trace).exists():
         sys.exit("Path does not exist")
 
     filepath = TRAIN_PATH / building / floor / trace
-    parameters = Params()
+    json_floor_file = METADATA_PATH / building / floor / "floor_info.json"
+    floor_plan_file = METADATA_PATH / building / floor / "floor_image.png"
+    if args.params is not None:
+        parameters = Params.load_or_create(args.params, args.seed)
+    else:
+        parameters = Params(seed=args.seed)
+    if args.square_root:
+        # compute_sigma_weights returns the covariance weights first, but every filter unpacks
+        # them as wm, wc and builds its covariances from the second array, so that is checked
+        _, wc, _ = compute_sigma_weights(parameters.alpha, parameters.beta, kappa=parameters.kappa)
+        try:
+            check_sigma_weights(wc)
+        except ValueError as error:
+            sys.exit(str(error))
+    rng = parameters.generator()
     initial_state = parameters.initial_mu_
     initial_state_covariance = parameters.initial_covariance_
     measurement_covariance = parameters.R_
     process_noise = parameters.process_noise
 
-    acc, gyro, way = get_data(filepath)
+    acc, gyro, wifi, way = get_data(filepath, wifi=True)
+    position_fixes = way
+
+    if args.wifi:
+        from src.model.wifi_fingerprint import FingerprintIndex
+
+        fingerprint_index = FingerprintIndex.load(building, floor)
+        if fingerprint_index is None:
+            sys.exit("No fingerprint index for this floor, run src.scripts.build_fingerprint_index")
+        position_fixes = fingerprint_index.query(wifi)
+        if not len(position_fixes):
+            sys.exit("No Wi-Fi scan of this trace matches the fingerprint index")
 
     (
         width_meter_floor,
         height_meter_floor,
         sensor_timestep,
         sensor_measurements,
-    ) = get_data_for_ukf(acc, gyro, way, example_json_plan[0])
+    ) = get_data_for_ukf(acc, gyro, position_fixes, json_floor_file)
+
+    if args.lag is not None:
+        fixed_lag_smoother = FixedLagSmoother(
+            args.lag,
+            initial_state,
+            initial_state_covariance,
+            measurement_covariance,
+            process_noise,
+            observer=observer,
+            square_root=args.square_root,
+            rng=rng,
+            alpha=parameters.alpha,
+            beta=parameters.beta,
+            kappa=parameters.kappa,
+        )
+        samples = zip(sensor_measurements, sensor_timestep)
+        smoothed_states, smoothed_cov = map(np.array, zip(*fixed_lag_smoother.filter(samples)))
+        smoothed_fraction = fixed_lag_smoother.smoothed_fraction
+
+        # States of which not a single step was smoothed are the filtered states
+        if smoothed_fraction > 0:
+            results = dict(smoothed_states=smoothed_states, smoothed_covariances=smoothed_cov)
+            title = f"Fixed-lag smoothed states (lag {args.lag})"
+        else:
+            results = dict(states=smoothed_states, covariances=smoothed_cov)
+            title = "Waypoint state estimates (not smoothed)"
+
+        estimate = np.column_stack((smoothed_states[:, 0], smoothed_states[:, 1]))
+
+    elif args.event_driven:
+        estimated_mu, estimated_cov, *smoothing = perform_scheduled_ukf(
+            sensor_measurements,
+            sensor_timestep,
+            acc[:, 0],
+            position_fixes[:, 0],
+            initial_state,
+            initial_state_covariance,
+            measurement_covariance,
+            process_noise,
+            update_rate=args.update_rate,
+            decimation=args.decimate,
+            smooth=smooth,
+            observer=observer,
+            square_root=args.square_root,
+            rng=rng,
+            alpha=parameters.alpha,
+            beta=parameters.beta,
+            kappa=parameters.kappa,
+        )
+        smoothed_fraction = smoothing[0] if smooth else 1.0
+        smoothed = smooth and smoothed_fraction > 0
+        prefix = "smoothed_" if smoothed else ""
+        results = {f"{prefix}states": estimated_mu, f"{prefix}covariances": estimated_cov}
 
-    estimated_mu, estimated_cov = perform_ukf(
-        sensor_measurements,
-        sensor_timestep,
-        initial_state,
-        initial_state_covariance,
-        measurement_covariance,
-        process_noise,
-    )
+        estimate = np.column_stack((estimated_mu[:, 0], estimated_mu[:, 1]))
+        title = "Event-driven " + ("RTS smoothed states" if smoothed else "state estimates")
+        if smooth and not smoothed:
+            title += " (not smoothed)"
 
-    if smooth == "True" or smooth == "true":
-        smoothed_states, smoothed_cov = rts_smoother(
-            estimated_mu, estimated_cov, process_noise, sensor_timestep
+    else:
+        estimated_mu, estimated_cov, *predictions = perform_ukf(
+            sensor_measurements,
+            sensor_timestep,
+            initial_state,
+            initial_state_covariance,
+            measurement_covariance,
+            process_noise,
+            observer=observer,
+            square_root=args.square_root,
+            record_predictions=smooth,
+            rng=rng,
+            alpha=parameters.alpha,
+            beta=parameters.beta,
+            kappa=parameters.kappa,
         )
-        smoothed_statesx = smoothed_states[:, 0]
-        smoothed_statesy = smoothed_states[:, 1]
+        results = dict(states=estimated_mu, covariances=estimated_cov)
+        smoothed_fraction = 1.0
 
-        estimate = np.column_stack((smoothed_statesx, smoothed_statesy))
-        title = "RTS smoothed states"
+        if smooth:
+            smoothed_states, smoothed_cov, smoothed_fraction = rts_smoother_from_predictions(
+                estimated_mu, estimated_cov, *predictions, observer=observer
+            )
 
-    else:
-        estimate = np.column_stack((estimated_mu[:, 0], estimated_mu[:, 1]))
-        title = "Waypoint state estimates"
-
-    visualize_trajectory(
-        trajectory=way[:, 1:],
-        estimated_way=estimate[50::200, :],
-        floor_plan_filename=example_floor_plan[0],
-        width_meter=width_meter_floor,
-        height_meter=height_meter_floor,
-        show=True,
-        title=title,
-    )
+        if smooth and smoothed_fraction > 0:
+            results.update(smoothed_states=smoothed_states, smoothed_covariances=smoothed_cov)
+            smoothed_statesx = smoothed_states[:, 0]
+            smoothed_statesy = smoothed_states[:, 1]
+
+            estimate = np.column_stack((smoothed_statesx, smoothed_statesy))
+            title = "RTS smoothed states"
+
+        else:
+            estimate = np.column_stack((estimated_mu[:, 0], estimated_mu[:, 1]))
+            title = "Waypoint state estimates" + (" (not smoothed)" if smooth else "")
+
+    message = smoothing_message(smoothed_fraction)
+    if message is not None:
+        print(message, file=sys.stderr)
+
+    if args.metrics:
+        print(metrics.summary())
+
+    if len(way):
+        errors = waypoint_errors(estimate, acc[:, 0], way)
+        print(f"Mean position error at the waypoints: {errors.mean():.3f} m")
+
+    if args.save:
+        with ResultWriter(building, floor, filepath.stem) as writer:
+            writer.write_attributes(
+                waypoints=way, floor_size=np.array([width_meter_floor, height_meter_floor])
+            )
+            writer.append(acc[:, 0], timesteps=sensor_timestep, **results)
+        print("Results saved to", writer.directory)
+
+    if not args.no_plot:
+        # Imported here, loading matplotlib, plotly and pandas takes longer than a short run
+        from src.visualization.result_visualization import lttb, visualize_trajectory
+
+        visualize_trajectory(
+            trajectory=way[:, 1:],
+            estimated_way=estimate[lttb(estimate)],
+            floor_plan_filename=floor_plan_file,
+            width_meter=width_meter_floor,
+            height_meter=height_meter_floor,
+            show=True,
+            title=title,
+        )
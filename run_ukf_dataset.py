@@ -0,0 +1,417 @@
+import argparse
+import os
+import sys
+import zlib
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from run_ukf import get_data_for_ukf, perform_ukf
+from src.util.parameters import Params
+from src.util.definitions import TRAIN_PATH, TEST_PATH, METADATA_PATH, RESULTS_PATH
+from src.scripts.get_required_data import get_data
+from src.scripts.dataset_catalog import DatasetCatalog
+from src.model.rts_smoother import rts_smoother_from_predictions, smoothing_message
+from src.model.unscented_filter import UnscentedFilter
+from src.model.batch_unscented_kalman import perform_ukf_batch
+from src.model.wifi_fingerprint import locate_position_fixes
+from src.scripts.result_store import ResultWriter
+
+
+def find_traces(
+    root: Path, building: str = "*", floor: str = "*", refresh: bool = False
+) -> List[Path]:
+
+    """
+    Function to find trace files by building and floor glob patterns in the dataset catalog.
+    Traces are sorted by file size, largest first, so that the longest traces are scheduled
+    first.
+
+    :param root: Data directory with building / floor / trace layout (TRAIN_PATH or TEST_PATH)
+    :param building: Building glob pattern
+    :param floor: Floor glob pattern
+    :param refresh: If true, the catalog is refreshed before the lookup
+    :return: List of trace files
+    """
+
+    with DatasetCatalog() as catalog:
+        if refresh:
+            catalog.refresh(root)
+
+        return catalog.traces(root, building, floor)
+
+
+def trace_location(filepath: Path) -> Tuple[str, str]:
+
+    """
+    Function to get the building and floor of a trace from its catalog entry. Test traces are
+    stored flat, their building comes from the site id in their header and their floor is "".
+    Traces which are not catalogued fall back to the building / floor / trace layout.
+
+    :param filepath: Trace file
+    :return: Building and floor ("" if not known)
+    """
+
+    with DatasetCatalog() as catalog:
+        info = catalog.trace_info(filepath)
+
+    if info is None:
+        return filepath.parent.parent.name, filepath.parent.name
+
+    return info["building"], info["floor"]
+
+
+def load_trace(
+    filepath: Path,
+) -> Tuple[str, str, np.ndarray, np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+
+    """
+    Function to read a trace and prepare the filter input. Traces without a floor (test traces)
+    have no waypoints, their floor is located from their Wi-Fi scans and the Wi-Fi position
+    fixes of that floor are the position measurements instead (see locate_position_fixes).
+
+    :param filepath: Trace file
+    :return: Building, floor, timestamps, timesteps, measurements and the attributes stored with
+    the results (waypoints, position fixes of test traces and floor size)
+    """
+
+    building, floor = trace_location(filepath)
+
+    acc, gyro, wifi, way = get_data(filepath, wifi=True)
+    position_fixes = way
+    attributes = dict(waypoints=way)
+
+    if not floor:
+        floor, position_fixes = locate_position_fixes(building, wifi)
+        attributes["position_fixes"] = position_fixes
+
+    json_floor_file = METADATA_PATH / building / floor / "floor_info.json"
+    width_meter, height_meter, timestep, measurements = get_data_for_ukf(
+        acc, gyro, position_fixes, json_floor_file
+    )
+    attributes["floor_size"] = np.array([width_meter, height_meter])
+
+    return building, floor, acc[:, 0], timestep, measurements, attributes
+
+
+def process_trace(
+    filepath: Path,
+    output_dir: Path,
+    initial_mu: np.ndarray,
+    initial_covariance: np.ndarray,
+    R: np.ndarray,
+    Q: np.ndarray,
+    smooth: bool = False,
+    compact_covariances: bool = False,
+    rng: Optional[np.random.Generator] = None,
+    alpha: float = 0.3,
+    beta: float = 2.0,
+    kappa: float = -5,
+) -> Path:
+
+    """
+    Function to run the whole pipeline on one trace and save the results to the result store
+    under output_dir / building / floor / trace (see ResultWriter). Without smoothing the
+    estimates are streamed to the store a chunk at a time as they are computed.
+
+    :param filepath: Trace file
+    :param output_dir: Output directory
+    :param initial_mu: Initial state of the system
+    :param initial_covariance: Initial covariance
+    :param R: Measurement covariance matrix
+    :param Q: Process noise matrix
+    :param smooth: If true, results are also RTS smoothed, unless no step can be smoothed (see
+    smoothing_message)
+    :param compact_covariances: If true, covariances are stored as upper-triangle float32
+    :param rng: Random generator of the fx and hx noise, an unseeded one if None
+    :param alpha: Parameter to decide the spread of sigma points
+    :param beta: Parameter to incorporate prior knowledge of the distribution of state
+    :param kappa: Secondary scaling parameter of the sigma points
+    :return: Result directory of the trace
+    """
+
+    building, floor, timestamps, timestep, measurements, attributes = load_trace(filepath)
+
+    with ResultWriter(
+        building, floor, filepath.stem, output_dir, compact_covariances=compact_covariances
+    ) as writer:
+        writer.write_attributes(**attributes)
+
+        if smooth:
+            estimated_mu, estimated_cov, *predictions = perform_ukf(
+                measurements,
+                timestep,
+                initial_mu,
+                initial_covariance,
+                R,
+                Q,
+                record_predictions=True,
+                rng=rng,
+                alpha=alpha,
+                beta=beta,
+                kappa=kappa,
+            )
+            smoothed_states, smoothed_cov, smoothed_fraction = rts_smoother_from_predictions(
+                estimated_mu, estimated_cov, *predictions
+            )
+            message = smoothing_message(smoothed_fraction)
+            if message is not None:
+                print(f"{filepath.stem}: {message}", file=sys.stderr)
+
+            # States of which not a single step was smoothed are only stored as filtered states
+            smoothed = (
+                dict(smoothed_states=smoothed_states, smoothed_covariances=smoothed_cov)
+                if smoothed_fraction > 0
+                else {}
+            )
+            writer.append(
+                timestamps,
+                timesteps=timestep,
+                states=estimated_mu,
+                covariances=estimated_cov,
+                **smoothed,
+            )
+        else:
+            ukf = UnscentedFilter(
+                initial_mu,
+                initial_covariance,
+                R,
+                Q,
+                alpha=alpha,
+                beta=beta,
+                kappa=kappa,
+                rng=rng,
+            )
+            # Estimates are buffered and appended a chunk at a time, which keeps memory constant
+            n = len(initial_mu)
+            states = np.empty((writer.chunk_size, n))
+            covariances = np.empty((writer.chunk_size, n, n))
+
+            for start in range(0, len(measurements), writer.chunk_size):
+                stop = min(start + writer.chunk_size, len(measurements))
+                for i in range(start, stop):
+                    states[i - start], covariances[i - start] = ukf.step(
+                        measurements[i], timestep[i]
+                    )
+                writer.append(
+                    timestamps[start:stop],
+                    timesteps=timestep[start:stop],
+                    states=states[: stop - start],
+                    covariances=covariances[: stop - start],
+                )
+
+    return writer.directory
+
+
+def process_trace_batch(
+    filepaths: List[Path],
+    output_dir: Path,
+    initial_mu: np.ndarray,
+    initial_covariance: np.ndarray,
+    R: np.ndarray,
+    Q: np.ndarray,
+    compact_covariances: bool = False,
+    rngs: Optional[List[np.random.Generator]] = None,
+    alpha: float = 0.3,
+    beta: float = 2.0,
+    kappa: float = -5,
+) -> List[Path]:
+
+    """
+    Function to filter several traces together with the batched engine (see perform_ukf_batch)
+    and save the results of every trace as process_trace does without smoothing. A batch steps
+    as long as its longest trace, so pass traces of similar length.
+
+    :param filepaths: Trace files
+    :param output_dir: Output directory
+    :param initial_mu: Initial state of the system
+    :param initial_covariance: Initial covariance
+    :param R: Measurement covariance matrix
+    :param Q: Process noise matrix
+    :param compact_covariances: If true, covariances are stored as upper-triangle float32
+    :param rngs: Random generators of the fx and hx noise, one per trace, unseeded ones if None
+    :param alpha: Parameter to decide the spread of sigma points
+    :param beta: Parameter to incorporate prior knowledge of the distribution of state
+    :param kappa: Secondary scaling parameter of the sigma points
+    :return: Result directories of the traces
+    """
+
+    traces = [load_trace(filepath) for filepath in filepaths]
+    if rngs is None:
+        rngs = [np.random.default_rng() for _ in filepaths]
+
+    states, covariances = perform_ukf_batch(
+        [trace[4] for trace in traces],
+        [trace[3] for trace in traces],
+        initial_mu,
+        initial_covariance,
+        R,
+        Q,
+        rng=rngs,
+        alpha=alpha,
+        beta=beta,
+        kappa=kappa,
+    )
+
+    directories = []
+    for filepath, trace, state, covariance in zip(filepaths, traces, states, covariances):
+        building, floor, timestamps, timestep, _, attributes = trace
+        with ResultWriter(
+            building, floor, filepath.stem, output_dir, compact_covariances=compact_covariances
+        ) as writer:
+            writer.write_attributes(**attributes)
+            writer.append(timestamps, timesteps=timestep, states=state, covariances=covariance)
+        directories.append(writer.directory)
+
+    return directories
+
+
+def run_dataset(
+    traces: List[Path],
+    output_dir: Path,
+    parameters: Params,
+    smooth: bool = False,
+    workers: Optional[int] = None,
+    compact_covariances: bool = False,
+    batch_size: int = 1,
+) -> List[Path]:
+
+    """
+    Function to run the pipeline on many traces in a process pool. Traces are submitted in the
+    given order, so pass them longest first (see find_traces) to keep all workers busy until
+    the end. A failing trace is reported and does not stop the run. Every trace gets its own
+    noise generator, keyed by the trace name, so a seeded trace gives the same results whatever
+    other traces run with it.
+
+    :param traces: Trace files
+    :param output_dir: Output directory
+    :param parameters: Initial system states, noise matrices, sigma point parameters and seed,
+    shared by all traces
+    :param smooth: If true, results are also RTS smoothed
+    :param workers: Number of worker processes, defaults to the number of cores
+    :param compact_covariances: If true, covariances are stored as upper-triangle float32
+    :param batch_size: Number of traces a worker filters together with the batched engine,
+    consecutive traces of the given order are batched, so traces sorted by size (see find_traces)
+    give batches of similar length. If the batched run of a batch fails, all its traces fail
+    :return: List of traces which failed
+    """
+
+    if batch_size > 1 and smooth:
+        raise ValueError("Batched runs do not record predictions, so they cannot be smoothed")
+
+    matrices = (
+        parameters.initial_mu_,
+        parameters.initial_covariance_,
+        parameters.R_,
+        parameters.process_noise,
+    )
+    sigma_parameters = (parameters.alpha, parameters.beta, parameters.kappa)
+    failed, done = [], 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for start in range(0, len(traces), batch_size):
+            batch = traces[start : start + batch_size]
+            rngs = [parameters.generator(zlib.crc32(trace.stem.encode())) for trace in batch]
+            if batch_size > 1:
+                future = executor.submit(
+                    process_trace_batch,
+                    batch,
+                    output_dir,
+                    *matrices,
+                    compact_covariances,
+                    rngs,
+                    *sigma_parameters,
+                )
+            else:
+                future = executor.submit(
+                    process_trace,
+                    batch[0],
+                    output_dir,
+                    *matrices,
+                    smooth,
+                    compact_covariances,
+                    rngs[0],
+                    *sigma_parameters,
+                )
+            futures[future] = batch
+
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                future.result()
+            except Exception as error:
+                for trace in batch:
+                    done += 1
+                    failed.append(trace)
+                    print(f"[{done}/{len(traces)}] Failed {trace}: {error!r}", file=sys.stderr)
+            else:
+                for trace in batch:
+                    done += 1
+                    print(f"[{done}/{len(traces)}] Done {trace}", file=sys.stderr)
+
+    return failed
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-b", "--building", help="Building glob pattern", default="*")
+    parser.add_argument("-f", "--floor", help="Floor glob pattern", default="*")
+    parser.add_argument(
+        "-d", "--dataset", help="Dataset to run on", choices=("train", "test"), default="train"
+    )
+    parser.add_argument("-o", "--output", help="Output directory", default=str(RESULTS_PATH))
+    parser.add_argument(
+        "-w", "--workers", help="Number of worker processes", type=int, default=os.cpu_count()
+    )
+    parser.add_argument("-s", "--smooth", help="RTS smooth results", default="False")
+    parser.add_argument(
+        "-r", "--refresh", help="Rescan the dataset for new or changed traces", action="store_true"
+    )
+    parser.add_argument(
+        "-c", "--compact", help="Store covariances as upper-triangle float32", action="store_true"
+    )
+    parser.add_argument(
+        "--batch-size",
+        help="Filter this many traces of similar length together in one worker call",
+        type=int,
+        default=1,
+    )
+    parser.add_argument("--seed", help="Seed of the noise matrices and filter noise", type=int)
+    parser.add_argument(
+        "-p",
+        "--params",
+        help="Parameter file (.npz, .json or .yaml), created from --seed if it does not exist",
+        type=Path,
+    )
+    args = parser.parse_args()
+
+    dataset_path = TRAIN_PATH if args.dataset == "train" else TEST_PATH
+    trace_files = find_traces(dataset_path, args.building, args.floor, args.refresh)
+
+    if not trace_files:
+        sys.exit("No traces found")
+
+    if args.params is not None:
+        parameters = Params.load_or_create(args.params, args.seed)
+    else:
+        parameters = Params(seed=args.seed)
+
+    try:
+        failed_traces = run_dataset(
+            trace_files,
+            Path(args.output),
+            parameters,
+            smooth=args.smooth in ("True", "true"),
+            workers=args.workers,
+            compact_covariances=args.compact,
+            batch_size=args.batch_size,
+        )
+    except ValueError as error:
+        sys.exit(str(error))
+
+    if failed_traces:
+        sys.exit(f"{len(failed_traces)} of {len(trace_files)} traces failed")
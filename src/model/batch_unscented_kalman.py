@@ -0,0 +1,309 @@
+import numpy as np
+
+from typing import Tuple, Callable, List, Optional, Sequence, Union
+
+from src.model.unscented_kalman import compute_sigma_weights
+from src.model.means_and_residuals import state_mean, state_residual
+from src.model.state_transition_functions import fx
+from src.model.measurement_functions import hx
+from src.model.noise_stream import NoiseStream
+
+
+def stack_traces(
+    measurements: List[np.ndarray], dt: List[np.ndarray]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+
+    """
+    Function to pad measurements and timesteps of traces with different lengths into dense
+    arrays. Padded timesteps are set to one so that they can safely pass through fx and hx.
+
+    :param measurements: List of sensor measurements, one (T_i, 8) array per trace
+    :param dt: List of timesteps, one (T_i,) array per trace
+    :return: Padded measurements (N, T, 8), padded timesteps (N, T) and mask (N, T) which is True
+    where a trace has a sample
+    """
+
+    lengths = np.array([len(measure) for measure in measurements])
+    trace_count, max_length = len(measurements), lengths.max()
+
+    mask = np.arange(max_length) < lengths[:, None]
+
+    measurements_ = np.zeros((trace_count, max_length, measurements[0].shape[1]))
+    measurements_[mask] = np.concatenate(measurements)
+
+    dt_ = np.ones((trace_count, max_length))
+    dt_[mask] = np.concatenate(dt)
+
+    return measurements_, dt_, mask
+
+
+def compute_sigmas_batch(lambda_: float, x: np.ndarray, P: np.ndarray, n: int = 8) -> np.ndarray:
+
+    """
+    Batched form of compute_sigmas. Sigma points of every trace are computed from the SVD of its
+    state covariance. Since the scaled singular value matrix is diagonal, its Cholesky factor is
+    its element-wise square root.
+
+    :param lambda_: Lambda scaling parameter
+    :param x: State means, shape (N, n)
+    :param P: State covariances, shape (N, n, n)
+    :param n: State dimension
+    :return: Computed sigma points, shape (N, 2n + 1, n)
+    """
+
+    u, s, _ = np.linalg.svd(P)
+    c = (u * np.sqrt((lambda_ + n) * s)[:, np.newaxis, :]) @ np.swapaxes(u, 1, 2)
+
+    sigmas = np.empty((x.shape[0], 2 * n + 1, n))
+    sigmas[:, 0] = x
+    sigmas[:, 1 : n + 1] = x[:, np.newaxis, :] + c
+    sigmas[:, n + 1 :] = x[:, np.newaxis, :] - c
+
+    return sigmas
+
+
+def perform_ut_batch(
+    sigmas: np.ndarray,
+    dt: np.ndarray,
+    func: Callable,
+    wm: np.ndarray,
+    wc: np.ndarray,
+    noise: np.ndarray,
+    predict: bool,
+    angle_noise: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, ...]:
+
+    """
+    Batched form of perform_ut. Sigma points of all traces are passed through the batched form
+    of func in one call.
+
+    :param sigmas: Sigma points, shape (N, 2n + 1, n)
+    :param dt: Time step of every trace, shape (N,)
+    :param func: Fx (predict) / Hx (update) function with a `batch` attribute
+    :param wm: Weights of means
+    :param wc: Weights of covariance
+    :param noise: Noise matrix
+    :param predict: True if predict step and use state residual and mean function; False for
+    update step
+    :param angle_noise: Angle noise of every sigma point of every trace, shape (N * (2n + 1), 1),
+    see NoiseStream. If None, func draws its own noise
+    :return: Unscented means (N, n), covariances (N, n, n) and transformed points
+    """
+
+    trace_count, sigma_count, n = sigmas.shape
+
+    points_after_transformation = func.batch(
+        sigmas.reshape(-1, n), np.repeat(dt, sigma_count), angle_noise
+    ).reshape(trace_count, sigma_count, n)
+
+    if predict:
+        transformed_mean = state_mean(points_after_transformation, wm)
+        residual = state_residual(points_after_transformation, transformed_mean[..., np.newaxis, :])
+    else:
+        transformed_mean = np.einsum("nki,k->ni", points_after_transformation, wm)
+        residual = points_after_transformation - transformed_mean[:, np.newaxis, :]
+
+    transformed_covariance = np.einsum("k,nki,nkj->nij", wc, residual, residual) + noise
+
+    return transformed_mean, transformed_covariance, points_after_transformation
+
+
+def update_batch(
+    xp: np.ndarray,
+    pcov: np.ndarray,
+    prior_sigma: np.ndarray,
+    dt: np.ndarray,
+    measurements: np.ndarray,
+    measurement_function: Callable,
+    wm: np.ndarray,
+    wc: np.ndarray,
+    R: np.ndarray,
+    angle_noise: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+    Batched form of update. Cross covariances and kalman gains of all traces are computed with
+    stacked matrix products.
+
+    :param xp: Prior predicted means, shape (N, n)
+    :param pcov: Prior predicted covariances, shape (N, n, n)
+    :param prior_sigma: Prior sigmas, shape (N, 2n + 1, n)
+    :param dt: Time step of every trace, shape (N,)
+    :param measurements: Measurements of every trace, shape (N, n)
+    :param measurement_function: Function to convert prior sigmas to measurement space
+    :param wm: Weights of means
+    :param wc: Weights of covariance
+    :param R: Measurement noise
+    :param angle_noise: Angle noise of every sigma point passed to the measurement function
+    :return: New state estimates and covariances
+    """
+
+    mean, covariance, sigmas_after_ut = perform_ut_batch(
+        prior_sigma, dt, measurement_function, wm, wc, R, False, angle_noise
+    )
+
+    dx = state_residual(prior_sigma, xp[..., np.newaxis, :])
+    dz = sigmas_after_ut - mean[:, np.newaxis, :]
+    pxz = np.einsum("k,nki,nkj->nij", wc, dx, dz)
+
+    k = pxz @ np.linalg.pinv(covariance)
+    x = xp + np.einsum("nij,nj->ni", k, measurements - mean)
+    p = pcov - k @ covariance @ np.swapaxes(k, 1, 2)
+
+    return x, p
+
+
+def next_noise(streams: List[NoiseStream]) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+    Function to get the fx and hx noise of the next step of a batch, from one stream shared by
+    all traces or from one stream per trace.
+
+    :param streams: Noise streams
+    :return: Angle noise of fx and of hx of every sigma point of every trace
+    """
+
+    if len(streams) == 1:
+        return streams[0].next()
+
+    fx_noise, hx_noise = zip(*(stream.next() for stream in streams))
+
+    return np.concatenate(fx_noise), np.concatenate(hx_noise)
+
+
+def perform_ukf_batch(
+    measurements: List[np.ndarray],
+    dt: List[np.ndarray],
+    initial_mu: np.ndarray,
+    initial_covariance: np.ndarray,
+    R: np.ndarray,
+    Q: np.ndarray,
+    rng: Union[np.random.Generator, Sequence[np.random.Generator], None] = None,
+    alpha: float = 0.3,
+    beta: float = 2.0,
+    kappa: float = -5,
+) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+
+    """
+    Function to run UKF on several traces at once. Every step predicts and updates all traces
+    together; traces which have already ended keep their last state. With one generator per
+    trace, every trace gets the noise perform_ukf draws from the same generator, so its
+    estimates match a perform_ukf run up to floating point error.
+
+    :param measurements: List of sensor measurements, one array per trace
+    :param dt: List of timesteps, one array per trace
+    :param initial_mu: Initial state of the system
+    :param initial_covariance: Initial covariance
+    :param R: Measurement covariance matrix
+    :param Q: Process noise matrix
+    :param rng: Random generator of the fx and hx noise shared by all traces, or a list of
+    generators, one per trace. An unseeded one if None
+    :param alpha: Parameter to decide the spread of sigma points
+    :param beta: Parameter to incorporate prior knowledge of the distribution of state
+    :param kappa: Secondary scaling parameter of the sigma points
+    :return: Lists of estimated states and covariances, one array per trace
+    """
+
+    measurements_, dt_, mask = stack_traces(measurements, dt)
+    trace_count, max_length, n = measurements_.shape
+
+    new_state = np.empty((trace_count, max_length, n))
+    new_covariance = np.empty((trace_count, max_length, n, n))
+
+    mu = np.broadcast_to(initial_mu, (trace_count, n)).astype(float)
+    cov = np.broadcast_to(initial_covariance, (trace_count, n, n)).astype(float)
+
+    wm, wc, lambda_ = compute_sigma_weights(alpha, beta, kappa=kappa)
+    if isinstance(rng, (list, tuple)):
+        streams = [NoiseStream(trace_rng, len(wm)) for trace_rng in rng]
+    else:
+        streams = [NoiseStream(rng, trace_count * len(wm))]
+
+    for i in range(max_length):
+
+        sigmas = compute_sigmas_batch(lambda_, mu, cov)
+        fx_noise, hx_noise = next_noise(streams)
+
+        # PREDICT STEP
+        ukf_mean, ukf_cov, sigmas_f = perform_ut_batch(
+            sigmas, dt_[:, i], fx, wm, wc, Q, True, fx_noise
+        )
+        # UPDATE STEP
+        estimated_state, estimated_covariance = update_batch(
+            ukf_mean, ukf_cov, sigmas_f, dt_[:, i], measurements_[:, i], hx, wm, wc, R, hx_noise
+        )
+
+        active = mask[:, i]
+        mu = np.where(active[:, np.newaxis], estimated_state, mu)
+        cov = np.where(active[:, np.newaxis, np.newaxis], estimated_covariance, cov)
+
+        new_state[:, i] = mu
+        new_covariance[:, i] = cov
+
+    lengths = mask.sum(axis=1)
+
+    return (
+        [new_state[j, : lengths[j]] for j in range(trace_count)],
+        [new_covariance[j, : lengths[j]] for j in range(trace_count)],
+    )
+
+
+def perform_ukf_batches(
+    measurements: List[np.ndarray],
+    dt: List[np.ndarray],
+    initial_mu: np.ndarray,
+    initial_covariance: np.ndarray,
+    R: np.ndarray,
+    Q: np.ndarray,
+    batch_size: int = 64,
+    rng: Union[np.random.Generator, Sequence[np.random.Generator], None] = None,
+    alpha: float = 0.3,
+    beta: float = 2.0,
+    kappa: float = -5,
+) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+
+    """
+    Function to run the batched UKF over many traces. Traces are sorted by length and grouped
+    into batches of similar length to keep padding, and memory of the stacked outputs, small.
+
+    :param measurements: List of sensor measurements, one array per trace
+    :param dt: List of timesteps, one array per trace
+    :param initial_mu: Initial state of the system
+    :param initial_covariance: Initial covariance
+    :param R: Measurement covariance matrix
+    :param Q: Process noise matrix
+    :param batch_size: Number of traces stepped together
+    :param rng: Random generator of the fx and hx noise shared by all traces, or a list of
+    generators, one per trace. An unseeded one if None
+    :param alpha: Parameter to decide the spread of sigma points
+    :param beta: Parameter to incorporate prior knowledge of the distribution of state
+    :param kappa: Secondary scaling parameter of the sigma points
+    :return: Lists of estimated states and covariances in the order of the input traces
+    """
+
+    order = np.argsort([len(measure) for measure in measurements])
+    if not isinstance(rng, (list, tuple)):
+        rng = np.random.default_rng() if rng is None else rng
+    states = [None] * len(measurements)
+    covariances = [None] * len(measurements)
+
+    for start in range(0, len(order), batch_size):
+        batch = order[start : start + batch_size]
+        batch_states, batch_covariances = perform_ukf_batch(
+            [measurements[j] for j in batch],
+            [dt[j] for j in batch],
+            initial_mu,
+            initial_covariance,
+            R,
+            Q,
+            [rng[j] for j in batch] if isinstance(rng, (list, tuple)) else rng,
+            alpha,
+            beta,
+            kappa,
+        )
+
+        for j, state, covariance in zip(batch, batch_states, batch_covariances):
+            states[j] = state
+            covariances[j] = covariance
+
+    return states, covariances
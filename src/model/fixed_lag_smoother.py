@@ -0,0 +1,179 @@
+import numpy as np
+
+from collections import deque
+from time import perf_counter
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from src.model.unscented_filter import UnscentedFilter
+from src.model.means_and_residuals import state_residual
+from src.model.rts_smoother import smoother_gains
+from src.util.metrics import FilterObserver, NULL_OBSERVER
+
+
+class FixedLagSmoother:
+
+    """
+    Fixed-lag smoother for live sessions. Every sample is filtered with UnscentedFilter and the
+    last lag + 1 filtered states are kept in a ring buffer together with the predictions of the
+    forward pass. After every sample the buffer is RTS smoothed backwards and the smoothed
+    estimate of the sample lag steps behind is emitted, so memory and latency are bounded by
+    the lag instead of the trace length.
+
+    Smoother gains do not depend on the smoothed estimates, so every gain is computed once when
+    its prediction arrives and a step costs lag matrix products.
+    """
+
+    def __init__(
+        self,
+        lag: int,
+        initial_mu: np.ndarray,
+        initial_covariance: np.ndarray,
+        R: np.ndarray,
+        Q: np.ndarray,
+        alpha: float = 0.3,
+        beta: float = 2.0,
+        kappa: float = -5,
+        observer: FilterObserver = NULL_OBSERVER,
+        square_root: bool = False,
+        rng: Optional[np.random.Generator] = None,
+    ):
+
+        """
+        :param lag: Number of samples the smoothed estimate is behind the latest sample
+        :param initial_mu: Initial state of the system
+        :param initial_covariance: Initial covariance
+        :param R: Measurement covariance matrix
+        :param Q: Process noise matrix
+        :param alpha: Parameter to decide the spread of sigma points
+        :param beta: Parameter to incorporate prior knowledge of the distribution of state
+        :param kappa: Secondary scaling parameter of the sigma points
+        :param observer: Observer to report wall time, innovations and estimates to
+        :param square_root: If true, run the square root UKF
+        :param rng: Random generator of the fx and hx noise, an unseeded one if None
+        """
+
+        if lag < 0:
+            raise ValueError("Lag must not be negative")
+
+        self.lag = lag
+        self.observer = observer
+        self.ukf = UnscentedFilter(
+            initial_mu,
+            initial_covariance,
+            R,
+            Q,
+            alpha=alpha,
+            beta=beta,
+            kappa=kappa,
+            observer=observer,
+            square_root=square_root,
+            record_predictions=True,
+            rng=rng,
+        )
+
+        # Entries are (state, covariance, predicted mean, predicted covariance, gain), where the
+        # prediction and gain link the entry to the one before it
+        self._window = deque(maxlen=lag + 1)
+
+        # Steps linking a sample to the one before it, and those of them which got a gain
+        self.linked_steps = 0
+        self.smoothed_steps = 0
+
+    @property
+    def smoothed_fraction(self) -> float:
+
+        """
+        Fraction of the steps so far which were smoothed. Steps with an indefinite predicted
+        covariance keep their filtered estimates, see smoother_gains.
+        """
+
+        return self.smoothed_steps / self.linked_steps if self.linked_steps else 1.0
+
+    def step(self, measurement: np.ndarray, dt: float) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+
+        """
+        Function to filter one sensor sample and smooth the buffer.
+
+        :param measurement: Sensor measurement of the sample
+        :param dt: Time step since the previous sample
+        :return: Smoothed state estimate and covariance of the sample lag steps back, None for
+        the first lag samples
+        """
+
+        x, P = self.ukf.step(measurement, dt)
+
+        start = perf_counter()
+
+        predicted_mean, predicted_cov, cross_cov = self.ukf.prediction
+        gains, smoothed = smoother_gains(predicted_cov[np.newaxis], cross_cov[np.newaxis])
+        self._window.append((x, P, predicted_mean, predicted_cov, gains[0]))
+
+        # The prediction of the first sample links it to the initial state, which is not emitted
+        if self.ukf.step_count > 1:
+            self.linked_steps += 1
+            self.smoothed_steps += int(smoothed[0])
+
+        smoothed = None
+        if len(self._window) == self.lag + 1:
+            smoothed = self._smooth()[0]
+
+        self.observer.on_stage("fixed_lag_smoother", perf_counter() - start)
+
+        return smoothed
+
+    def _smooth(self) -> List[Tuple[np.ndarray, np.ndarray]]:
+
+        """
+        Function to RTS smooth the buffered states.
+
+        :return: Smoothed state estimates and covariances, oldest first
+        """
+
+        window = list(self._window)
+        smoothed_x, smoothed_p = window[-1][:2]
+        smoothed = [(smoothed_x, smoothed_p)]
+
+        for index in reversed(range(len(window) - 1)):
+            x, P = window[index][:2]
+            _, _, predicted_mean, predicted_cov, gain = window[index + 1]
+
+            smoothed_x = x + np.dot(gain, state_residual(smoothed_x, predicted_mean))
+            smoothed_p = 0.5 * (P + P.T) + np.dot(gain, smoothed_p - predicted_cov).dot(gain.T)
+            smoothed.append((smoothed_x, smoothed_p))
+
+        return smoothed[::-1]
+
+    def flush(self) -> List[Tuple[np.ndarray, np.ndarray]]:
+
+        """
+        Function to get the smoothed estimates of the samples which have not been emitted yet,
+        at the end of a session.
+
+        :return: Smoothed state estimates and covariances, oldest first
+        """
+
+        if not self._window:
+            return []
+
+        smoothed = self._smooth()
+
+        return smoothed[1:] if len(self._window) == self.lag + 1 else smoothed
+
+    def filter(
+        self, samples: Iterable[Tuple[np.ndarray, float]]
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+
+        """
+        Generator to run the smoother over a stream of samples. The estimates of the last lag
+        samples are emitted once the stream ends.
+
+        :param samples: Iterable of (measurement, time step) pairs
+        :return: Iterator of smoothed state estimates and covariances, one per sample
+        """
+
+        for measurement, dt in samples:
+            smoothed = self.step(measurement, dt)
+            if smoothed is not None:
+                yield smoothed
+
+        yield from self.flush()
@@ -3,41 +3,22 @@ import numpy as np
 from src.preprocessing.angles import normalize_angles
 
 
-def compute_angle_mean(angles: np.ndarray, wm: np.ndarray) -> np.ndarray:
-
-    """
-    Function to compute means of the angles
-
-    :param angles: Euler angle
-    :param wm: Weighted mean
-    :return: Angle mean
-    """
-
-    sum_sin = np.sum(np.dot(np.sin(angles), wm))
-    sum_cos = np.sum(np.dot(np.cos(angles), wm))
-
-    return np.arctan2(sum_sin, sum_cos)
-
-
 def state_mean(sigmas: np.ndarray, wm: np.ndarray) -> np.ndarray:
 
     """
-    Function to compute state means
+    Function to compute state means. Linear means and the weighted sin and cos sums of the
+    angles come from one matrix product, for a single set of sigma points or a stack of them.
 
-    :param sigmas: Array of sigmas
+    :param sigmas: Array of sigmas, shape (..., 2n + 1, n)
     :param wm: Weighted mean
-    :return: State means
+    :return: State means, shape (..., n)
     """
 
-    sigma_angles = sigmas[:, 5:]
-
-    normalized_angles = np.array(
-        [np.array([normalize_angles(angle) for angle in angles]) for angles in sigma_angles]
-    )
-    angle_means = np.array([compute_angle_mean(normalized_angles[:, i], wm) for i in range(3)])
-    sigma_means = np.array([np.sum(np.dot(sigmas[:, i], wm)) for i in range(5)])
+    # sin and cos are periodic, so angles do not need to be normalized before averaging
+    angles = sigmas[..., 5:]
+    sums = wm @ np.concatenate((sigmas[..., :5], np.sin(angles), np.cos(angles)), axis=-1)
 
-    return np.concatenate((sigma_means, angle_means))
+    return np.concatenate((sums[..., :5], np.arctan2(sums[..., 5:8], sums[..., 8:])), axis=-1)
 
 
 def state_residual(sigma: np.ndarray, state: np.ndarray) -> np.ndarray:
@@ -45,14 +26,13 @@ def state_residual(sigma: np.ndarray, state: np.ndarray) -> np.ndarray:
     """
     Function to compute state residual.
 
-    :param sigma: Sigma points
-    :param state: Array of states
-    :return: State residual
+    :param sigma: Sigma point, or array of sigma points of shape (..., 2n + 1, n)
+    :param state: Array of states, broadcastable against sigma, e.g. shape (..., 1, n) for
+    stacked sigma points
+    :return: State residual, same shape as sigma
     """
 
     residual = sigma - state
-    residual[5] = normalize_angles(residual[5])
-    residual[6] = normalize_angles(residual[6])
-    residual[7] = normalize_angles(residual[7])
+    residual[..., 5:] = normalize_angles(residual[..., 5:])
 
     return residual
@@ -1,4 +1,7 @@
+from typing import Optional
+
 from src.preprocessing.rotation_matrix import *
+from src.model.noise_stream import ANGLE_NOISE_SCALE
 
 
 def get_acc_with_gravity(linear_acceleration: np.ndarray, alpha: float = 0.8) -> np.ndarray:
@@ -21,13 +24,30 @@ def get_acc_with_gravity(linear_acceleration: np.ndarray, alpha: float = 0.8) ->
     return acc
 
 
-def hx(prior_sigmas: np.ndarray, dt: float) -> np.ndarray:
+def get_acc_with_gravity_batch(linear_acceleration: np.ndarray, alpha: float = 0.8) -> np.ndarray:
+
+    """
+    Batched form of get_acc_with_gravity.
+
+    :param linear_acceleration: Linear acceleration values, shape (N, 3)
+    :param alpha: Calculated as t / (t + dt) where t is low pass filter time constant
+    :return: Raw acceleration with gravity, shape (N, 3)
+    """
+
+    acc = linear_acceleration / 1.2
+    acc[:, 2] -= (alpha * 9.81) / 1.2
+
+    return acc
+
+
+def hx(prior_sigmas: np.ndarray, dt: float, angle_noise: Optional[float] = None) -> np.ndarray:
 
     """
     Measurement function to convert prior sigmas to measurement space to be passed through UT.
 
     :param prior_sigmas: Prior sigmas
     :param dt: Time step
+    :param angle_noise: Perturbation of the euler angles, drawn from np.random if None
     :return: Array of measurements
     """
 
@@ -35,8 +55,79 @@ def hx(prior_sigmas: np.ndarray, dt: float) -> np.ndarray:
 
     acc = get_acc_with_gravity(linear_acc)
 
-    euler_angles = prior_sigmas[5:] - np.random.normal(0.0, np.pi / 16)
+    if angle_noise is None:
+        angle_noise = np.random.normal(0.0, ANGLE_NOISE_SCALE)
+
+    euler_angles = prior_sigmas[5:] - angle_noise
 
     gyr = np.array([i / dt for i in euler_angles])
 
     return np.concatenate((prior_sigmas[:2], acc, gyr))
+
+
+def hx_batch(
+    prior_sigmas: np.ndarray, dt: float, angle_noise: Optional[np.ndarray] = None
+) -> np.ndarray:
+
+    """
+    Batched form of hx. Converts all prior sigmas to measurement space in one pass.
+
+    :param prior_sigmas: Prior sigmas, shape (2n + 1, n)
+    :param dt: Time step, either a scalar or one time step per sigma point
+    :param angle_noise: Perturbation of the euler angles of every sigma point, shape (2n + 1, 1),
+    drawn from np.random if None
+    :return: Array of measurements, shape (2n + 1, n)
+    """
+
+    acc = get_acc_with_gravity_batch(prior_sigmas[:, 2:5])
+
+    if angle_noise is None:
+        angle_noise = np.random.normal(0.0, ANGLE_NOISE_SCALE, (prior_sigmas.shape[0], 1))
+
+    euler_angles = prior_sigmas[:, 5:] - angle_noise
+
+    gyr = euler_angles / np.reshape(dt, (-1, 1))
+
+    return np.column_stack((prior_sigmas[:, :2], acc, gyr))
+
+
+hx.batch = hx_batch
+
+
+# Rows of the accelerometer and gyroscope readings in the measurement vector, the first two rows
+# are the position fix
+IMU_ROWS = slice(2, 8)
+
+
+def imu_hx(prior_sigmas: np.ndarray, dt: float, angle_noise: Optional[float] = None) -> np.ndarray:
+
+    """
+    Measurement function of samples without a position fix, hx without the position rows.
+
+    :param prior_sigmas: Prior sigmas
+    :param dt: Time step
+    :param angle_noise: Perturbation of the euler angles, drawn from np.random if None
+    :return: Array of accelerometer and gyroscope measurements
+    """
+
+    return hx(prior_sigmas, dt, angle_noise)[IMU_ROWS]
+
+
+def imu_hx_batch(
+    prior_sigmas: np.ndarray, dt: float, angle_noise: Optional[np.ndarray] = None
+) -> np.ndarray:
+
+    """
+    Batched form of imu_hx.
+
+    :param prior_sigmas: Prior sigmas, shape (2n + 1, n)
+    :param dt: Time step, either a scalar or one time step per sigma point
+    :param angle_noise: Perturbation of the euler angles of every sigma point, shape (2n + 1, 1),
+    drawn from np.random if None
+    :return: Array of accelerometer and gyroscope measurements, shape (2n + 1, 6)
+    """
+
+    return hx_batch(prior_sigmas, dt, angle_noise)[:, IMU_ROWS]
+
+
+imu_hx.batch = imu_hx_batch
@@ -0,0 +1,169 @@
+import numpy as np
+
+from typing import Optional, Tuple
+
+from src.preprocessing.angles import normalize_angles
+from src.model.unscented_filter import UnscentedFilter
+from src.model.waypoint_measurement_fix import nearest_sample_indices
+from src.model.rts_smoother import rts_smoother_from_predictions
+from src.util.metrics import FilterObserver, NULL_OBSERVER
+
+
+def update_schedule(
+    timestamps: np.ndarray, waypoint_timestamps: np.ndarray, update_rate: Optional[float] = None
+) -> np.ndarray:
+
+    """
+    Function to select the samples whose position is used as a fix: the samples nearest to the
+    real waypoint fixes, the first sample and, with an update rate, the first sample of every
+    1 / update_rate second interval.
+
+    :param timestamps: Sample timestamps (ms)
+    :param waypoint_timestamps: Timestamps of the real waypoint fixes (ms)
+    :param update_rate: Additional position fixes per second, None for fixes at waypoints only
+    :return: Boolean mask of the samples with a position fix
+    """
+
+    updates = np.zeros(len(timestamps), dtype=bool)
+    updates[0] = True
+    updates[nearest_sample_indices(timestamps, waypoint_timestamps)] = True
+
+    if update_rate:
+        intervals = np.floor((timestamps - timestamps[0]) / 1000 * update_rate)
+        updates[1:] |= intervals[1:] != intervals[:-1]
+
+    return updates
+
+
+def decimate_samples(updates: np.ndarray, dt: np.ndarray, factor: int) -> Tuple[np.ndarray, ...]:
+
+    """
+    Function to keep every factor-th sample and every update sample. The time step of a kept
+    sample is the time since the previous kept sample.
+
+    :param updates: Boolean mask of the samples to update at
+    :param dt: Time step of every sample
+    :param factor: Decimation factor, 1 keeps every sample
+    :return: Indices of the kept samples and their time steps
+    """
+
+    keep = updates.copy()
+    keep[::factor] = True
+    kept = np.flatnonzero(keep)
+
+    elapsed = np.cumsum(dt)
+    kept_dt = np.diff(elapsed[kept], prepend=elapsed[kept[0]] - dt[kept[0]])
+
+    return kept, kept_dt
+
+
+def expand_to_timeline(
+    kept: np.ndarray, states: np.ndarray, covariances: np.ndarray, sample_count: int
+) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+    Function to fill in the estimates of decimated samples. States are linearly interpolated
+    between kept samples (angles on the unwrapped angle), covariances are held from the last
+    kept sample.
+
+    :param kept: Indices of the kept samples, starting with 0
+    :param states: Estimated states of the kept samples
+    :param covariances: Estimated covariances of the kept samples
+    :param sample_count: Number of samples of the full timeline
+    :return: Estimated states and covariances of every sample
+    """
+
+    if len(kept) == sample_count:
+        return states, covariances
+
+    positions = np.arange(sample_count)
+    unwrapped = np.column_stack((states[:, :5], np.unwrap(states[:, 5:], axis=0)))
+
+    expanded = np.column_stack([np.interp(positions, kept, column) for column in unwrapped.T])
+    expanded[:, 5:] = normalize_angles(expanded[:, 5:])
+
+    return expanded, covariances[np.searchsorted(kept, positions, side="right") - 1]
+
+
+def perform_scheduled_ukf(
+    measurements: np.ndarray,
+    dt: np.ndarray,
+    timestamps: np.ndarray,
+    waypoint_timestamps: np.ndarray,
+    initial_mu: np.ndarray,
+    initial_covariance: np.ndarray,
+    R: np.ndarray,
+    Q: np.ndarray,
+    update_rate: Optional[float] = None,
+    decimation: int = 1,
+    smooth: bool = False,
+    observer: FilterObserver = NULL_OBSERVER,
+    square_root: bool = False,
+    rng: Optional[np.random.Generator] = None,
+    alpha: float = 0.3,
+    beta: float = 2.0,
+    kappa: float = -5,
+) -> Tuple[np.ndarray, ...]:
+
+    """
+    Function to run UKF event driven. The position of a sample is only used at real waypoint
+    fixes (and at update_rate), every other sample is updated with its accelerometer and
+    gyroscope readings only, so the interpolated waypoints between fixes never reach the
+    filter. The state transition takes no IMU input, so without these updates the prediction
+    between fixes drifts and its covariance grows without bound. Every kept sample therefore
+    runs a full predict and update, at the cost of a perform_ukf step: the only saving comes
+    from decimation, which drops IMU samples and does not use their readings. Estimates are
+    then interpolated back, so the output has one estimate per sample like perform_ukf.
+
+    :param measurements: Sensor measurements
+    :param dt: Timesteps
+    :param timestamps: Sample timestamps (ms)
+    :param waypoint_timestamps: Timestamps of the real waypoint fixes (ms)
+    :param initial_mu: Initial state of the system
+    :param initial_covariance: Initial covariance
+    :param R: Measurement covariance matrix
+    :param Q: Process noise matrix
+    :param update_rate: Additional position fixes per second, None for fixes at waypoints only
+    :param decimation: Keep every decimation-th sample besides the update samples
+    :param smooth: If true, estimates are RTS smoothed before they are interpolated back, and
+    the fraction of smoothed steps is returned as well (see rts_smoother_from_predictions)
+    :param observer: Observer to report to
+    :param square_root: If true, run the square root UKF
+    :param rng: Random generator of the fx and hx noise, an unseeded one if None
+    :param alpha: Parameter to decide the spread of sigma points
+    :param beta: Parameter to incorporate prior knowledge of the distribution of state
+    :param kappa: Secondary scaling parameter of the sigma points
+    :return: Array of estimated states and covariance
+    """
+
+    updates = update_schedule(timestamps, waypoint_timestamps, update_rate)
+    kept, kept_dt = decimate_samples(updates, dt, decimation)
+
+    ukf = UnscentedFilter(
+        initial_mu,
+        initial_covariance,
+        R,
+        Q,
+        alpha=alpha,
+        beta=beta,
+        kappa=kappa,
+        record_history=True,
+        observer=observer,
+        square_root=square_root,
+        record_predictions=smooth,
+        rng=rng,
+    )
+
+    for index, sample_dt in zip(kept, kept_dt):
+        ukf.step(measurements[index], sample_dt, position_fix=updates[index])
+
+    states, covariances = ukf.history()
+
+    if not smooth:
+        return expand_to_timeline(kept, states, covariances, len(measurements))
+
+    states, covariances, smoothed_fraction = rts_smoother_from_predictions(
+        states, covariances, *ukf.predictions(), observer=observer
+    )
+
+    return (*expand_to_timeline(kept, states, covariances, len(measurements)), smoothed_fraction)
@@ -0,0 +1,54 @@
+import numpy as np
+
+from typing import Optional, Tuple
+
+# Standard deviation of the euler angle perturbation fx adds to and hx subtracts from every
+# sigma point
+ANGLE_NOISE_SCALE = np.pi / 16
+
+# Number of noise values drawn at once, a block covers NOISE_BLOCK_VALUES / (2 * sigma_count) steps
+NOISE_BLOCK_VALUES = 2 ** 16
+
+
+class NoiseStream:
+
+    """
+    Angle perturbations for fx and hx drawn from a numpy Generator. The noise of a whole block of
+    steps is drawn as one array and every step takes a view of it, so the filter loop makes one
+    RNG call per block instead of one per sigma point. With a seeded generator every run gives
+    the same results.
+    """
+
+    def __init__(self, rng: Optional[np.random.Generator] = None, sigma_count: int = 17):
+
+        """
+        :param rng: Random generator, an unseeded one if None
+        :param sigma_count: Number of sigma points per step (2n + 1, times the number of traces
+        for batched filters)
+        """
+
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.sigma_count = sigma_count
+        self.block_steps = max(1, NOISE_BLOCK_VALUES // (2 * sigma_count))
+
+        self._block = None
+        self._index = self.block_steps
+
+    def next(self) -> Tuple[np.ndarray, np.ndarray]:
+
+        """
+        Function to get the noise of the next step.
+
+        :return: Angle noise of fx and of hx, each of shape (sigma_count, 1)
+        """
+
+        if self._index == self.block_steps:
+            self._block = self.rng.normal(
+                0.0, ANGLE_NOISE_SCALE, (self.block_steps, 2, self.sigma_count, 1)
+            )
+            self._index = 0
+
+        noise = self._block[self._index]
+        self._index += 1
+
+        return noise[0], noise[1]
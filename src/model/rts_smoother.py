@@ -1,9 +1,23 @@
+from time import perf_counter
+from scipy.linalg import solve_triangular
+
 from src.model.unscented_kalman import *
 from src.model.state_transition_functions import *
+from src.model.square_root_unscented_kalman import compute_sigmas_sqrt, perform_ut_sqrt
+from src.model.square_root_unscented_kalman import noise_square_root, check_sigma_weights
+from src.util.metrics import FilterObserver, NULL_OBSERVER
 
 
 def rts_smoother(
-    estimated_state_means: np.ndarray, estimated_cov: np.ndarray, Qs: np.ndarray, dt: np.ndarray,
+    estimated_state_means: np.ndarray,
+    estimated_cov: np.ndarray,
+    Qs: np.ndarray,
+    dt: np.ndarray,
+    observer: FilterObserver = NULL_OBSERVER,
+    square_root: bool = False,
+    alpha: float = 0.3,
+    beta: float = 2.0,
+    kappa: float = -5,
 ) -> Tuple[np.ndarray, ...]:
 
     """
@@ -15,35 +29,172 @@ def rts_smoother(
     :param estimated_cov: Output estimated state covariance of UKF
     :param Qs: Process noise matrix
     :param dt: Sensor timesteps
+    :param observer: Observer to report wall time to
+    :param square_root: If true, sigma points and the predicted covariance come from Cholesky
+    factors and the gain is solved with triangular solves. Steps where the covariance is not
+    positive definite fall back to the SVD path. Needs a non-negative central sigma point weight
+    :param alpha: Parameter to decide the spread of sigma points
+    :param beta: Parameter to incorporate prior knowledge of the distribution of state
+    :param kappa: Secondary scaling parameter of the sigma points
     :return: Smoothed state means and covariance
+    :raises ValueError: If square_root is set and the sigma point weights are not supported
     """
 
-    n, dim_x = estimated_state_means.shape
+    start = perf_counter()
 
-    Qs = [Qs] * n
-    ks = np.zeros((n, dim_x, dim_x))
+    n = len(estimated_state_means)
 
     estimated_x, estimated_p = estimated_state_means.copy(), estimated_cov.copy()
-    wm, wc, lambda_ = compute_sigma_weights(0.3, 2.0)
+    wm, wc, lambda_ = compute_sigma_weights(alpha, beta, kappa=kappa)
+    Q_sqrt = noise_square_root(Qs) if square_root else None
+    if square_root:
+        check_sigma_weights(wc)
 
     for index in reversed(range(n - 1)):
 
         estimated_p[index] = 0.5 * (estimated_p[index] + estimated_p[index].T)
-        sigmas = compute_sigmas(lambda_, estimated_x[index], estimated_p[index])
-        mean_b, cov_b, sigmas_f = perform_ut(sigmas, dt[index], fx, wm, wc, Qs[index], True)
-        pxb = 0
+        cov_b_sqrt = None
+
+        if square_root:
+            try:
+                S = cholesky(estimated_p[index], lower=True)
+                sigmas = compute_sigmas_sqrt(lambda_, estimated_x[index], S)
+                mean_b, cov_b_sqrt, sigmas_f = perform_ut_sqrt(
+                    sigmas, dt[index], fx, wm, wc, Q_sqrt, True, observer=observer
+                )
+                cov_b = np.dot(cov_b_sqrt, cov_b_sqrt.T)
+            except (np.linalg.LinAlgError, ValueError):
+                cov_b_sqrt = None
+
+        if cov_b_sqrt is None:
+            sigmas = compute_sigmas(
+                lambda_, estimated_x[index], estimated_p[index], observer=observer
+            )
+            mean_b, cov_b, sigmas_f = perform_ut(
+                sigmas, dt[index], fx, wm, wc, Qs, True, observer=observer
+            )
 
-        for i, sigmas_f_ in enumerate(sigmas_f):
-            y = state_residual(sigmas_f_, mean_b)
-            z = state_residual(sigmas[i], estimated_state_means[index])
-            pxb += wc[i] * np.outer(z, y)
+        pxb = state_cross_covariance(sigmas, estimated_state_means[index], sigmas_f, mean_b, wc)
 
-        u, s, v = svd(cov_b)
-        cov_b_inv = v.T @ np.diag(np.where(s != 0, 1 / s, s)) @ u.T
+        if cov_b_sqrt is not None:
+            gain = solve_triangular(
+                cov_b_sqrt.T, solve_triangular(cov_b_sqrt, pxb.T, lower=True), lower=False
+            ).T
+        else:
+            u, s, v = svd(cov_b)
+            cov_b_inv = v.T @ np.diag(np.where(s != 0, 1 / s, s)) @ u.T
+            gain = np.dot(pxb, cov_b_inv)
 
-        gain = np.dot(pxb, cov_b_inv)
         estimated_x[index] += np.dot(gain, state_residual(estimated_x[index + 1], mean_b))
         estimated_p[index] += np.dot(gain, estimated_p[index + 1] - cov_b).dot(gain.T)
-        ks[index] = gain
+
+    observer.on_stage("rts_smoother", perf_counter() - start)
 
     return estimated_x, estimated_p
+
+
+def smoother_gains(
+    predicted_cov: np.ndarray, cross_cov: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+    Function to compute the smoother gains cross_cov @ inv(predicted_cov) of all steps at once.
+    The gains do not depend on the smoothed estimates, so the predicted covariances are
+    Cholesky factorized in one batched call. Predicted covariances which are not positive
+    definite get a zero gain, so these steps keep their filtered estimates. A negative central
+    sigma weight or an indefinite process noise matrix makes them indefinite, e.g. with the
+    default Params every step is. Gains from the pseudo-inverse of an indefinite covariance, or
+    from one with its negative eigenvalues clipped, amplify the smoothed residual at every step
+    back and make the smoother diverge.
+
+    :param predicted_cov: Predicted state covariances, shape (n, dim, dim)
+    :param cross_cov: Cross covariances between the previous state and the prediction
+    :return: Smoother gains, shape (n, dim, dim), and whether every step got a gain
+    """
+
+    predicted_cov = 0.5 * (predicted_cov + np.swapaxes(predicted_cov, -1, -2))
+    eigenvalues = np.linalg.eigvalsh(predicted_cov)
+    tolerance = predicted_cov.shape[-1] * np.finfo(float).eps * np.abs(eigenvalues).max(axis=-1)
+    positive = eigenvalues[:, 0] > tolerance
+
+    gains = np.zeros_like(cross_cov)
+
+    # Gain^T solves L L^T Gain^T = cross_cov^T
+    lower = np.linalg.cholesky(predicted_cov[positive])
+    half_solved = np.linalg.solve(lower, np.swapaxes(cross_cov[positive], -1, -2))
+    gains[positive] = np.swapaxes(np.linalg.solve(np.swapaxes(lower, -1, -2), half_solved), -1, -2)
+
+    return gains, positive
+
+
+def smoothing_message(smoothed_fraction: float) -> Optional[str]:
+
+    """
+    Function to describe a smoother run in which not every step was smoothed.
+
+    :param smoothed_fraction: Fraction of smoothed steps, see rts_smoother_from_predictions
+    :return: Message, None if every step was smoothed
+    """
+
+    if smoothed_fraction >= 1.0:
+        return None
+
+    if smoothed_fraction == 0.0:
+        return (
+            "Nothing was smoothed: every predicted covariance is indefinite, so the smoothed "
+            "states are the filtered states"
+        )
+
+    return (
+        f"Only {smoothed_fraction:.1%} of the steps were smoothed, the others have an indefinite "
+        "predicted covariance and keep their filtered states"
+    )
+
+
+def rts_smoother_from_predictions(
+    estimated_state_means: np.ndarray,
+    estimated_cov: np.ndarray,
+    predicted_means: np.ndarray,
+    predicted_cov: np.ndarray,
+    cross_cov: np.ndarray,
+    observer: FilterObserver = NULL_OBSERVER,
+) -> Tuple[np.ndarray, np.ndarray, float]:
+
+    """
+    Function to run Rauch-Tung-Striebal Kalman smoother on the predictions recorded during the
+    forward pass (see UnscentedFilter.predictions), so the backward pass needs no sigma points
+    or state transitions, only the gains (see smoother_gains) and a few matrix products per
+    step. Steps with an indefinite predicted covariance keep their filtered estimates, the
+    fraction of steps which were smoothed is returned so callers can report it.
+
+    :param estimated_state_means: Output estimated state means of UKF
+    :param estimated_cov: Output estimated state covariance of UKF
+    :param predicted_means: Predicted state means of every UKF step
+    :param predicted_cov: Predicted state covariance of every UKF step
+    :param cross_cov: Cross covariance between the previous state and the prediction of every
+    UKF step
+    :param observer: Observer to report wall time to
+    :return: Smoothed state means and covariance, and the fraction of smoothed steps
+    """
+
+    start = perf_counter()
+
+    n = len(estimated_state_means)
+    estimated_x, estimated_p = estimated_state_means.copy(), estimated_cov.copy()
+
+    # Step index + 1 of the forward pass predicted index + 1 from index
+    gains, smoothed = smoother_gains(predicted_cov[1:], cross_cov[1:])
+
+    for index in reversed(range(n - 1)):
+
+        gain = gains[index]
+        estimated_x[index] += np.dot(
+            gain, state_residual(estimated_x[index + 1], predicted_means[index + 1])
+        )
+        estimated_p[index] = 0.5 * (estimated_p[index] + estimated_p[index].T) + np.dot(
+            gain, estimated_p[index + 1] - predicted_cov[index + 1]
+        ).dot(gain.T)
+
+    observer.on_stage("rts_smoother", perf_counter() - start)
+
+    return estimated_x, estimated_p, float(smoothed.mean()) if len(smoothed) else 1.0
@@ -0,0 +1,249 @@
+import math
+import numpy as np
+
+from time import perf_counter
+from scipy.linalg import solve_triangular
+from typing import Callable, Optional, Tuple
+
+from src.model.unscented_kalman import transform_sigmas
+from src.model.means_and_residuals import state_mean, state_residual
+from src.util.metrics import FilterObserver, NULL_OBSERVER
+
+
+def noise_square_root(noise: np.ndarray) -> np.ndarray:
+
+    """
+    Function to get a square root factor F of a noise matrix, such that F @ F.T is the noise
+    covariance. A square root filter can only represent symmetric positive semi-definite
+    covariances, so the factor is taken from the symmetric part of the noise matrix with
+    negative eigenvalues clipped to zero. Noise matrices are constant, so this runs once per
+    filter and not every step.
+
+    :param noise: Noise matrix
+    :return: Square root factor of the noise covariance
+    """
+
+    eigenvalues, eigenvectors = np.linalg.eigh(0.5 * (noise + noise.T))
+
+    return eigenvectors * np.sqrt(np.clip(eigenvalues, 0.0, None))
+
+
+def check_sigma_weights(wc: np.ndarray):
+
+    """
+    Function to check that the square root UKF can use the sigma point weights. A Cholesky
+    factor only represents positive definite covariances, so the central sigma point is added
+    with a rank-1 update and needs a non-negative covariance weight. The default parameters
+    (alpha 0.3, kappa -5) give it a large negative weight, with which every downdate fails.
+
+    :param wc: Weights of covariance
+    :raises ValueError: If the weight of the central sigma point is negative
+    """
+
+    if wc[0] < 0:
+        raise ValueError(
+            f"The square root UKF needs a non-negative central sigma point weight, got "
+            f"{wc[0]:.4g}. Choose alpha, beta and kappa accordingly, e.g. 1, 2 and 1"
+        )
+
+
+def cholupdate(S: np.ndarray, v: np.ndarray, sign: float = 1.0) -> np.ndarray:
+
+    """
+    Rank-1 update (sign=1) or downdate (sign=-1) of a lower triangular Cholesky factor, so that
+    the returned factor satisfies S' @ S'.T = S @ S.T + sign * outer(v, v).
+
+    :param S: Lower triangular Cholesky factor
+    :param v: Update vector
+    :param sign: 1 for update, -1 for downdate
+    :return: Updated lower triangular Cholesky factor
+    :raises np.linalg.LinAlgError: If a downdate makes the factor not positive definite
+    """
+
+    # The factor is small (8 x 8), scalar arithmetic on lists is faster than slicing arrays
+    L = S.tolist()
+    v = [float(value) for value in v]
+
+    for k in range(len(v)):
+        row = L[k]
+        r_squared = row[k] * row[k] + sign * v[k] * v[k]
+        if not r_squared > 0:
+            raise np.linalg.LinAlgError("Cholesky downdate is not positive definite")
+
+        r = math.sqrt(r_squared)
+        c = r / row[k]
+        s = v[k] / row[k]
+        row[k] = r
+        for i in range(k + 1, len(v)):
+            L[i][k] = (L[i][k] + sign * s * v[i]) / c
+            v[i] = c * v[i] - s * L[i][k]
+
+    return np.array(L)
+
+
+def compute_sigmas_sqrt(lambda_: float, x: np.ndarray, S: np.ndarray, n: int = 8) -> np.ndarray:
+
+    """
+    Function to compute sigma points directly from a Cholesky factor of the state covariance,
+    which avoids the SVD of compute_sigmas.
+
+    :param lambda_: Lambda scaling parameter
+    :param x: State mean
+    :param S: Lower triangular Cholesky factor of the state covariance
+    :param n: State dimension
+    :return: Computed sigma points
+    """
+
+    c = np.sqrt(lambda_ + n) * S.T
+
+    sigmas = np.empty((2 * n + 1, n))
+    sigmas[0] = x
+    sigmas[1 : n + 1] = x + c
+    sigmas[n + 1 :] = x - c
+
+    return sigmas
+
+
+def covariance_square_root(
+    residuals: np.ndarray, wc: np.ndarray, noise_sqrt: np.ndarray
+) -> np.ndarray:
+
+    """
+    Function to compute the Cholesky factor of the weighted residual covariance plus noise. The
+    factor of the outer sigma points and the noise comes from one QR decomposition, the central
+    sigma point is then added with a rank-1 Cholesky update (see check_sigma_weights).
+
+    :param residuals: Residuals of the sigma points, shape (2n + 1, n)
+    :param wc: Weights of covariance, all weights but the first must be equal and positive and
+    the first must not be negative
+    :param noise_sqrt: Square root factor of the noise covariance
+    :return: Lower triangular Cholesky factor of the covariance
+    :raises np.linalg.LinAlgError: If the covariance is not positive definite
+    """
+
+    compound = np.vstack((np.sqrt(wc[1]) * residuals[1:], noise_sqrt.T))
+    upper = np.linalg.qr(compound, mode="r")
+
+    # QR is only unique up to the signs of the rows of R, make the diagonal positive
+    S = (upper * np.sign(np.diag(upper))[:, np.newaxis]).T
+
+    if np.any(np.diag(S) == 0):
+        raise np.linalg.LinAlgError("Covariance factor is singular")
+
+    return cholupdate(S, np.sqrt(wc[0]) * residuals[0])
+
+
+def perform_ut_sqrt(
+    sigmas: np.ndarray,
+    dt: float,
+    func: Callable,
+    wm: np.ndarray,
+    wc: np.ndarray,
+    noise_sqrt: np.ndarray,
+    predict: bool,
+    n: int = 8,
+    observer: FilterObserver = NULL_OBSERVER,
+    angle_noise: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, ...]:
+
+    """
+    Square root form of perform_ut. Returns the Cholesky factor of the transformed covariance
+    instead of the covariance.
+
+    :param sigmas: Sigma points
+    :param dt: Time step
+    :param func: Fx (predict) / Hx (update) function to pass sigma points through
+    :param wm: Weights of means
+    :param wc: Weights of covariance
+    :param noise_sqrt: Square root factor of the noise covariance
+    :param predict: True if predict step and use state residual and mean function; False for
+    update step
+    :param n: Dimension of states / measurements
+    :param observer: Observer to report wall time to
+    :param angle_noise: Angle noise of every sigma point passed to func, see NoiseStream
+    :return: Unscented mean, Cholesky factor of the covariance and transformed points
+    :raises np.linalg.LinAlgError: If the covariance is not positive definite
+    """
+
+    start = perf_counter()
+
+    points_after_transformation = transform_sigmas(sigmas, dt, func, n, angle_noise)
+
+    if predict:
+        transformed_mean = state_mean(points_after_transformation, wm)
+        residuals = state_residual(points_after_transformation, transformed_mean)
+    else:
+        transformed_mean = np.dot(wm, points_after_transformation)
+        residuals = points_after_transformation - transformed_mean
+
+    transformed_sqrt = covariance_square_root(residuals, wc, noise_sqrt)
+
+    observer.on_stage("perform_ut_sqrt", perf_counter() - start)
+
+    return transformed_mean, transformed_sqrt, points_after_transformation
+
+
+def update_sqrt(
+    xp: np.ndarray,
+    S: np.ndarray,
+    prior_sigma: np.ndarray,
+    dt: float,
+    measurements: np.ndarray,
+    measurement_function: Callable,
+    wm: np.ndarray,
+    wc: np.ndarray,
+    R_sqrt: np.ndarray,
+    observer: FilterObserver = NULL_OBSERVER,
+    angle_noise: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+    Square root form of update. The kalman gain is solved with two triangular solves against the
+    Cholesky factor of the innovation covariance instead of a pseudo-inverse. The state factor
+    is downdated by U = K @ Sz with one rank-1 downdate per column of U, so the covariance is
+    never formed.
+
+    :param xp: Prior predicted mean
+    :param S: Cholesky factor of the prior predicted covariance
+    :param prior_sigma: Prior
+    :param dt: Time step
+    :param measurements: Measurements data
+    :param measurement_function: Function to convert prior sigmas to measurement space
+    :param wm: Weights of means
+    :param wc: Weights of covariance
+    :param R_sqrt: Square root factor of the measurement noise
+    :param observer: Observer to report wall time and innovations to
+    :param angle_noise: Angle noise of every sigma point passed to the measurement function
+    :return: New state estimates and Cholesky factor of the covariance
+    :raises np.linalg.LinAlgError: If the covariance is not positive definite
+    """
+
+    start = perf_counter()
+
+    mean, Sz, sigmas_after_ut = perform_ut_sqrt(
+        prior_sigma,
+        dt,
+        measurement_function,
+        wm,
+        wc,
+        R_sqrt,
+        False,
+        observer=observer,
+        angle_noise=angle_noise,
+    )
+
+    dx = state_residual(prior_sigma, xp)
+    dz = sigmas_after_ut - mean
+    pxz = np.dot(wc * dx.T, dz)
+
+    k = solve_triangular(Sz.T, solve_triangular(Sz, pxz.T, lower=True), lower=False).T
+    innovation = measurements - mean
+    x = xp + np.dot(k, innovation)
+
+    for column in np.dot(k, Sz).T:
+        S = cholupdate(S, column, -1.0)
+
+    observer.on_innovation(innovation, np.dot(Sz, Sz.T))
+    observer.on_stage("update_sqrt", perf_counter() - start)
+
+    return x, S
@@ -1,6 +1,9 @@
+from typing import Optional
+
 from src.preprocessing.low_pass_accelerometer_cleaning import *
 from src.preprocessing.rotation_matrix import *
 from src.preprocessing.angles import *
+from src.model.noise_stream import ANGLE_NOISE_SCALE
 
 
 def get_relative_positions(distance: np.ndarray, heading: np.ndarray) -> np.ndarray:
@@ -21,7 +24,7 @@ def get_relative_positions(distance: np.ndarray, heading: np.ndarray) -> np.ndar
     return relative_positions
 
 
-def fx(sigmas: np.ndarray, dt: float) -> np.ndarray:
+def fx(sigmas: np.ndarray, dt: float, angle_noise: Optional[float] = None) -> np.ndarray:
 
     """
     State transition function to pass sigma points through UT.
@@ -31,14 +34,18 @@ def fx(sigmas: np.ndarray, dt: float) -> np.ndarray:
     roll: x
     :param sigmas: Input generated sigma points
     :param dt: Time step
+    :param angle_noise: Perturbation of the euler angles, drawn from np.random if None
     :return: Array of new states
     """
 
     linear_acc = sigmas[2:5]
     magnitude_acc = magnitude_acceleration(linear_acc)
 
+    if angle_noise is None:
+        angle_noise = np.random.normal(0.0, ANGLE_NOISE_SCALE)
+
     # Big turns not expected in the following sample
-    euler_angles = sigmas[5:] + np.random.normal(0.0, np.pi / 16)
+    euler_angles = sigmas[5:] + angle_noise
 
     R = get_rotation_matrix(euler_angles[0], euler_angles[1], euler_angles[2])
     azimuth, pitch, roll = get_navigation_angles_from_rotation_matrix(R)
@@ -53,3 +60,40 @@ def fx(sigmas: np.ndarray, dt: float) -> np.ndarray:
     waypoint_prior = np.array([newx, newy])
 
     return np.concatenate((waypoint_prior, linear_acc, euler_angles))
+
+
+def fx_batch(sigmas: np.ndarray, dt: float, angle_noise: Optional[np.ndarray] = None) -> np.ndarray:
+
+    """
+    Batched form of fx. Passes all sigma points through the state transition in one pass.
+
+    :param sigmas: Input generated sigma points, shape (2n + 1, n)
+    :param dt: Time step, either a scalar or one time step per sigma point
+    :param angle_noise: Perturbation of the euler angles of every sigma point, shape (2n + 1, 1),
+    drawn from np.random if None
+    :return: Array of new states, shape (2n + 1, n)
+    """
+
+    linear_acc = sigmas[:, 2:5]
+    magnitude_acc = magnitude_acceleration(linear_acc, axis=1)
+
+    if angle_noise is None:
+        angle_noise = np.random.normal(0.0, ANGLE_NOISE_SCALE, (sigmas.shape[0], 1))
+
+    # One angle perturbation per sigma point, as in fx
+    euler_angles = sigmas[:, 5:] + angle_noise
+
+    R = get_rotation_matrix_batch(euler_angles[:, 0], euler_angles[:, 1], euler_angles[:, 2])
+    azimuth = get_navigation_angles_from_rotation_matrix_batch(R)[:, 0]
+
+    velocity = magnitude_acc * dt
+    position = velocity * dt
+
+    heading = -azimuth * (2 * np.pi)
+
+    newx, newy = compute_trajectory_from_heading_batch(heading, position, azimuth, sigmas[:, :2])
+
+    return np.column_stack((newx, newy, linear_acc, euler_angles))
+
+
+fx.batch = fx_batch
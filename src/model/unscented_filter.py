@@ -0,0 +1,316 @@
+import numpy as np
+
+from time import perf_counter
+from scipy.linalg import cholesky
+from typing import Tuple, Iterable, Iterator, Optional
+
+from src.model.unscented_kalman import compute_sigma_weights, compute_sigmas, perform_ut, update
+from src.model.unscented_kalman import state_cross_covariance
+from src.model.state_transition_functions import fx
+from src.model.measurement_functions import hx, imu_hx, IMU_ROWS
+from src.model.square_root_unscented_kalman import compute_sigmas_sqrt, perform_ut_sqrt
+from src.model.square_root_unscented_kalman import update_sqrt, noise_square_root
+from src.model.square_root_unscented_kalman import check_sigma_weights
+from src.model.noise_stream import NoiseStream
+from src.util.metrics import FilterObserver, NULL_OBSERVER
+
+
+class UnscentedFilter:
+
+    """
+    Stateful UKF which takes one sensor sample at a time. Only the current state and covariance
+    are held, so memory stays constant over long sessions unless history recording is enabled.
+
+    In square root mode the Cholesky factor of the covariance is propagated with QR and rank-1
+    updates instead of running an SVD and a pseudo-inverse every step. It needs sigma point
+    parameters with a non-negative central covariance weight (see check_sigma_weights). Whenever
+    the factor stops being positive definite the step falls back to the SVD path.
+
+    With prediction recording enabled, the predicted mean and covariance of every step and the
+    cross covariance between the previous state and the prediction are kept in self.prediction
+    and, if history recording is enabled too, in the history. This lets smoothers run without
+    re-running the state transition.
+    """
+
+    def __init__(
+        self,
+        initial_mu: np.ndarray,
+        initial_covariance: np.ndarray,
+        R: np.ndarray,
+        Q: np.ndarray,
+        alpha: float = 0.3,
+        beta: float = 2.0,
+        kappa: float = -5,
+        record_history: bool = False,
+        observer: FilterObserver = NULL_OBSERVER,
+        square_root: bool = False,
+        record_predictions: bool = False,
+        rng: Optional[np.random.Generator] = None,
+    ):
+
+        """
+        :param initial_mu: Initial state of the system
+        :param initial_covariance: Initial covariance
+        :param R: Measurement covariance matrix
+        :param Q: Process noise matrix
+        :param alpha: Parameter to decide the spread of sigma points
+        :param beta: Parameter to incorporate prior knowledge of the distribution of state
+        :param kappa: Secondary scaling parameter of the sigma points
+        :param record_history: If true, every estimated state and covariance is kept
+        :param observer: Observer to report wall time, innovations and estimates to
+        :param square_root: If true, run the square root UKF
+        :param record_predictions: If true, predicted state, predicted covariance and cross
+        covariance of every step are computed
+        :param rng: Random generator of the fx and hx angle noise, an unseeded one if None. Pass
+        a seeded generator for reproducible runs
+        :raises ValueError: If square_root is set and the sigma point weights are not supported
+        """
+
+        self.x = np.array(initial_mu, dtype=float)
+        self.P = np.array(initial_covariance, dtype=float)
+        self.R = R
+        self.Q = Q
+        self.wm, self.wc, self.lambda_ = compute_sigma_weights(alpha, beta, kappa=kappa)
+        self.record_history = record_history
+        self.observer = observer
+        self.step_count = 0
+        self.noise = NoiseStream(rng, len(self.wm))
+
+        if square_root:
+            check_sigma_weights(self.wc)
+
+        self.square_root = square_root
+        self.S = self._factor(self.P) if square_root else None
+        self.Q_sqrt = noise_square_root(Q) if square_root else None
+        self.R_sqrt = noise_square_root(R) if square_root else None
+        self.imu_R_sqrt = noise_square_root(R[IMU_ROWS, IMU_ROWS]) if square_root else None
+
+        self.record_predictions = record_predictions
+        self.prediction = None
+
+        self._states = []
+        self._covariances = []
+        self._predictions = []
+
+    def step(
+        self,
+        measurement: np.ndarray,
+        dt: float,
+        position_fix: bool = True,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+
+        """
+        Function to predict and update the filter with one sensor sample.
+
+        :param measurement: Sensor measurement of the sample
+        :param dt: Time step since the previous sample
+        :param position_fix: If false, the position of the measurement is not a fix and only the
+        accelerometer and gyroscope readings update the state (see imu_hx)
+        :return: Current state estimate and covariance
+        """
+
+        start = perf_counter()
+
+        # The SVD fallback reuses the noise of a failed square root step
+        noise = self.noise.next()
+
+        if self.S is not None:
+            try:
+                self._step_square_root(measurement, dt, position_fix, noise)
+            except np.linalg.LinAlgError:
+                self.S = None
+
+        if self.S is None:
+            self._step_svd(measurement, dt, position_fix, noise)
+            if self.square_root:
+                self.S = self._factor(self.P)
+
+        self.step_count += 1
+
+        self.observer.on_stage("step", perf_counter() - start)
+        self.observer.on_step(measurement, self.x, self.P)
+
+        if self.record_history:
+            self._states.append(self.x)
+            self._covariances.append(self.P)
+
+        if self.record_history and self.record_predictions:
+            self._predictions.append(self.prediction)
+
+        return self.x, self.P
+
+    def _step_svd(
+        self,
+        measurement: np.ndarray,
+        dt: float,
+        position_fix: bool = True,
+        noise: Tuple[Optional[np.ndarray], Optional[np.ndarray]] = (None, None),
+    ):
+
+        """
+        Predict and update step based on the SVD of the state covariance.
+
+        :param measurement: Sensor measurement of the sample
+        :param dt: Time step since the previous sample
+        :param position_fix: If false, only the IMU readings of the measurement are used
+        :param noise: Angle noise of fx and hx, see NoiseStream
+        """
+
+        sigmas = compute_sigmas(self.lambda_, self.x, self.P, observer=self.observer)
+        fx_noise, hx_noise = noise
+
+        # PREDICT STEP
+        ukf_mean, ukf_cov, sigmas_f = perform_ut(
+            sigmas,
+            dt,
+            fx,
+            self.wm,
+            self.wc,
+            self.Q,
+            True,
+            observer=self.observer,
+            angle_noise=fx_noise,
+        )
+        if self.record_predictions:
+            self.prediction = (
+                ukf_mean,
+                ukf_cov,
+                state_cross_covariance(sigmas, self.x, sigmas_f, ukf_mean, self.wc),
+            )
+
+        # UPDATE STEP
+        rows = slice(None) if position_fix else IMU_ROWS
+        self.x, self.P = update(
+            ukf_mean,
+            ukf_cov,
+            sigmas_f,
+            dt,
+            measurement[rows],
+            hx if position_fix else imu_hx,
+            self.wm,
+            self.wc,
+            self.R[rows, rows],
+            observer=self.observer,
+            angle_noise=hx_noise,
+        )
+
+    def _step_square_root(
+        self,
+        measurement: np.ndarray,
+        dt: float,
+        position_fix: bool = True,
+        noise: Tuple[Optional[np.ndarray], Optional[np.ndarray]] = (None, None),
+    ):
+
+        """
+        Predict and update step of the square root UKF. State is only changed if the whole step
+        succeeds.
+
+        :param measurement: Sensor measurement of the sample
+        :param dt: Time step since the previous sample
+        :param position_fix: If false, only the IMU readings of the measurement are used
+        :param noise: Angle noise of fx and hx, see NoiseStream
+        :raises np.linalg.LinAlgError: If the covariance factor is not positive definite
+        """
+
+        sigmas = compute_sigmas_sqrt(self.lambda_, self.x, self.S)
+        fx_noise, hx_noise = noise
+
+        # PREDICT STEP
+        ukf_mean, ukf_sqrt, sigmas_f = perform_ut_sqrt(
+            sigmas,
+            dt,
+            fx,
+            self.wm,
+            self.wc,
+            self.Q_sqrt,
+            True,
+            observer=self.observer,
+            angle_noise=fx_noise,
+        )
+        # UPDATE STEP
+        rows = slice(None) if position_fix else IMU_ROWS
+        x, S = update_sqrt(
+            ukf_mean,
+            ukf_sqrt,
+            sigmas_f,
+            dt,
+            measurement[rows],
+            hx if position_fix else imu_hx,
+            self.wm,
+            self.wc,
+            self.R_sqrt if position_fix else self.imu_R_sqrt,
+            observer=self.observer,
+            angle_noise=hx_noise,
+        )
+
+        if self.record_predictions:
+            self.prediction = (
+                ukf_mean,
+                np.dot(ukf_sqrt, ukf_sqrt.T),
+                state_cross_covariance(sigmas, self.x, sigmas_f, ukf_mean, self.wc),
+            )
+
+        self.x, self.S, self.P = x, S, np.dot(S, S.T)
+
+    @staticmethod
+    def _factor(P: np.ndarray) -> Optional[np.ndarray]:
+
+        """
+        Function to get the lower Cholesky factor of a covariance.
+
+        :param P: Covariance
+        :return: Cholesky factor, None if the covariance is not positive definite or not finite
+        """
+
+        try:
+            return cholesky(0.5 * (P + P.T), lower=True)
+        except (np.linalg.LinAlgError, ValueError):
+            return None
+
+    def filter(
+        self, samples: Iterable[Tuple[np.ndarray, float]]
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+
+        """
+        Generator to run the filter over a stream of samples.
+
+        :param samples: Iterable of (measurement, time step) pairs
+        :return: Iterator of state estimates and covariances, one per sample
+        """
+
+        for measurement, dt in samples:
+            yield self.step(measurement, dt)
+
+    def history(self) -> Tuple[np.ndarray, np.ndarray]:
+
+        """
+        Function to get recorded history. Only available if the filter records history.
+
+        :return: Array of estimated states and covariance
+        """
+
+        if not self.record_history:
+            raise ValueError("History is only available when record_history is enabled")
+
+        return np.array(self._states), np.array(self._covariances)
+
+    def predictions(self) -> Tuple[np.ndarray, ...]:
+
+        """
+        Function to get recorded predictions. Only available if the filter records history and
+        predictions.
+
+        :return: Arrays of predicted states, predicted covariances and cross covariances between
+        the previous state and the prediction
+        """
+
+        if not (self.record_history and self.record_predictions):
+            raise ValueError(
+                "Predictions are only available when record_history and record_predictions are "
+                "enabled"
+            )
+
+        return tuple(
+            np.array([prediction[i] for prediction in self._predictions]) for i in range(3)
+        )
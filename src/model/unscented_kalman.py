@@ -1,15 +1,22 @@
 import numpy as np
 
-from filterpy.kalman import unscented_transform
+from time import perf_counter
 from scipy.linalg import cholesky, svd
-from typing import Tuple, Callable
+from typing import Callable, Optional, Tuple
 
 from src.preprocessing.time_conversion import timestamp_conversions
 from src.model.waypoint_measurement_fix import fix_waypoint
 from src.model.means_and_residuals import state_mean, state_residual
+from src.util.metrics import FilterObserver, NULL_OBSERVER
 
 
-def compute_sigmas(lambda_: float, x: np.ndarray, P: np.ndarray, n: int = 8) -> np.ndarray:
+def compute_sigmas(
+    lambda_: float,
+    x: np.ndarray,
+    P: np.ndarray,
+    n: int = 8,
+    observer: FilterObserver = NULL_OBSERVER,
+) -> np.ndarray:
 
     """
     To avoid errors due to covariance matrix being positive semidefinite, sigma calculation is
@@ -20,9 +27,12 @@ def compute_sigmas(lambda_: float, x: np.ndarray, P: np.ndarray, n: int = 8) ->
     :param x: State mean
     :param P: State covariance
     :param n: State dimension
+    :param observer: Observer to report wall time to
     :return: Computed sigma points
     """
 
+    start = perf_counter()
+
     u, s, v = svd(P)
     D = np.diag(s)
     c = u @ cholesky((lambda_ + n) * D) @ u.T
@@ -34,6 +44,8 @@ def compute_sigmas(lambda_: float, x: np.ndarray, P: np.ndarray, n: int = 8) ->
         sigmas[k + 1] = np.subtract(x, -c[k])
         sigmas[n + k + 1] = np.subtract(x, c[k])
 
+    observer.on_stage("compute_sigmas", perf_counter() - start)
+
     return sigmas
 
 
@@ -61,6 +73,46 @@ def compute_sigma_weights(
     return wc, wm, lambda_
 
 
+def transform_sigmas(
+    sigmas: np.ndarray,
+    dt: float,
+    func: Callable,
+    n: int = 8,
+    angle_noise: Optional[np.ndarray] = None,
+) -> np.ndarray:
+
+    """
+    Function to pass sigma points through fx / hx. The batched form of the function (see
+    fx.batch / hx.batch) is used when one is available.
+
+    :param sigmas: Sigma points
+    :param dt: Time step
+    :param func: Fx (predict) / Hx (update) function to pass sigma points through
+    :param n: Dimension of states / measurements
+    :param angle_noise: Angle noise of every sigma point, shape (2n + 1, 1), see NoiseStream.
+    If None, func draws its own noise
+    :return: Transformed sigma points
+    """
+
+    batch_func = getattr(func, "batch", None)
+
+    if batch_func is not None:
+        if angle_noise is None:
+            return batch_func(sigmas, dt)
+        return batch_func(sigmas, dt, angle_noise)
+
+    sigma_count = (2 * n) + 1
+    points_after_transformation = np.zeros((sigma_count, n))
+
+    for i in range(sigma_count):
+        if angle_noise is None:
+            points_after_transformation[i] = func(sigmas[i, :], dt)
+        else:
+            points_after_transformation[i] = func(sigmas[i, :], dt, angle_noise[i, 0])
+
+    return points_after_transformation
+
+
 def perform_ut(
     sigmas: np.ndarray,
     dt: float,
@@ -70,6 +122,8 @@ def perform_ut(
     noise: np.ndarray,
     predict: bool,
     n: int = 8,
+    observer: FilterObserver = NULL_OBSERVER,
+    angle_noise: Optional[np.ndarray] = None,
 ) -> Tuple[np.ndarray, ...]:
 
     """
@@ -78,35 +132,55 @@ def perform_ut(
     :param n: Dimension of states / measurements
     :param sigmas: Sigma points
     :param dt: Time step
-    :param func: Fx (predict) / Hx (update) function to pass sigma points through
+    :param func: Fx (predict) / Hx (update) function to pass sigma points through. If the
+    function has a `batch` attribute, it is called once with all sigma points instead
     :param wm: Weights of means
     :param wc: Weights of covariance
     :param noise: Noise matrix
     :param predict: True if predict step and use state residual and mean function; False for
     update step
+    :param observer: Observer to report wall time to
+    :param angle_noise: Angle noise of every sigma point passed to func, see NoiseStream
     :return: Unscented mean and covariance
     """
 
-    sigma_count = (2 * n) + 1
-    points_after_transformation = np.zeros((sigma_count, n))
+    start = perf_counter()
 
-    for i in range(sigma_count):
-        points_after_transformation[i] = func(sigmas[i, :], dt)
+    points_after_transformation = transform_sigmas(sigmas, dt, func, n, angle_noise)
 
     if predict:
-        residual_x = state_residual
-        x_mean = state_mean
+        transformed_mean = state_mean(points_after_transformation, wm)
+        residuals = state_residual(points_after_transformation, transformed_mean)
     else:
-        residual_x = np.subtract
-        x_mean = None
+        transformed_mean = np.dot(wm, points_after_transformation)
+        residuals = points_after_transformation - transformed_mean
 
-    transformed_mean, transformed_covariance = unscented_transform(
-        points_after_transformation, wm, wc, noise, x_mean, residual_x
-    )
+    transformed_covariance = np.dot(wc * residuals.T, residuals) + noise
+
+    observer.on_stage("perform_ut", perf_counter() - start)
 
     return transformed_mean, transformed_covariance, points_after_transformation
 
 
+def state_cross_covariance(
+    sigmas: np.ndarray, x: np.ndarray, sigmas_f: np.ndarray, x_f: np.ndarray, wc: np.ndarray
+) -> np.ndarray:
+
+    """
+    Function to compute the cross covariance between the state and its prediction from the
+    sigma points before and after the state transition.
+
+    :param sigmas: Sigma points of the state
+    :param x: State mean
+    :param sigmas_f: Sigma points passed through fx
+    :param x_f: Predicted state mean
+    :param wc: Weights of covariance
+    :return: Cross covariance
+    """
+
+    return np.dot(wc * state_residual(sigmas, x).T, state_residual(sigmas_f, x_f))
+
+
 def update(
     xp: np.ndarray,
     pcov: np.ndarray,
@@ -117,6 +191,8 @@ def update(
     wm: np.ndarray,
     wc: np.ndarray,
     R: np.ndarray,
+    observer: FilterObserver = NULL_OBSERVER,
+    angle_noise: Optional[np.ndarray] = None,
 ) -> Tuple[np.ndarray, np.ndarray]:
 
     """
@@ -133,24 +209,37 @@ def update(
     :param wm: Weights of means
     :param wc: Weights of covariance
     :param R: Measurement noise
+    :param observer: Observer to report wall time and innovations to
+    :param angle_noise: Angle noise of every sigma point passed to the measurement function
     :return: New state estimates and covariance
     """
 
+    start = perf_counter()
+
     mean, covariance, sigmas_after_ut = perform_ut(
-        prior_sigma, dt, measurement_function, wm, wc, R, False
+        prior_sigma,
+        dt,
+        measurement_function,
+        wm,
+        wc,
+        R,
+        False,
+        observer=observer,
+        angle_noise=angle_noise,
     )
 
-    pxz = np.zeros((len(mean), len(mean)))
-
-    for i, sigmas_h in enumerate(sigmas_after_ut):
-        dx = state_residual(prior_sigma[i], xp)
-        dz = sigmas_h - mean
-        pxz += wc[i] * np.outer(dx, dz)
+    dx = state_residual(prior_sigma, xp)
+    dz = sigmas_after_ut - mean
+    pxz = np.dot(wc * dx.T, dz)
 
+    innovation = measurements - mean
     k = np.dot(pxz, np.linalg.pinv(covariance))
-    x = xp + np.dot(k, measurements - mean)
+    x = xp + np.dot(k, innovation)
     p = pcov - np.dot(k, covariance).dot(k.T)
 
+    observer.on_innovation(innovation, covariance)
+    observer.on_stage("update", perf_counter() - start)
+
     return x, p
 
 
@@ -1,7 +1,44 @@
-import pandas as pd
 import numpy as np
 
 
+def nearest_sample_indices(t: np.ndarray, timestamps: np.ndarray) -> np.ndarray:
+
+    """
+    Function to find the index of the sample nearest in time to every timestamp with a binary
+    search, which takes O(M log N) time and O(M) memory instead of building an M x N distance
+    matrix. Like argmin of the distances, ties go to the lowest sample index.
+
+    :param t: Sample timestamps
+    :param timestamps: Timestamps to look up
+    :return: Index of the nearest sample for every timestamp
+    """
+
+    if len(t) == 1:
+        return np.zeros(len(timestamps), dtype=int)
+
+    # Timestamps are normally sorted already, a stable argsort keeps ties in their original order
+    if np.all(t[1:] >= t[:-1]):
+        sorter, t_sorted = np.arange(len(t)), t
+    else:
+        sorter = np.argsort(t, kind="stable")
+        t_sorted = t[sorter]
+
+    right = np.clip(np.searchsorted(t_sorted, timestamps), 1, len(t) - 1)
+    left = right - 1
+
+    # Nearest sample below and above, each as the first sample index of its value
+    left_index = sorter[np.searchsorted(t_sorted, t_sorted[left])]
+    right_index = sorter[right]
+    left_distance = np.abs(timestamps - t_sorted[left])
+    right_distance = np.abs(t_sorted[right] - timestamps)
+
+    use_left = (left_distance < right_distance) | (
+        (left_distance == right_distance) & (left_index < right_index)
+    )
+
+    return np.where(use_left, left_index, right_index)
+
+
 def fix_waypoint(t: np.ndarray, way: np.ndarray, estimate: bool = False) -> np.ndarray:
 
     """
@@ -18,8 +55,7 @@ def fix_waypoint(t: np.ndarray, way: np.ndarray, estimate: bool = False) -> np.n
     wy = np.empty_like(t)
     wx[:] = np.nan
     wy[:] = np.nan
-    waypoint_timestamps = way[:, 0]
-    indices = np.abs(t - waypoint_timestamps[:, None]).argmin(axis=1)
+    indices = nearest_sample_indices(t, way[:, 0])
 
     wx[indices] = way[:, 1]
     wy[indices] = way[:, 2]
@@ -30,8 +66,98 @@ def fix_waypoint(t: np.ndarray, way: np.ndarray, estimate: bool = False) -> np.n
 
     if estimate:
         return np.column_stack((wx, wy))
-    else:
 
-        way_df = pd.DataFrame({"x": wx, "y": wy}).interpolate(method="linear")
+    # Linear interpolation over sample positions, leading gaps stay NaN and trailing gaps take
+    # the last waypoint
+    positions = np.arange(len(t))
+    for w in (wx, wy):
+        known = np.flatnonzero(~np.isnan(w))
+        if len(known):
+            missing = positions[known[0] :]
+            w[missing] = np.interp(missing, known, w[known])
+
+    return np.column_stack((wx, wy))
+
+
+def _ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+
+    """
+    Function to concatenate the index ranges starts[i] : starts[i] + counts[i] without a loop.
+
+    :param starts: First index of every range
+    :param counts: Length of every range
+    :return: Indices of all ranges
+    """
+
+    range_starts = np.cumsum(counts) - counts
+
+    return np.arange(counts.sum()) + np.repeat(starts - range_starts, counts)
+
+
+def fix_waypoints(
+    timestamps: np.ndarray,
+    offsets: np.ndarray,
+    waypoints: np.ndarray,
+    waypoint_offsets: np.ndarray,
+    estimate: bool = False,
+) -> np.ndarray:
+
+    """
+    Function to resample the waypoints of many traces in one vectorized pass, see fix_waypoint.
+    Samples offsets[i] : offsets[i + 1] and waypoints waypoint_offsets[i] : waypoint_offsets[i + 1]
+    belong to trace i. Timestamps are shifted so that the traces follow each other on one time
+    axis, waypoints are clipped to the time span of their trace and one nearest sample search
+    covers all traces.
+
+    :param timestamps: Accelerometer data timestamps of all traces
+    :param offsets: Sample offsets of the traces, every trace needs at least one sample
+    :param waypoints: Waypoint data of all traces
+    :param waypoint_offsets: Waypoint offsets of the traces, every trace needs at least one
+    waypoint
+    :param estimate: If estimate is true, return estimated way point data
+    :return: Resampled waypoint data, shape (len(timestamps), 2)
+    """
+
+    trace_count = len(offsets) - 1
+    starts, lengths = offsets[:-1], np.diff(offsets)
+    waypoint_traces = np.repeat(np.arange(trace_count), np.diff(waypoint_offsets))
+
+    # Relative timestamps keep the shifted time axis small enough for exact float64 arithmetic.
+    # Traces are one unit apart, so the nearest sample of a clipped waypoint is in its own trace
+    first = np.minimum.reduceat(timestamps, starts)
+    durations = np.maximum.reduceat(timestamps, starts) - first
+    shifts = np.concatenate(([0.0], np.cumsum(durations + 1.0)[:-1]))
+    sample_time = timestamps + np.repeat(shifts - first, lengths)
+    waypoint_time = np.clip(
+        waypoints[:, 0] - first[waypoint_traces], 0.0, durations[waypoint_traces]
+    )
+    indices = nearest_sample_indices(sample_time, waypoint_time + shifts[waypoint_traces])
+
+    fixed = np.full((len(timestamps), 2), np.nan)
+    fixed[indices] = waypoints[:, 1:3]
+
+    # Samples before the sample of the first waypoint of a trace take its position
+    first_waypoints = waypoint_offsets[:-1]
+    leading_counts = indices[first_waypoints] - starts
+    fixed[_ranges(starts, leading_counts)] = np.repeat(
+        waypoints[first_waypoints, 1:3], leading_counts, axis=0
+    )
+
+    if estimate:
+        return fixed
+
+    # The first sample of every trace is known now, so one interpolation over sample positions
+    # covers all traces. Samples after the last waypoint of a trace take its position instead of
+    # being interpolated towards the next trace
+    positions = np.arange(len(timestamps))
+    known = np.flatnonzero(~np.isnan(fixed[:, 0]))
+    for column in fixed.T:
+        column[:] = np.interp(positions, known, column[known])
+
+    last_known = np.maximum.reduceat(indices, first_waypoints)
+    trailing_counts = starts + lengths - last_known - 1
+    fixed[_ranges(last_known + 1, trailing_counts)] = np.repeat(
+        fixed[last_known], trailing_counts, axis=0
+    )
 
-        return way_df.values
+    return fixed
@@ -0,0 +1,336 @@
+import numpy as np
+
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from scipy.sparse import csr_matrix
+from scipy.spatial import cKDTree
+
+from src.util.definitions import FINGERPRINT_PATH
+from src.scripts.read_data import RadioData
+
+# RSSI of an access point which is not in a scan, fingerprints store RSSI - MISSING_RSSI so that
+# missing access points are the implicit zeros of the sparse matrix
+MISSING_RSSI = -100.0
+
+# Number of features fingerprints are reduced to before they go into the KD-tree
+FEATURE_DIMENSIONS = 32
+
+
+def fingerprint_index_path(building: str, floor: str, root: Path = FINGERPRINT_PATH) -> Path:
+
+    """
+    Function to get the file of the fingerprint index of a floor.
+
+    :param building: Building
+    :param floor: Floor
+    :param root: Fingerprint index directory
+    :return: Path of the index file
+    """
+
+    return root / building / f"{floor}.npz"
+
+
+def scan_fingerprints(wifi: RadioData, bssids: np.ndarray) -> Tuple[np.ndarray, csr_matrix]:
+
+    """
+    Function to turn Wi-Fi scans into sparse fingerprints. Every id of the scan vocabulary is
+    mapped to its column in bssids once, readings of BSSIDs which are not in bssids are dropped.
+    If a scan has a BSSID twice, the strongest RSSI is kept.
+
+    :param wifi: Wi-Fi data
+    :param bssids: Sorted BSSIDs of the fingerprint columns
+    :return: Scan timestamps and fingerprints (RSSI - MISSING_RSSI), shape (scans, len(bssids))
+    """
+
+    if not len(wifi) or not len(bssids):
+        return wifi.timestamps, csr_matrix((len(wifi.timestamps), len(bssids)))
+
+    vocabulary_columns = np.clip(np.searchsorted(bssids, wifi.vocabulary), 0, len(bssids) - 1)
+    vocabulary_known = bssids[vocabulary_columns] == wifi.vocabulary
+
+    rows = np.repeat(np.arange(len(wifi.timestamps)), np.diff(wifi.offsets))
+    columns = vocabulary_columns[wifi.ids]
+    values = np.clip(wifi.rssi - MISSING_RSSI, 1.0, None)
+
+    known = vocabulary_known[wifi.ids]
+    rows, columns, values = rows[known], columns[known], values[known]
+
+    # Strongest reading first within every (scan, BSSID) pair, then keep the first of each pair
+    order = np.lexsort((-values, columns, rows))
+    rows, columns, values = rows[order], columns[order], values[order]
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = (rows[1:] != rows[:-1]) | (columns[1:] != columns[:-1])
+
+    fingerprints = csr_matrix(
+        (values[first], (rows[first], columns[first])), shape=(len(wifi.timestamps), len(bssids))
+    )
+
+    return wifi.timestamps, fingerprints
+
+
+class FingerprintIndex:
+
+    """
+    Wi-Fi fingerprint index of one floor. Every fingerprint is a sparse row of RSSI values over
+    the BSSIDs seen on the floor, attached to the position where the scan was taken.
+
+    Fingerprints are projected to FEATURE_DIMENSIONS features with a truncated SVD and the
+    features go into a KD-tree, so a batch of scans is answered with one vectorized projection
+    and one tree query. Positions of the k nearest fingerprints are averaged, weighted by inverse
+    feature distance.
+    """
+
+    def __init__(
+        self,
+        bssids: np.ndarray,
+        fingerprints: csr_matrix,
+        positions: np.ndarray,
+        components: np.ndarray,
+    ):
+
+        """
+        :param bssids: Sorted BSSIDs of the fingerprint columns
+        :param fingerprints: Fingerprints (RSSI - MISSING_RSSI), shape (N, len(bssids))
+        :param positions: Position (x, y) of every fingerprint, shape (N, 2)
+        :param components: Projection of fingerprints to features, shape (features, len(bssids))
+        """
+
+        self.bssids = bssids
+        self.fingerprints = csr_matrix(fingerprints)
+        self.positions = positions
+        self.components = components
+        self.tree = cKDTree(self.reduce(self.fingerprints))
+
+    @classmethod
+    def fit(
+        cls,
+        bssids: np.ndarray,
+        fingerprints: csr_matrix,
+        positions: np.ndarray,
+        dimensions: int = FEATURE_DIMENSIONS,
+    ) -> "FingerprintIndex":
+
+        """
+        Function to build an index, fitting the feature projection to the fingerprints. Floors
+        with at most dimensions BSSIDs are indexed on the raw fingerprints.
+
+        :param bssids: Sorted BSSIDs of the fingerprint columns
+        :param fingerprints: Fingerprints (RSSI - MISSING_RSSI), shape (N, len(bssids))
+        :param positions: Position (x, y) of every fingerprint, shape (N, 2)
+        :param dimensions: Number of features
+        :return: Fingerprint index
+        """
+
+        if len(bssids) <= dimensions:
+            components = np.eye(len(bssids))
+        else:
+            # Only building an index needs scikit-learn, loading and querying one does not
+            from sklearn.decomposition import TruncatedSVD
+
+            svd = TruncatedSVD(dimensions, random_state=0)
+            components = svd.fit(fingerprints).components_
+
+        return cls(bssids, fingerprints, positions, components)
+
+    def reduce(self, fingerprints: csr_matrix) -> np.ndarray:
+
+        """
+        Function to project fingerprints to features.
+
+        :param fingerprints: Fingerprints, shape (N, len(bssids))
+        :return: Features, shape (N, features)
+        """
+
+        return np.asarray(fingerprints @ self.components.T)
+
+    def query_fingerprints(
+        self, fingerprints: csr_matrix, k: int = 5
+    ) -> Tuple[np.ndarray, np.ndarray]:
+
+        """
+        Function to estimate the positions of a batch of fingerprints from their k nearest
+        neighbours.
+
+        :param fingerprints: Fingerprints, shape (M, len(bssids))
+        :param k: Number of neighbours
+        :return: Estimated positions, shape (M, 2), and neighbour feature distances, shape (M, k)
+        """
+
+        k = min(k, len(self.positions))
+        distances, neighbours = self.tree.query(self.reduce(fingerprints), k=k)
+        distances = distances.reshape(fingerprints.shape[0], k)
+        neighbours = neighbours.reshape(fingerprints.shape[0], k)
+
+        weights = 1.0 / (distances + 1e-6)
+        weights /= weights.sum(axis=1, keepdims=True)
+        positions = np.einsum("mk,mkd->md", weights, self.positions[neighbours])
+
+        return positions, distances
+
+    def query(self, wifi: RadioData, k: int = 5) -> np.ndarray:
+
+        """
+        Function to get a position fix for every Wi-Fi scan of a trace. Scans without any BSSID
+        of the index get no fix. Fixes have the layout of waypoints, so they can go through
+        fix_measurements and update in place of (or in addition to) the real waypoints.
+
+        :param wifi: Wi-Fi data
+        :param k: Number of neighbours
+        :return: Position fixes (timestamp, x, y), shape (scans, 3)
+        """
+
+        timestamps, fingerprints = scan_fingerprints(wifi, self.bssids)
+        found = np.diff(fingerprints.indptr) > 0
+
+        if not np.any(found) or not len(self.positions):
+            return np.empty((0, 3))
+
+        positions, _ = self.query_fingerprints(fingerprints[found], k)
+
+        return np.column_stack((timestamps[found], positions))
+
+    def save(self, path: Path):
+
+        """
+        Function to save the index. The KD-tree is rebuilt on load.
+
+        :param path: Path of the index file
+        """
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            path,
+            bssids=self.bssids,
+            data=self.fingerprints.data,
+            indices=self.fingerprints.indices,
+            indptr=self.fingerprints.indptr,
+            shape=np.array(self.fingerprints.shape),
+            positions=self.positions,
+            components=self.components,
+        )
+
+    @classmethod
+    def load(
+        cls, building: str, floor: str, root: Path = FINGERPRINT_PATH
+    ) -> Optional["FingerprintIndex"]:
+
+        """
+        Function to load the index of a floor.
+
+        :param building: Building
+        :param floor: Floor
+        :param root: Fingerprint index directory
+        :return: Fingerprint index, None if the floor has no index
+        """
+
+        path = fingerprint_index_path(building, floor, root)
+
+        if not path.exists():
+            return None
+
+        with np.load(path, allow_pickle=False) as index:
+            fingerprints = csr_matrix(
+                (index["data"], index["indices"], index["indptr"]), shape=tuple(index["shape"])
+            )
+            return cls(index["bssids"], fingerprints, index["positions"], index["components"])
+
+    def profile_distance(self, wifi: RadioData) -> float:
+
+        """
+        Function to measure how well the Wi-Fi scans of a trace fit the floor, independently of
+        the feature projection so floors can be compared with each other. Every BSSID of the
+        floor has a profile, its mean RSSI over the fingerprints it appears in. The distance is
+        the mean absolute difference between the readings of the scans and the profiles, readings
+        of BSSIDs which are not on the floor count with their full RSSI - MISSING_RSSI.
+
+        :param wifi: Wi-Fi data
+        :return: Mean distance per reading, inf if the trace has no readings
+        """
+
+        readings = np.clip(wifi.rssi - MISSING_RSSI, 1.0, None)
+        if not len(readings):
+            return np.inf
+
+        _, fingerprints = scan_fingerprints(wifi, self.bssids)
+        counts = np.bincount(self.fingerprints.indices, minlength=len(self.bssids))
+        sums = np.bincount(
+            self.fingerprints.indices, weights=self.fingerprints.data, minlength=len(self.bssids)
+        )
+        profiles = sums / np.maximum(counts, 1)
+
+        known = fingerprints.data
+        known_distance = np.abs(known - profiles[fingerprints.indices]).sum()
+
+        return float((known_distance + readings.sum() - known.sum()) / len(readings))
+
+
+@lru_cache(maxsize=None)
+def load_building_indices(
+    building: str, root: Path = FINGERPRINT_PATH
+) -> Dict[str, FingerprintIndex]:
+
+    """
+    Function to load the indices of every floor of a building. Indices are cached per process,
+    so every trace of a building a worker runs reuses them.
+
+    :param building: Building
+    :param root: Fingerprint index directory
+    :return: Fingerprint index of every indexed floor, keyed by floor
+    """
+
+    return {
+        path.stem: FingerprintIndex.load(building, path.stem, root)
+        for path in sorted((root / building).glob("*.npz"))
+    }
+
+
+def locate_floor(wifi: RadioData, indices: Dict[str, FingerprintIndex]) -> Optional[str]:
+
+    """
+    Function to find the floor of a trace whose floor is not known, as the floor whose
+    fingerprint profiles are closest to the Wi-Fi scans of the trace (see profile_distance).
+
+    :param wifi: Wi-Fi data
+    :param indices: Fingerprint index of every candidate floor
+    :return: Closest floor, None if there are no candidates or the trace has no Wi-Fi readings
+    """
+
+    distances = {floor: index.profile_distance(wifi) for floor, index in indices.items()}
+    floor = min(distances, key=distances.get, default=None)
+
+    if floor is None or not np.isfinite(distances[floor]):
+        return None
+
+    return floor
+
+
+def locate_position_fixes(
+    building: str, wifi: RadioData, root: Path = FINGERPRINT_PATH
+) -> Tuple[str, np.ndarray]:
+
+    """
+    Function to locate the floor of a trace whose floor is not known (test traces) and to get
+    its Wi-Fi position fixes on that floor, which take the place of the missing waypoints.
+
+    :param building: Building of the trace
+    :param wifi: Wi-Fi data
+    :param root: Fingerprint index directory
+    :return: Floor and position fixes (timestamp, x, y)
+    :raises ValueError: If the building has no indices, the trace has no Wi-Fi readings or no
+    scan matches the index of the floor
+    """
+
+    indices = load_building_indices(building, root)
+    if not indices:
+        raise ValueError(f"No fingerprint indices for building {building}")
+
+    floor = locate_floor(wifi, indices)
+    if floor is None:
+        raise ValueError("Trace has no Wi-Fi readings to locate its floor")
+
+    position_fixes = indices[floor].query(wifi)
+    if not len(position_fixes):
+        raise ValueError(f"No Wi-Fi scan of the trace matches the fingerprint index of {floor}")
+
+    return floor, position_fixes
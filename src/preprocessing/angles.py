@@ -1,22 +1,20 @@
 import numpy as np
-from typing import Tuple
+from typing import Tuple, Union
 
 
-def normalize_angles(angle: float) -> float:
+def normalize_angles(angle: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
 
     """
     Normalize angles to range [-pi, pi)
 
-    :param angle: Angle in radians
-    :return: Normalized angle
+    :param angle: Angle in radians, a scalar or an array of angles
+    :return: Normalized angle, same shape as the input
     """
 
-    angle = angle % (2 * np.pi)
+    angle = np.mod(angle, 2 * np.pi)
+    angle = np.where(angle > np.pi, angle - 2 * np.pi, angle)
 
-    if angle > np.pi:
-        angle -= 2 * np.pi
-
-    return angle
+    return angle[()]
 
 
 def compute_trajectory_from_heading(
@@ -46,3 +44,22 @@ def compute_trajectory_from_heading(
     new_positiony = yposition_at_turn_start - (turning_radius * np.cos(orientation + turn_angle))
 
     return new_positionx, new_positiony
+
+
+def compute_trajectory_from_heading_batch(
+    heading: np.ndarray, distance: np.ndarray, orientation: np.ndarray, previous_state: np.ndarray
+) -> Tuple[np.ndarray, ...]:
+
+    """
+    Batched form of compute_trajectory_from_heading.
+
+    :param heading: Heading angles, shape (N,)
+    :param distance: Distances travelled in the timestep, shape (N,)
+    :param orientation: Orientation angles, shape (N,)
+    :param previous_state: Previous positions, shape (N, 2)
+    :return: New positions (x, y), each of shape (N,)
+    """
+
+    return compute_trajectory_from_heading(
+        heading, distance, orientation, (previous_state[..., 0], previous_state[..., 1])
+    )
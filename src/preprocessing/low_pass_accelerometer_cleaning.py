@@ -1,15 +1,18 @@
 import numpy as np
 
+from typing import Optional
 
-def magnitude_acceleration(acc: np.ndarray) -> np.ndarray:
+
+def magnitude_acceleration(acc: np.ndarray, axis: Optional[int] = None) -> np.ndarray:
 
     """
     Function to compute acceleration magnitude from tri-axial acccelerometer data.
 
     :param acc: Tri-axial accelerometer data
+    :param axis: Axis holding the three components; None sums over the whole array
     :return: Acceleration magnitude
     """
-    return np.sqrt(np.sum(acc ** 2))
+    return np.sqrt(np.sum(acc ** 2, axis=axis))
 
 
 def get_linear_acceleration(acceleration: np.ndarray, alpha: float = 0.8) -> np.ndarray:
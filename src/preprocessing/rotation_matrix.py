@@ -52,3 +52,52 @@ def get_navigation_angles_from_rotation_matrix(R: np.ndarray) -> np.ndarray:
     gamma = np.arctan2(-R[2, 0], R[2, 2])
 
     return np.array([alpha, beta, gamma])
+
+
+def get_rotation_matrix_batch(
+    yaw_body: np.ndarray, pitch_body: np.ndarray, roll_body: np.ndarray
+) -> np.ndarray:
+
+    """
+    Batched form of get_rotation_matrix. Builds one rotation matrix per set of euler angles in a
+    single pass.
+
+    :param yaw_body: (phi) Euler angles around z-axis, shape (N,)
+    :param pitch_body: (theta) Euler angles around y-axis, shape (N,)
+    :param roll_body: (gamma) Euler angles around x-axis, shape (N,)
+    :return: Rotation matrices, shape (N, 3, 3)
+    """
+
+    cos_yaw, sin_yaw = np.cos(yaw_body), np.sin(yaw_body)
+    cos_pitch, sin_pitch = np.cos(pitch_body), np.sin(pitch_body)
+    cos_roll, sin_roll = np.cos(roll_body), np.sin(roll_body)
+
+    R = np.empty(np.shape(yaw_body) + (3, 3))
+
+    R[..., 0, 0] = cos_yaw * cos_pitch
+    R[..., 0, 1] = (cos_yaw * sin_pitch * sin_roll) - (sin_yaw * cos_roll)
+    R[..., 0, 2] = (cos_yaw * sin_pitch * cos_roll) + (sin_yaw * sin_pitch)
+    R[..., 1, 0] = sin_yaw * cos_pitch
+    R[..., 1, 1] = (sin_yaw * sin_pitch * sin_roll) + (cos_yaw * cos_roll)
+    R[..., 1, 2] = (sin_yaw * sin_pitch * cos_roll) - (cos_yaw * sin_roll)
+    R[..., 2, 0] = -sin_pitch
+    R[..., 2, 1] = cos_pitch * sin_roll
+    R[..., 2, 2] = cos_pitch * cos_roll
+
+    return R
+
+
+def get_navigation_angles_from_rotation_matrix_batch(R: np.ndarray) -> np.ndarray:
+
+    """
+    Batched form of get_navigation_angles_from_rotation_matrix.
+
+    :param R: Rotation matrices, shape (N, 3, 3)
+    :return: Euler angles in navigation frame (alpha, beta, gamma), shape (N, 3)
+    """
+
+    alpha = np.arctan2(R[..., 0, 1], R[..., 1, 1])
+    beta = np.arcsin(-R[..., 2, 1])
+    gamma = np.arctan2(-R[..., 2, 0], R[..., 2, 2])
+
+    return np.stack((alpha, beta, gamma), axis=-1)
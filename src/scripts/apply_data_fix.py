@@ -1,38 +1,224 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
 from src.util.definitions import *
 from src.scripts.fix_data import line_check
+from src.scripts.dataset_catalog import DatasetCatalog
+
+
+def fix_file(sensor_file: Path, dry_run: bool = False) -> Tuple[int, str]:
+
+    """
+    Function to split erroneous data lines of one trace file. The file is streamed once and
+    every erroneous line is replaced by its split lines at the same position. Lines go to a
+    temporary file next to the original which then atomically replaces it, so an interrupted
+    run never leaves a partial trace. If the file has no erroneous lines the temporary file is
+    dropped and the original is left untouched.
+
+    :param sensor_file: Path of data text file
+    :param dry_run: If true, erroneous lines are only counted and nothing is written
+    :return: Number of erroneous lines and sha1 hex digest of the (corrected) file content
+    """
+
+    error_lines = 0
+    digest = hashlib.sha1()
+
+    if dry_run:
+        temp_file = nullcontext()
+    else:
+        temp_file = tempfile.NamedTemporaryFile(
+            "w", encoding="utf8", newline="", dir=sensor_file.parent, suffix=".tmp", delete=False
+        )
+
+    try:
+        with sensor_file.open("r", encoding="utf8", newline="") as f, temp_file:
+            for sensor_data_line in f:
+                sensor_line_split_delimiter = sensor_data_line.rstrip("\r\n").split("\t")
+
+                if len(sensor_line_split_delimiter) > 10:
+                    error_lines += 1
+                    sensor_data_line = "".join(
+                        "\t".join(sensor_corrected_line) + "\n"
+                        for sensor_corrected_line in line_check(sensor_line_split_delimiter)
+                    )
+
+                digest.update(sensor_data_line.encode("utf8"))
+                if not dry_run:
+                    temp_file.write(sensor_data_line)
+
+        if not dry_run and error_lines:
+            shutil.copymode(sensor_file, temp_file.name)
+            os.replace(temp_file.name, sensor_file)
+    finally:
+        if not dry_run and os.path.exists(temp_file.name):
+            os.unlink(temp_file.name)
+
+    return error_lines, digest.hexdigest()
+
+
+def _fix_file_job(job: Tuple[Path, bool]) -> Tuple[Path, int, Optional[Dict[str, object]], str]:
+
+    """
+    Process pool job to fix one file and stat it afterwards for the manifest. Errors are
+    returned instead of raised, so one unreadable file does not abort the whole run.
+
+    :param job: Path of data text file and dry run flag
+    :return: Path, number of erroneous lines, manifest entry (size, modification time and
+    content digest) and error, the entry is None and the error is set if the file failed
+    """
+
+    sensor_file, dry_run = job
+
+    try:
+        error_lines, digest = fix_file(sensor_file, dry_run)
+        stat = sensor_file.stat()
+    except Exception as error:
+        return sensor_file, 0, None, repr(error)
+
+    entry = dict(size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha1=digest)
+
+    return sensor_file, error_lines, entry, ""
 
 
-def fix_data_issues():
+def load_manifest(manifest_path: Path = DATA_FIX_MANIFEST_PATH) -> Dict[str, Dict[str, object]]:
 
     """
-    Script to apply data fix. Splits erroneous data lines and saves the modified text file.
+    Function to load the manifest of fixed files.
+
+    :param manifest_path: Path of the manifest
+    :return: Manifest entries keyed by file path, empty if there is no manifest yet
     """
 
-    for sensor_file in sensor_train_files:
-        number_of_corrected_lines = 1
-        with sensor_file.open("r+", encoding="utf8") as f:
+    try:
+        with manifest_path.open("r", encoding="utf8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(
+    manifest: Dict[str, Dict[str, object]], manifest_path: Path = DATA_FIX_MANIFEST_PATH
+):
+
+    """
+    Function to atomically write the manifest of fixed files.
+
+    :param manifest: Manifest entries keyed by file path
+    :param manifest_path: Path of the manifest
+    """
+
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with tempfile.NamedTemporaryFile(
+        "w", encoding="utf8", dir=manifest_path.parent, suffix=".tmp", delete=False
+    ) as f:
+        json.dump(manifest, f)
+
+    os.replace(f.name, manifest_path)
+
+
+def fix_data_issues(
+    sensor_files: Optional[List[Path]] = None,
+    dry_run: bool = False,
+    workers: Optional[int] = None,
+    manifest_path: Path = DATA_FIX_MANIFEST_PATH,
+    force: bool = False,
+) -> Dict[str, int]:
+
+    """
+    Script to apply data fix. Splits erroneous data lines of every training trace in a process
+    pool. Checked files are recorded in a manifest with their size, modification time and
+    content hash, and files whose size and modification time still match the manifest are
+    skipped, so the fix is cheap and safe to re-run. A file which fails is reported and checked
+    again on the next run.
+
+    :param sensor_files: Trace files to fix, defaults to all training traces in the catalog
+    :param dry_run: If true, erroneous lines are only counted, no file or manifest is written
+    :param workers: Number of worker processes, defaults to the number of cores
+    :param manifest_path: Path of the manifest
+    :param force: If true, every file is checked, entries of other files stay in the manifest
+    :return: Number of checked, skipped, fixed and failed files and of erroneous lines
+    """
+
+    if sensor_files is None:
+        with DatasetCatalog() as catalog:
+            catalog.refresh(TRAIN_PATH)
+            sensor_files = catalog.traces(TRAIN_PATH)
+
+    manifest = load_manifest(manifest_path)
+    pending = []
+
+    for sensor_file in sensor_files:
+        entry = manifest.get(str(sensor_file))
+        stat = sensor_file.stat()
+        if (
+            force
+            or entry is None
+            or (entry["size"], entry["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns)
+        ):
+            pending.append(sensor_file)
+
+    counts = dict(checked=len(pending), skipped=len(sensor_files) - len(pending))
+    counts.update(fixed_files=0, error_lines=0, failed_files=0)
+
+    # Digests computed before an interruption or error are kept for the next run
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            jobs = ((sensor_file, dry_run) for sensor_file in pending)
+
+            for sensor_file, error_lines, entry, error in executor.map(
+                _fix_file_job, jobs, chunksize=16
+            ):
+                if entry is None:
+                    counts["failed_files"] += 1
+                    manifest.pop(str(sensor_file), None)
+                    print(f"{sensor_file} failed: {error}", file=sys.stderr)
+                    continue
+
+                if error_lines:
+                    counts["fixed_files"] += 1
+                    counts["error_lines"] += error_lines
+                    print(f"{sensor_file}: {error_lines} error lines", file=sys.stderr)
+
+                manifest[str(sensor_file)] = entry
+    finally:
+        if not dry_run:
+            save_manifest(manifest, manifest_path)
+
+    return counts
 
-            sensor_text = f.read()
-            for sensor_line_index, sensor_data_line in enumerate(sensor_text.splitlines()):
 
-                sensor_line_split_delimiter = sensor_data_line.split("\t")
+if __name__ == "__main__":
 
-                if len(sensor_line_split_delimiter) <= 10:
-                    pass
-                else:
-                    sensor_split_lines = line_check(sensor_line_split_delimiter)
-                    print("Error lines found in file: ", sensor_file)
-                    print("# error lines", len(sensor_split_lines))
-                    for correct_line_index, sensor_corrected_line in enumerate(sensor_split_lines):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-n", "--dry-run", help="Only count erroneous lines, do not write", action="store_true"
+    )
+    parser.add_argument(
+        "-w", "--workers", help="Number of worker processes", type=int, default=os.cpu_count()
+    )
+    parser.add_argument(
+        "--force", help="Ignore the manifest and check every file", action="store_true"
+    )
+    args = parser.parse_args()
 
-                        if correct_line_index == 0 and number_of_corrected_lines == 1:
-                            sensor_corrected_line_joined = (
-                                "\n" + "\t".join(sensor_corrected_line) + "\n"
-                            )
-                        else:
-                            sensor_corrected_line_joined = "\t".join(sensor_corrected_line) + "\n"
+    fix_counts = fix_data_issues(dry_run=args.dry_run, workers=args.workers, force=args.force)
 
-                        f.write(sensor_corrected_line_joined)
+    print(
+        f"Checked {fix_counts['checked']} files, skipped {fix_counts['skipped']} unchanged files, "
+        f"{'found' if args.dry_run else 'fixed'} {fix_counts['error_lines']} error lines in "
+        f"{fix_counts['fixed_files']} files"
+    )
 
-                    print("Fixed error line: ", sensor_line_index)
-                    number_of_corrected_lines += 1
+    if fix_counts["failed_files"]:
+        sys.exit(f"{fix_counts['failed_files']} files failed")
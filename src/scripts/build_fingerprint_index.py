@@ -0,0 +1,143 @@
+import argparse
+import os
+
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from scipy.sparse import csr_matrix, vstack
+
+from src.util.definitions import *
+from src.scripts.dataset_catalog import DatasetCatalog
+from src.scripts.get_required_data import *
+from src.model.waypoint_measurement_fix import fix_waypoint, nearest_sample_indices
+from src.model.wifi_fingerprint import *
+
+
+def trace_fingerprints(filepath: Path) -> Tuple[np.ndarray, csr_matrix, np.ndarray]:
+
+    """
+    Function to get the Wi-Fi fingerprints of one training trace. Every scan is attached to the
+    waypoint position interpolated by fix_waypoint at the accelerometer sample nearest to it.
+
+    :param filepath: Path of data text file
+    :return: Sorted BSSIDs seen in the trace, fingerprints over these BSSIDs and scan positions
+    """
+
+    acce, _, wifi, waypoint = get_data(filepath, wifi=True)
+
+    if not len(wifi) or not len(waypoint) or not len(acce):
+        return np.empty(0, dtype=str), csr_matrix((0, 0)), np.empty((0, 2))
+
+    bssids = np.unique(wifi.vocabulary[wifi.ids])
+    timestamps, fingerprints = scan_fingerprints(wifi, bssids)
+
+    positions = fix_waypoint(acce[:, 0], waypoint)[nearest_sample_indices(acce[:, 0], timestamps)]
+    located = np.all(np.isfinite(positions), axis=1)
+
+    return bssids, fingerprints[located], positions[located]
+
+
+def merge_fingerprints(
+    traces: List[Tuple[np.ndarray, csr_matrix, np.ndarray]]
+) -> Tuple[np.ndarray, csr_matrix, np.ndarray]:
+
+    """
+    Function to merge the fingerprints of several traces into one matrix over the union of
+    their BSSIDs. Only column indices are remapped, RSSI values are not copied per trace.
+
+    :param traces: BSSIDs, fingerprints and positions of every trace, see trace_fingerprints
+    :return: Sorted BSSIDs, fingerprints and positions of all traces
+    """
+
+    bssids = np.unique(np.concatenate([trace_bssids for trace_bssids, _, _ in traces]))
+    fingerprints = []
+
+    for trace_bssids, trace_matrix, _ in traces:
+        columns = np.searchsorted(bssids, trace_bssids)[trace_matrix.indices]
+        fingerprints.append(
+            csr_matrix(
+                (trace_matrix.data, columns, trace_matrix.indptr),
+                shape=(trace_matrix.shape[0], len(bssids)),
+            )
+        )
+
+    positions = np.concatenate([trace_positions for _, _, trace_positions in traces])
+
+    return bssids, vstack(fingerprints, format="csr"), positions
+
+
+def build_fingerprint_indices(
+    building: str = "*",
+    floor: str = "*",
+    workers: Optional[int] = None,
+    dimensions: int = FEATURE_DIMENSIONS,
+    index_path: Path = FINGERPRINT_PATH,
+    refresh: bool = False,
+) -> Dict[Tuple[str, str], int]:
+
+    """
+    Script to build the fingerprint index of every selected floor from its training traces.
+    Traces are read in a process pool, the fingerprints of every floor are then merged, indexed
+    and saved to index_path / building / floor.npz.
+
+    :param building: Building glob pattern
+    :param floor: Floor glob pattern
+    :param workers: Number of worker processes, defaults to the number of cores
+    :param dimensions: Number of features fingerprints are reduced to
+    :param index_path: Fingerprint index directory
+    :param refresh: If true, the catalog is refreshed before traces are selected
+    :return: Number of fingerprints per (building, floor), floors without any are skipped
+    """
+
+    with DatasetCatalog() as catalog:
+        if refresh:
+            catalog.refresh(TRAIN_PATH)
+        sensor_files = catalog.traces(TRAIN_PATH, building, floor)
+
+    # Floor of every trace from its building / floor / trace.txt location
+    floors = [(filepath.parent.parent.name, filepath.parent.name) for filepath in sensor_files]
+    floor_traces = defaultdict(list)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for location, trace in zip(
+            floors, executor.map(trace_fingerprints, sensor_files, chunksize=4)
+        ):
+            if trace[1].shape[0]:
+                floor_traces[location].append(trace)
+
+    counts = {}
+
+    for (building_, floor_), traces in sorted(floor_traces.items()):
+        index = FingerprintIndex.fit(*merge_fingerprints(traces), dimensions=dimensions)
+        index.save(fingerprint_index_path(building_, floor_, index_path))
+        counts[building_, floor_] = len(index.positions)
+
+    return counts
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-b", "--building", help="Building glob pattern", default="*")
+    parser.add_argument("-f", "--floor", help="Floor glob pattern", default="*")
+    parser.add_argument(
+        "-w", "--workers", help="Number of worker processes", type=int, default=os.cpu_count()
+    )
+    parser.add_argument(
+        "-d",
+        "--dimensions",
+        help="Number of features fingerprints are reduced to",
+        type=int,
+        default=FEATURE_DIMENSIONS,
+    )
+    parser.add_argument(
+        "--refresh", help="Rescan the dataset directory for new traces", action="store_true"
+    )
+    args = parser.parse_args()
+
+    fingerprint_counts = build_fingerprint_indices(
+        args.building, args.floor, args.workers, args.dimensions, refresh=args.refresh
+    )
+
+    for (index_building, index_floor), count in fingerprint_counts.items():
+        print(f"{index_building}/{index_floor}: {count} fingerprints")
@@ -0,0 +1,292 @@
+import os
+import sqlite3
+import time
+
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.util.definitions import CATALOG_PATH, METADATA_PATH, SENSORS
+
+# Every sensor count gets its own column, e.g. TYPE_WIFI -> wifi_count
+SENSOR_COLUMNS = {sensor: sensor[len("TYPE_") :].lower() + "_count" for sensor in SENSORS}
+
+
+def count_sensor_lines(filepath: Path) -> Tuple[Dict[str, int], str]:
+
+    """
+    Function to count the data lines of every sensor type in a trace file and to read the site
+    id from its header.
+
+    :param filepath: Path of data text file
+    :return: Line count per sensor type and site id ("" if the header has none)
+    """
+
+    with filepath.open("rb") as f:
+        buffer = f.read()
+
+    # Sensor types are tab delimited on both sides, so TYPE_GYROSCOPE does not match the
+    # uncalibrated gyroscope
+    counts = {sensor: buffer.count(f"\t{sensor}\t".encode()) for sensor in SENSORS}
+
+    site_start = buffer.find(b"SiteID:", 0, 1024)
+    site_id = ""
+    if site_start >= 0:
+        site_id = buffer[site_start + 7 :].split(b"\t", 1)[0].split(b"\n", 1)[0].decode().strip()
+
+    return counts, site_id
+
+
+class DatasetCatalog:
+
+    """
+    Persistent SQLite catalog of trace files (building -> floor -> trace) with file sizes,
+    modification times, sensor line counts and floor metadata paths.
+
+    Nothing is scanned at import time. A dataset directory is scanned the first time it is
+    looked up and afterwards only on refresh, which re-reads new or changed trace files only.
+    Lookups are index queries, so selecting traces does not touch the file system.
+    """
+
+    def __init__(self, catalog_path: Path = CATALOG_PATH, metadata_path: Path = METADATA_PATH):
+
+        """
+        :param catalog_path: Path of the SQLite catalog file
+        :param metadata_path: Directory with building / floor / floor_info.json layout
+        """
+
+        self.catalog_path = catalog_path
+        self.metadata_path = metadata_path.resolve()
+
+        catalog_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(catalog_path))
+        self._create_tables()
+
+    def _create_tables(self):
+
+        sensor_columns = "".join(
+            f", {column} INTEGER NOT NULL" for column in SENSOR_COLUMNS.values()
+        )
+
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS traces (path TEXT PRIMARY KEY, root TEXT NOT NULL, "
+                "building TEXT NOT NULL, floor TEXT NOT NULL, trace TEXT NOT NULL, "
+                "size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, floor_info TEXT, "
+                f"floor_image TEXT{sensor_columns})"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS traces_location ON traces (root, building, floor)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS scans (root TEXT PRIMARY KEY, scanned REAL NOT NULL)"
+            )
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _floor_metadata_paths(self, building: str, floor: str) -> Tuple[Optional[str], ...]:
+        floor_dir = self.metadata_path / building / floor
+
+        return tuple(
+            str(floor_dir / name) if (floor_dir / name).exists() else None
+            for name in ("floor_info.json", "floor_image.png")
+        )
+
+    def refresh(self, root: Path) -> int:
+
+        """
+        Function to bring the catalog of a dataset directory up to date. Only trace files which
+        are new or whose size or modification time changed are read, entries of deleted files
+        are removed.
+
+        Traces in a building / floor / trace.txt layout are catalogued under that building and
+        floor. Traces directly in root (test set) take the building from the site id in their
+        header and have an empty floor.
+
+        :param root: Dataset directory (TRAIN_PATH or TEST_PATH)
+        :return: Number of trace files which were (re)read
+        """
+
+        root = root.resolve()
+        root_key = str(root)
+        known = {
+            path: (size, mtime_ns)
+            for path, size, mtime_ns in self.connection.execute(
+                "SELECT path, size, mtime_ns FROM traces WHERE root = ?", (root_key,)
+            )
+        }
+
+        seen = set()
+        rows = []
+        metadata = {}
+
+        for filepath, building, floor in self._walk(root):
+            stat = filepath.stat()
+            path = str(filepath)
+            seen.add(path)
+
+            if known.get(path) == (stat.st_size, stat.st_mtime_ns):
+                continue
+
+            counts, site_id = count_sensor_lines(filepath)
+            building = building or site_id
+            if (building, floor) not in metadata:
+                metadata[building, floor] = self._floor_metadata_paths(building, floor)
+
+            rows.append(
+                (path, root_key, building, floor, filepath.stem, stat.st_size, stat.st_mtime_ns)
+                + metadata[building, floor]
+                + tuple(counts[sensor] for sensor in SENSORS)
+            )
+
+        columns = "path, root, building, floor, trace, size, mtime_ns, floor_info, floor_image"
+        columns += "".join(f", {column}" for column in SENSOR_COLUMNS.values())
+        placeholders = ", ".join("?" * (9 + len(SENSORS)))
+
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO traces ({columns}) VALUES ({placeholders})", rows
+            )
+            self.connection.executemany(
+                "DELETE FROM traces WHERE path = ?", ((path,) for path in set(known) - seen)
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO scans (root, scanned) VALUES (?, ?)",
+                (root_key, time.time()),
+            )
+
+        return len(rows)
+
+    @staticmethod
+    def _walk(root: Path) -> Iterator[Tuple[Path, str, str]]:
+
+        """
+        Generator over the trace files of a dataset directory with os.scandir, which avoids a
+        stat call per directory entry.
+
+        :param root: Dataset directory
+        :return: Iterator of trace file, building and floor ("" if not in the path)
+        """
+
+        if not root.is_dir():
+            return
+
+        for entry in os.scandir(root):
+            if entry.is_file() and entry.name.endswith(".txt"):
+                yield Path(entry.path), "", ""
+            elif entry.is_dir():
+                for floor_entry in os.scandir(entry.path):
+                    if not floor_entry.is_dir():
+                        continue
+                    for trace_entry in os.scandir(floor_entry.path):
+                        if trace_entry.is_file() and trace_entry.name.endswith(".txt"):
+                            yield Path(trace_entry.path), entry.name, floor_entry.name
+
+    def _ensure_scanned(self, root: Path) -> str:
+        root_key = str(root.resolve())
+        scanned = self.connection.execute(
+            "SELECT 1 FROM scans WHERE root = ?", (root_key,)
+        ).fetchone()
+
+        if scanned is None:
+            self.refresh(root)
+
+        return root_key
+
+    def traces(
+        self, root: Path, building: str = "*", floor: str = "*", largest_first: bool = True
+    ) -> List[Path]:
+
+        """
+        Function to select trace files by building and floor glob patterns.
+
+        :param root: Dataset directory (TRAIN_PATH or TEST_PATH)
+        :param building: Building glob pattern
+        :param floor: Floor glob pattern
+        :param largest_first: If true, traces are sorted by file size, largest first
+        :return: List of trace files
+        """
+
+        root_key = self._ensure_scanned(root)
+        order = "size DESC, path" if largest_first else "path"
+
+        return [
+            Path(path)
+            for path, in self.connection.execute(
+                f"SELECT path FROM traces WHERE root = ? AND building GLOB ? AND floor GLOB ? "
+                f"ORDER BY {order}",
+                (root_key, building, floor),
+            )
+        ]
+
+    def trace_info(self, filepath: Path) -> Optional[Dict[str, object]]:
+
+        """
+        Function to get the catalog entry of a trace file.
+
+        :param filepath: Path of data text file
+        :return: Catalog entry keyed by column name (sensor counts keyed by sensor type), None if
+        the trace is not catalogued
+        """
+
+        cursor = self.connection.execute(
+            "SELECT * FROM traces WHERE path = ?", (str(filepath.resolve()),)
+        )
+        row = cursor.fetchone()
+
+        if row is None:
+            return None
+
+        info = dict(zip((column[0] for column in cursor.description), row))
+        info["sensor_counts"] = {
+            sensor: info.pop(column) for sensor, column in SENSOR_COLUMNS.items()
+        }
+
+        return info
+
+    def floors(self, root: Path, building: str = "*") -> List[Tuple[str, str]]:
+
+        """
+        Function to list the floors of a dataset directory.
+
+        :param root: Dataset directory (TRAIN_PATH or TEST_PATH)
+        :param building: Building glob pattern
+        :return: List of (building, floor) pairs
+        """
+
+        root_key = self._ensure_scanned(root)
+
+        return self.connection.execute(
+            "SELECT DISTINCT building, floor FROM traces WHERE root = ? AND building GLOB ? "
+            "ORDER BY building, floor",
+            (root_key, building),
+        ).fetchall()
+
+    def floor_metadata(self, root: Path, building: str, floor: str) -> Tuple[Optional[Path], ...]:
+
+        """
+        Function to get the floor metadata files of a floor.
+
+        :param root: Dataset directory (TRAIN_PATH or TEST_PATH)
+        :param building: Building
+        :param floor: Floor
+        :return: Paths of floor_info.json and floor_image.png, None where a file does not exist
+        """
+
+        root_key = self._ensure_scanned(root)
+        row = self.connection.execute(
+            "SELECT floor_info, floor_image FROM traces "
+            "WHERE root = ? AND building = ? AND floor = ? LIMIT 1",
+            (root_key, building, floor),
+        ).fetchone()
+
+        if row is None:
+            row = self._floor_metadata_paths(building, floor)
+
+        return tuple(Path(path) if path is not None else None for path in row)
@@ -0,0 +1,279 @@
+import os
+import sys
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.util.definitions import RESULTS_PATH
+from src.scripts.result_store import ResultReader, list_results
+
+# Percentiles of the position error reported for every group
+ERROR_PERCENTILES = (50, 75, 90, 95)
+
+# Group levels of an evaluation summary and the number of (building, floor, trace) key parts
+# traces are grouped by
+SUMMARY_LEVELS = {"trace": 3, "floor": 2, "building": 1, "all": 0}
+
+
+def interpolate_positions(
+    timestamps: np.ndarray,
+    positions: np.ndarray,
+    offsets: np.ndarray,
+    query_timestamps: np.ndarray,
+    query_offsets: np.ndarray,
+) -> np.ndarray:
+
+    """
+    Function to linearly interpolate the positions of many traces to query timestamps in one
+    vectorized pass. Samples offsets[i] : offsets[i + 1] and queries
+    query_offsets[i] : query_offsets[i + 1] belong to trace i. Timestamps are shifted so that
+    the traces follow each other on one increasing time axis, then one searchsorted finds the
+    neighbouring samples of every query. Queries outside a trace get its first or last position,
+    like np.interp.
+
+    :param timestamps: Sample timestamps, increasing within every trace
+    :param positions: Sample positions, shape (N, 2)
+    :param offsets: Sample offsets of the traces, every trace needs at least one sample
+    :param query_timestamps: Query timestamps
+    :param query_offsets: Query offsets of the traces
+    :return: Interpolated positions, shape (len(query_timestamps), 2)
+    """
+
+    trace_count = len(offsets) - 1
+    starts, ends = offsets[:-1], offsets[1:] - 1
+    sample_traces = np.repeat(np.arange(trace_count), np.diff(offsets))
+    query_traces = np.repeat(np.arange(trace_count), np.diff(query_offsets))
+
+    # Relative timestamps keep the shifted time axis small enough for exact float64 arithmetic
+    durations = timestamps[ends] - timestamps[starts]
+    shifts = np.concatenate(([0.0], np.cumsum(durations + 1.0)[:-1]))
+    sample_time = timestamps - timestamps[starts][sample_traces] + shifts[sample_traces]
+    query_time = np.clip(
+        query_timestamps - timestamps[starts][query_traces], 0.0, durations[query_traces]
+    )
+    query_time = query_time + shifts[query_traces]
+
+    right = np.searchsorted(sample_time, query_time, side="right")
+    right = np.minimum(np.maximum(right, starts[query_traces] + 1), ends[query_traces])
+    left = np.maximum(right - 1, starts[query_traces])
+
+    span = sample_time[right] - sample_time[left]
+    weight = np.divide(
+        query_time - sample_time[left], span, out=np.zeros_like(span), where=span > 0
+    )
+
+    return positions[left] + weight[:, np.newaxis] * (positions[right] - positions[left])
+
+
+def waypoint_errors(
+    states: np.ndarray, timestamps: np.ndarray, waypoints: np.ndarray
+) -> np.ndarray:
+
+    """
+    Function to get the position error of the estimated states of one trace at its waypoints.
+
+    :param states: Estimated states (x and y first)
+    :param timestamps: Sample timestamps (ms)
+    :param waypoints: Waypoints (timestamp, x, y)
+    :return: Euclidean position error at every waypoint
+    """
+
+    positions = interpolate_positions(
+        timestamps,
+        states[:, :2],
+        np.array([0, len(timestamps)]),
+        waypoints[:, 0],
+        np.array([0, len(waypoints)]),
+    )
+
+    return np.hypot(*(positions - waypoints[:, 1:3]).T)
+
+
+def grouped_percentiles(
+    values: np.ndarray, groups: np.ndarray, percentiles: Sequence[float] = ERROR_PERCENTILES
+) -> np.ndarray:
+
+    """
+    Function to compute percentiles of every group of values at once, with the linear
+    interpolation of np.percentile. Values are sorted by group and value with one lexsort.
+
+    :param values: Values
+    :param groups: Group id of every value, 0 ... G - 1, every group needs at least one value
+    :param percentiles: Percentiles
+    :return: Percentiles of every group, shape (G, len(percentiles))
+    """
+
+    sorted_values = values[np.lexsort((values, groups))]
+    counts = np.bincount(groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    positions = np.outer(counts - 1, np.asarray(percentiles) / 100.0)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.ceil(positions).astype(np.int64)
+    lower_values = sorted_values[starts[:, np.newaxis] + lower]
+    upper_values = sorted_values[starts[:, np.newaxis] + upper]
+
+    return lower_values + (positions - lower) * (upper_values - lower_values)
+
+
+@dataclass
+class Evaluation:
+
+    """
+    Position errors at the waypoints of evaluated traces. Errors
+    waypoint_offsets[i] : waypoint_offsets[i + 1] belong to traces[i].
+    """
+
+    traces: List[Tuple[str, str, str]]
+    errors: np.ndarray
+    waypoint_offsets: np.ndarray
+
+    def summary(
+        self, level: str = "floor", percentiles: Sequence[float] = ERROR_PERCENTILES
+    ) -> Dict[Tuple[str, ...], Dict[str, float]]:
+
+        """
+        Function to aggregate the errors per trace, floor, building or over all traces. The
+        mean error of a group is the mean over all of its waypoints, as in the competition
+        metric (without the floor term, floors are known here).
+
+        :param level: "trace", "floor", "building" or "all"
+        :param percentiles: Error percentiles to report
+        :return: Statistics (traces, waypoints, mean_error, p50, ...) keyed by the group's
+        (building, floor, trace) prefix
+        """
+
+        key_length = SUMMARY_LEVELS[level]
+        if not len(self.errors):
+            return {}
+
+        trace_keys = [trace[:key_length] for trace in self.traces]
+        keys = sorted(set(trace_keys))
+        key_index = {key: index for index, key in enumerate(keys)}
+        trace_groups = np.array([key_index[key] for key in trace_keys])
+        groups = np.repeat(trace_groups, np.diff(self.waypoint_offsets))
+
+        counts = np.bincount(groups, minlength=len(keys))
+        means = np.bincount(groups, weights=self.errors, minlength=len(keys)) / counts
+        trace_counts = np.bincount(trace_groups, minlength=len(keys))
+        group_percentiles = grouped_percentiles(self.errors, groups, percentiles)
+
+        return {
+            key: dict(
+                traces=int(trace_counts[index]),
+                waypoints=int(counts[index]),
+                mean_error=float(means[index]),
+                **{
+                    f"p{percentile:g}": float(value)
+                    for percentile, value in zip(percentiles, group_percentiles[index])
+                },
+            )
+            for index, key in enumerate(keys)
+        }
+
+
+def _read_positions(
+    result: Tuple[str, str, str], root: Path, states_field: Optional[str]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    reader = ResultReader(*result, root)
+    if states_field is None:
+        states_field = "smoothed_states" if "smoothed_states" in reader.fields else "states"
+
+    samples = reader.read(fields=[states_field])
+    waypoints = reader.attributes().get("waypoints", np.empty((0, 3)))
+
+    return samples["timestamps"], samples[states_field][:, :2], waypoints
+
+
+def _evaluate_results_job(job: tuple) -> Tuple[list, np.ndarray, np.ndarray, list]:
+
+    """
+    Process pool job to evaluate a chunk of stored results with one vectorized interpolation.
+    Results without samples or waypoints are skipped, errors are returned instead of raised.
+
+    :param job: Results, result store directory and states field
+    :return: Evaluated results, waypoint errors, waypoint counts and (result, error) pairs
+    """
+
+    results, root, states_field = job
+    evaluated, parts, failed = [], [], []
+
+    for result in results:
+        try:
+            timestamps, positions, waypoints = _read_positions(result, root, states_field)
+        except Exception as error:
+            failed.append((result, repr(error)))
+            continue
+
+        if len(timestamps) and len(waypoints):
+            evaluated.append(result)
+            parts.append((timestamps, positions, waypoints))
+
+    if not parts:
+        return evaluated, np.empty(0), np.empty(0, dtype=np.int64), failed
+
+    lengths = [len(part[0]) for part in parts]
+    waypoint_counts = np.array([len(part[2]) for part in parts], dtype=np.int64)
+    waypoints = np.concatenate([part[2] for part in parts])
+
+    positions = interpolate_positions(
+        np.concatenate([part[0] for part in parts]).astype(float),
+        np.concatenate([part[1] for part in parts]),
+        np.concatenate(([0], np.cumsum(lengths))),
+        waypoints[:, 0],
+        np.concatenate(([0], np.cumsum(waypoint_counts))),
+    )
+    errors = np.hypot(*(positions - waypoints[:, 1:3]).T)
+
+    return evaluated, errors, waypoint_counts, failed
+
+
+def evaluate_results(
+    building: str = "*",
+    floor: str = "*",
+    root: Path = RESULTS_PATH,
+    states_field: Optional[str] = None,
+    workers: Optional[int] = None,
+    chunk_traces: int = 64,
+) -> Evaluation:
+
+    """
+    Function to evaluate stored results against the waypoints stored with them. Results are
+    read and evaluated in chunks in a process pool, only the per-waypoint errors come back.
+
+    :param building: Building glob pattern
+    :param floor: Floor glob pattern
+    :param root: Result store directory
+    :param states_field: Field of the estimates, smoothed states if a trace has them and states
+    otherwise if None
+    :param workers: Number of worker processes, defaults to the number of cores
+    :param chunk_traces: Number of traces per job
+    :return: Evaluation of every result with waypoints
+    """
+
+    results = list_results(root, building, floor)
+    jobs = [
+        (results[start : start + chunk_traces], root, states_field)
+        for start in range(0, len(results), chunk_traces)
+    ]
+
+    traces, errors, waypoint_counts = [], [], []
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for evaluated, chunk_errors, counts, failed in executor.map(_evaluate_results_job, jobs):
+            traces.extend(evaluated)
+            errors.append(chunk_errors)
+            waypoint_counts.append(counts)
+            for result, error in failed:
+                print(f"{'/'.join(result)} failed: {error}", file=sys.stderr)
+
+    waypoint_counts = np.concatenate(waypoint_counts) if waypoint_counts else np.empty(0, int)
+
+    return Evaluation(
+        traces=traces,
+        errors=np.concatenate(errors) if errors else np.empty(0),
+        waypoint_offsets=np.concatenate(([0], np.cumsum(waypoint_counts))).astype(np.int64),
+    )
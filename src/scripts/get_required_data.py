@@ -4,20 +4,24 @@ from pathlib import Path
 from typing import Tuple
 
 from src.scripts.read_data import read_data_file
+from src.scripts.trace_cache import read_data_file_cached
 
 
-def get_data(filepath: Path, wifi: bool = False) -> Tuple[np.ndarray, ...]:
+def get_data(filepath: Path, wifi: bool = False, cache: bool = True) -> Tuple[np.ndarray, ...]:
 
     """
     Function to get load data arrays.
 
     :param filepath: Path of data text file.
-    :param wifi: Boolean parameter to decide if wifi data should be returned (will be removed in
-    future when wifi data will be incorporated in the model).
+    :param wifi: Boolean parameter to decide if wifi data (columnar RadioData) should be returned
+    :param cache: If true, parsed data is read from and saved to the on-disk trace cache
     :return: Tuple of data arrays
     """
 
-    path_datas = read_data_file(filepath)
+    if cache:
+        path_datas = read_data_file_cached(filepath)
+    else:
+        path_datas = read_data_file(filepath)
     acce_datas = path_datas.acce
     gyro_datas = path_datas.gyro
     wifi_datas = path_datas.wifi
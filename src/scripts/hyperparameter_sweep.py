@@ -0,0 +1,579 @@
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import time
+import numpy as np
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import asdict, dataclass, fields, replace
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from src.util.parameters import MATRIX_FIELDS, Params
+from src.scripts.get_required_data import get_data
+from src.scripts.evaluation import waypoint_errors
+from src.model.unscented_kalman import fix_measurements
+from src.model.unscented_filter import UnscentedFilter
+
+# Random search range (low, high) of every sweep dimension and whether it is sampled on a log
+# scale. kappa stays above minus the state dimension, where the sigma point weights blow up
+SEARCH_SPACE = {
+    "alpha": (1e-3, 1.0, True),
+    "beta": (0.0, 4.0, False),
+    "kappa": (-7.5, 3.0, False),
+    "q_scale": (1e-3, 1e3, True),
+    "r_scale": (1e-3, 1e3, True),
+}
+
+
+@dataclass(frozen=True)
+class SweepConfig:
+
+    """
+    One configuration of a sweep: sigma point parameters and the factors the process noise and
+    measurement covariance of Params are scaled with.
+    """
+
+    alpha: float = 0.3
+    beta: float = 2.0
+    kappa: float = -5.0
+    q_scale: float = 1.0
+    r_scale: float = 1.0
+
+    @property
+    def key(self) -> str:
+        return json.dumps(asdict(self), sort_keys=True)
+
+    def apply(self, parameters: Params) -> Params:
+
+        """
+        Function to get the parameters of this configuration.
+
+        :param parameters: Base parameters
+        :return: Parameters with the sigma point parameters of the configuration and scaled
+        process noise and measurement covariance
+        """
+
+        return replace(
+            parameters,
+            alpha=self.alpha,
+            beta=self.beta,
+            kappa=self.kappa,
+            R_=parameters.R_ * self.r_scale,
+            waypoint_process_noise=parameters.waypoint_process_noise * self.q_scale,
+            linear_acc_process_noise=parameters.linear_acc_process_noise * self.q_scale,
+            angle_process_noise=parameters.angle_process_noise * self.q_scale,
+            process_noise=parameters.process_noise * self.q_scale,
+        )
+
+
+def grid_configs(**values: Sequence[float]) -> List[SweepConfig]:
+
+    """
+    Function to get the configurations of a grid search, e.g.
+    grid_configs(alpha=[0.1, 0.3], q_scale=[0.1, 1, 10]). Dimensions which are not given keep
+    their default.
+
+    :param values: Values of every swept dimension
+    :return: Every combination of the values
+    """
+
+    names = list(values)
+
+    return [
+        SweepConfig(**{name: float(value) for name, value in zip(names, point)})
+        for point in itertools.product(*values.values())
+    ]
+
+
+def random_configs(
+    count: int, seed: int = 0, space: Dict[str, Tuple[float, float, bool]] = SEARCH_SPACE
+) -> List[SweepConfig]:
+
+    """
+    Function to get the configurations of a random search. Values are rounded to 4 significant
+    digits, so the same seed gives the same configurations and a sweep can be resumed.
+
+    :param count: Number of configurations
+    :param seed: Random seed
+    :param space: Range of every dimension, see SEARCH_SPACE
+    :return: Configurations
+    """
+
+    rng = np.random.default_rng(seed)
+    configs = []
+
+    for _ in range(count):
+        point = {}
+        for name, (low, high, log) in space.items():
+            if log:
+                value = np.exp(rng.uniform(np.log(low), np.log(high)))
+            else:
+                value = rng.uniform(low, high)
+            point[name] = float(f"{value:.4g}")
+        configs.append(SweepConfig(**point))
+
+    return configs
+
+
+@dataclass
+class SweepTraces:
+
+    """
+    Filter inputs of the traces of a sweep as flat columns. Rows offsets[i] : offsets[i + 1] of
+    measurements, dt and timestamps and rows waypoint_offsets[i] : waypoint_offsets[i + 1] of
+    waypoints belong to trace i. Columns are saved as .npy files which workers memory-map
+    read-only, so every trace is parsed once per sweep and shared by all workers.
+    """
+
+    measurements: np.ndarray
+    dt: np.ndarray
+    timestamps: np.ndarray
+    offsets: np.ndarray
+    waypoints: np.ndarray
+    waypoint_offsets: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def trace(self, index: int) -> Tuple[np.ndarray, ...]:
+
+        """
+        Function to get the filter inputs of one trace.
+
+        :param index: Trace index
+        :return: Measurements, timesteps, sample timestamps and waypoints of the trace
+        """
+
+        start, end = self.offsets[index], self.offsets[index + 1]
+        waypoint_start, waypoint_end = self.waypoint_offsets[index : index + 2]
+
+        return (
+            self.measurements[start:end],
+            self.dt[start:end],
+            self.timestamps[start:end],
+            self.waypoints[waypoint_start:waypoint_end],
+        )
+
+    def save(self, directory: Path):
+        directory.mkdir(parents=True, exist_ok=True)
+
+        for field in fields(self):
+            np.save(directory / f"{field.name}.npy", getattr(self, field.name))
+
+    @classmethod
+    def load(cls, directory: Path, mmap: bool = True) -> "SweepTraces":
+        mmap_mode = "r" if mmap else None
+
+        return cls(
+            **{
+                field.name: np.load(directory / f"{field.name}.npy", mmap_mode=mmap_mode)
+                for field in fields(cls)
+            }
+        )
+
+
+def prepare_sweep_traces(traces: List[Path], directory: Path) -> List[Path]:
+
+    """
+    Function to parse the traces of a sweep into SweepTraces under directory. Traces without
+    waypoints cannot be scored and are left out. Traces are ordered shortest first, so
+    configurations which are stopped early are stopped after the cheapest traces. If directory
+    already holds the same traces, nothing is parsed again.
+
+    :param traces: Trace files
+    :param directory: Directory of the trace columns
+    :return: Trace files in sweep order
+    """
+
+    manifest = directory / "traces.json"
+    requested = sorted(str(trace) for trace in traces)
+
+    if manifest.exists():
+        with manifest.open() as f:
+            prepared = json.load(f)
+        if sorted(prepared["requested"]) == requested:
+            return [Path(trace) for trace in prepared["traces"]]
+
+    parts = []
+    for trace in traces:
+        acc, gyro, way = get_data(trace)
+        if not len(way) or not len(acc):
+            print(f"Skipping {trace}: no waypoints", file=sys.stderr)
+            continue
+        data = fix_measurements(acc, gyro, way)
+        parts.append((trace, data[:, 1:], data[:, 0], acc[:, 0], way))
+
+    if not parts:
+        return []
+
+    parts.sort(key=lambda part: len(part[1]))
+    lengths = [len(part[1]) for part in parts]
+    waypoint_lengths = [len(part[4]) for part in parts]
+
+    SweepTraces(
+        measurements=np.concatenate([part[1] for part in parts]),
+        dt=np.concatenate([part[2] for part in parts]),
+        timestamps=np.concatenate([part[3] for part in parts]),
+        offsets=np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+        waypoints=np.concatenate([part[4] for part in parts]),
+        waypoint_offsets=np.concatenate(([0], np.cumsum(waypoint_lengths))).astype(np.int64),
+    ).save(directory)
+
+    ordered = [part[0] for part in parts]
+    with manifest.open("w") as f:
+        json.dump({"requested": requested, "traces": [str(trace) for trace in ordered]}, f)
+
+    return ordered
+
+
+@dataclass
+class SweepResult:
+
+    """
+    Evaluation of one configuration: summed waypoint error and number of waypoints of every
+    evaluated trace, in sweep order. A configuration which was stopped early has fewer traces,
+    one which diverged has an infinite error on its last trace.
+    """
+
+    config: SweepConfig
+    trace_errors: np.ndarray
+    trace_waypoints: np.ndarray
+    complete: bool
+    seconds: float
+
+    @property
+    def score(self) -> float:
+
+        """
+        Mean waypoint error over the evaluated traces.
+        """
+
+        return float(self.trace_errors.sum() / self.trace_waypoints.sum())
+
+    def running_scores(self) -> np.ndarray:
+
+        """
+        Function to get the mean waypoint error over the first 1, 2, ... traces.
+
+        :return: Running mean waypoint error
+        """
+
+        return np.cumsum(self.trace_errors) / np.cumsum(self.trace_waypoints)
+
+
+def evaluate_config(
+    config: SweepConfig,
+    traces: SweepTraces,
+    parameters: Params,
+    baseline: Optional[np.ndarray] = None,
+    min_traces: int = 3,
+    margin: float = 0.5,
+) -> SweepResult:
+
+    """
+    Function to run the filter with one configuration over the traces of a sweep. Trace i draws
+    its filter noise from parameters.generator(i), so all configurations see the same noise.
+    After min_traces traces, the configuration is stopped once its running mean error is more
+    than margin above the running mean error of the baseline over the same traces. A diverging
+    filter stops the configuration right away.
+
+    :param config: Configuration
+    :param traces: Traces of the sweep
+    :param parameters: Base parameters
+    :param baseline: Running scores of the best configuration so far, see running_scores
+    :param min_traces: Number of traces every configuration runs before it can be stopped
+    :param margin: Relative error above the baseline at which a configuration is stopped
+    :return: Result
+    """
+
+    start = time.perf_counter()
+    parameters = config.apply(parameters)
+    trace_errors, trace_waypoints = [], []
+
+    for index in range(len(traces)):
+        measurements, dt, timestamps, waypoints = traces.trace(index)
+        ukf = UnscentedFilter(
+            parameters.initial_mu_,
+            parameters.initial_covariance_,
+            parameters.R_,
+            parameters.process_noise,
+            alpha=parameters.alpha,
+            beta=parameters.beta,
+            kappa=parameters.kappa,
+            rng=parameters.generator(index),
+        )
+        states = np.empty((len(measurements), len(parameters.initial_mu_)))
+
+        try:
+            with np.errstate(all="ignore"):
+                for i, measurement in enumerate(measurements):
+                    states[i] = ukf.step(measurement, dt[i])[0]
+            error = waypoint_errors(states, timestamps, waypoints).sum()
+        except (np.linalg.LinAlgError, ValueError):
+            error = np.inf
+
+        trace_errors.append(error if np.isfinite(error) else np.inf)
+        trace_waypoints.append(len(waypoints))
+
+        if not np.isfinite(error):
+            break
+
+        evaluated = len(trace_errors)
+        running_score = sum(trace_errors) / sum(trace_waypoints)
+        if (
+            baseline is not None
+            and evaluated >= min_traces
+            and running_score > (1 + margin) * baseline[evaluated - 1]
+        ):
+            break
+
+    return SweepResult(
+        config=config,
+        trace_errors=np.array(trace_errors),
+        trace_waypoints=np.array(trace_waypoints),
+        complete=len(trace_errors) == len(traces) and bool(np.isfinite(trace_errors[-1])),
+        seconds=time.perf_counter() - start,
+    )
+
+
+def parameters_digest(parameters: Params) -> str:
+
+    """
+    Function to get a digest of the seed and matrices of parameters, to check that a resumed
+    sweep uses the same base parameters.
+
+    :param parameters: Parameters
+    :return: Hex digest
+    """
+
+    digest = hashlib.sha1(repr(parameters.seed).encode())
+    for name in MATRIX_FIELDS:
+        digest.update(np.ascontiguousarray(getattr(parameters, name), dtype=float).tobytes())
+
+    return digest.hexdigest()
+
+
+class SweepTable:
+
+    """
+    Persistent SQLite table of sweep results with one row per configuration. Results are
+    committed as soon as they come in, so an interrupted sweep resumes with the configurations
+    which have no row yet.
+    """
+
+    def __init__(self, path: Path):
+
+        """
+        :param path: Path of the SQLite file
+        """
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(path))
+        self._create_tables()
+
+    def _create_tables(self):
+        config_columns = "".join(f", {field.name} REAL NOT NULL" for field in fields(SweepConfig))
+
+        with self.connection:
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY{config_columns}, "
+                "score REAL NOT NULL, traces INTEGER NOT NULL, complete INTEGER NOT NULL, "
+                "seconds REAL NOT NULL, trace_errors TEXT NOT NULL, trace_waypoints TEXT NOT NULL)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS results_score ON results (complete, score)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS setup (name TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def check_setup(self, traces: List[Path], parameters: Params):
+
+        """
+        Function to record the traces and base parameters of a new sweep, or to check that a
+        resumed sweep uses the same ones.
+
+        :param traces: Trace files in sweep order
+        :param parameters: Base parameters
+        """
+
+        setup = {
+            "traces": json.dumps([str(trace) for trace in traces]),
+            "parameters": parameters_digest(parameters),
+        }
+
+        for name, value in setup.items():
+            row = self.connection.execute(
+                "SELECT value FROM setup WHERE name = ?", (name,)
+            ).fetchone()
+            if row is None:
+                with self.connection:
+                    self.connection.execute(
+                        "INSERT INTO setup (name, value) VALUES (?, ?)", (name, value)
+                    )
+            elif row[0] != value:
+                raise ValueError(f"Sweep table was created with other {name}")
+
+    def keys(self) -> Set[str]:
+        return {key for key, in self.connection.execute("SELECT key FROM results")}
+
+    def add(self, result: SweepResult):
+        config_columns = "".join(f", {field.name}" for field in fields(SweepConfig))
+        placeholders = ", ".join("?" * (7 + len(fields(SweepConfig))))
+
+        with self.connection:
+            self.connection.execute(
+                f"INSERT OR REPLACE INTO results (key{config_columns}, score, traces, complete, "
+                f"seconds, trace_errors, trace_waypoints) VALUES ({placeholders})",
+                (result.config.key,)
+                + tuple(asdict(result.config).values())
+                + (
+                    result.score,
+                    len(result.trace_errors),
+                    int(result.complete),
+                    result.seconds,
+                    json.dumps(result.trace_errors.tolist()),
+                    json.dumps(result.trace_waypoints.tolist()),
+                ),
+            )
+
+    def results(self, complete_only: bool = False, limit: int = -1) -> List[SweepResult]:
+
+        """
+        Function to get results, best first. Complete results come before results which were
+        stopped early.
+
+        :param complete_only: If true, only configurations which ran every trace are returned
+        :param limit: Maximum number of results, -1 for all
+        :return: Results
+        """
+
+        config_columns = ", ".join(field.name for field in fields(SweepConfig))
+        where = "WHERE complete = 1 " if complete_only else ""
+
+        return [
+            SweepResult(
+                config=SweepConfig(*row[:-4]),
+                trace_errors=np.array(json.loads(row[-4])),
+                trace_waypoints=np.array(json.loads(row[-3])),
+                complete=bool(row[-2]),
+                seconds=row[-1],
+            )
+            for row in self.connection.execute(
+                f"SELECT {config_columns}, trace_errors, trace_waypoints, complete, seconds "
+                f"FROM results {where}ORDER BY complete DESC, score LIMIT ?",
+                (limit,),
+            )
+        ]
+
+    def best(self) -> Optional[SweepResult]:
+        results = self.results(complete_only=True, limit=1)
+
+        return results[0] if results else None
+
+
+_sweep_traces: Optional[SweepTraces] = None
+
+
+def _init_worker(directory: Path):
+    global _sweep_traces
+    _sweep_traces = SweepTraces.load(directory)
+
+
+def _evaluate_job(job: tuple) -> SweepResult:
+    return evaluate_config(job[0], _sweep_traces, *job[1:])
+
+
+def run_sweep(
+    configs: List[SweepConfig],
+    traces: List[Path],
+    parameters: Params,
+    sweep_dir: Path,
+    workers: Optional[int] = None,
+    min_traces: int = 3,
+    margin: float = 0.5,
+) -> Optional[SweepResult]:
+
+    """
+    Function to evaluate configurations in a process pool. Traces are parsed once into
+    sweep_dir / traces and memory-mapped by every worker, results go to
+    sweep_dir / results.sqlite. Configurations which already have a result there are skipped,
+    so running the same sweep again resumes it. Only about two configurations per worker are
+    queued at a time, so every configuration is compared against an up to date best one for
+    early stopping (see evaluate_config).
+
+    :param configs: Configurations
+    :param traces: Trace files
+    :param parameters: Base parameters, their seed makes the sweep reproducible
+    :param sweep_dir: Sweep directory
+    :param workers: Number of worker processes, defaults to the number of cores
+    :param min_traces: Number of traces every configuration runs before it can be stopped
+    :param margin: Relative error above the best configuration at which one is stopped
+    :return: Best complete result of the sweep, None if there is none
+    """
+
+    trace_dir = sweep_dir / "traces"
+    ordered = prepare_sweep_traces(traces, trace_dir)
+
+    if not ordered:
+        raise ValueError("No traces with waypoints to sweep over")
+
+    workers = workers or os.cpu_count() or 1
+
+    with SweepTable(sweep_dir / "results.sqlite") as table:
+        table.check_setup(ordered, parameters)
+        done = table.keys()
+        pending = [config for config in dict.fromkeys(configs) if config.key not in done]
+        total = len(pending)
+        pending = iter(pending)
+        best = table.best()
+        futures = {}
+        finished = 0
+
+        with ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=(trace_dir,)
+        ) as executor:
+            while True:
+                baseline = None if best is None else best.running_scores()
+                for config in itertools.islice(pending, 2 * workers - len(futures)):
+                    job = (config, parameters, baseline, min_traces, margin)
+                    futures[executor.submit(_evaluate_job, job)] = config
+
+                if not futures:
+                    break
+
+                completed, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    config = futures.pop(future)
+                    finished += 1
+                    try:
+                        result = future.result()
+                    except Exception as error:
+                        print(f"[{finished}/{total}] Failed {config}: {error!r}", file=sys.stderr)
+                        continue
+
+                    table.add(result)
+                    if result.complete and (best is None or result.score < best.score):
+                        best = result
+
+                    status = "" if result.complete else " (stopped)"
+                    print(
+                        f"[{finished}/{total}] {config} score {result.score:.3f} after "
+                        f"{len(result.trace_errors)} traces{status}",
+                        file=sys.stderr,
+                    )
+
+    return best
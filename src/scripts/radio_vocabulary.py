@@ -0,0 +1,187 @@
+import os
+import tempfile
+import numpy as np
+
+from dataclasses import replace
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.util.definitions import TRAIN_PATH, VOCABULARY_PATH
+from src.scripts.dataset_catalog import DatasetCatalog
+from src.scripts.read_data import RadioData
+from src.scripts.trace_cache import read_data_file_cached
+
+
+class RadioVocabulary:
+
+    """
+    Append-only vocabulary which interns the BSSIDs and iBeacon ids of a building to int32 ids.
+    Ids never change once assigned, so radio data encoded with an older version of the
+    vocabulary stays valid after new keys are added.
+    """
+
+    def __init__(self, keys: Iterable[str] = ()):
+
+        """
+        :param keys: Initial keys, which get ids 0, 1, ... in order
+        """
+
+        self._keys = [str(key) for key in keys]
+        self._ids = {key: index for index, key in enumerate(self._keys)}
+        self._array = np.empty(0, dtype=str)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @property
+    def keys(self) -> np.ndarray:
+
+        """
+        Key of every id as an array, vocabulary[ids] looks up the keys of encoded readings.
+        """
+
+        if len(self._array) != len(self._keys):
+            self._array = np.array(self._keys, dtype=str)
+
+        return self._array
+
+    def intern(self, keys: np.ndarray) -> np.ndarray:
+
+        """
+        Function to get the ids of keys, new keys get the next free ids.
+
+        :param keys: Keys
+        :return: Id of every key, int32
+        """
+
+        unique, inverse = np.unique(keys, return_inverse=True)
+        ids = np.empty(len(unique), dtype=np.int32)
+
+        for index, key in enumerate(unique.tolist()):
+            if key not in self._ids:
+                self._ids[key] = len(self._keys)
+                self._keys.append(key)
+            ids[index] = self._ids[key]
+
+        return ids[inverse]
+
+    def lookup(self, keys: np.ndarray) -> np.ndarray:
+
+        """
+        Function to get the ids of keys without adding new keys.
+
+        :param keys: Keys
+        :return: Id of every key, -1 for unknown keys
+        """
+
+        unique, inverse = np.unique(keys, return_inverse=True)
+        ids = np.array([self._ids.get(key, -1) for key in unique.tolist()], dtype=np.int32)
+
+        return ids[inverse]
+
+    def encode(self, radio: RadioData) -> RadioData:
+
+        """
+        Function to re-key radio data from its own vocabulary to this vocabulary. Only the
+        vocabulary of the trace is interned, readings are re-keyed with one gather.
+
+        :param radio: Radio data
+        :return: Radio data whose ids index into this vocabulary
+        """
+
+        ids = self.intern(radio.vocabulary)[radio.ids] if len(radio.vocabulary) else radio.ids
+
+        return replace(radio, ids=ids.astype(np.int32), vocabulary=self.keys)
+
+    def save(self, path: Path):
+
+        """
+        Function to atomically save the vocabulary.
+
+        :param path: Path of the vocabulary file (.npy)
+        """
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as f:
+            np.save(f, self.keys)
+
+        os.replace(f.name, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "RadioVocabulary":
+
+        """
+        Function to load a vocabulary.
+
+        :param path: Path of the vocabulary file (.npy)
+        :return: Vocabulary, empty if the file does not exist
+        """
+
+        if not path.exists():
+            return cls()
+
+        return cls(np.load(path, allow_pickle=False))
+
+
+def concatenate_radio(radios: List[RadioData]) -> RadioData:
+
+    """
+    Function to concatenate radio data encoded with the same RadioVocabulary into one set of
+    columns, e.g. all Wi-Fi scans of a building.
+
+    :param radios: Radio data sharing one vocabulary
+    :return: Concatenated radio data
+    """
+
+    counts = [len(radio) for radio in radios]
+    offsets = [radio.offsets[:-1] + start for radio, start in zip(radios, np.cumsum([0] + counts))]
+
+    return RadioData(
+        timestamps=np.concatenate([radio.timestamps for radio in radios]),
+        offsets=np.append(np.concatenate(offsets), sum(counts)).astype(np.int64),
+        ids=np.concatenate([radio.ids for radio in radios]),
+        rssi=np.concatenate([radio.rssi for radio in radios]),
+        last_seen=np.concatenate([radio.last_seen for radio in radios]),
+        # Vocabularies are append-only, the longest one covers every id
+        vocabulary=max((radio.vocabulary for radio in radios), key=len),
+    )
+
+
+def load_building_radio(
+    building: str,
+    floor: str = "*",
+    root: Path = TRAIN_PATH,
+    vocabulary_path: Path = VOCABULARY_PATH,
+    sensor_files: Optional[List[Path]] = None,
+) -> Tuple[Dict[Path, Tuple[RadioData, RadioData]], RadioVocabulary]:
+
+    """
+    Function to load the Wi-Fi and iBeacon data of the traces of a building, encoded with the
+    building's persisted vocabulary. New keys are added to the vocabulary and it is saved again.
+
+    :param building: Building
+    :param floor: Floor glob pattern
+    :param root: Dataset directory
+    :param vocabulary_path: Vocabulary directory
+    :param sensor_files: Trace files to load, defaults to the building's traces in the catalog
+    :return: Wi-Fi and iBeacon data keyed by trace file, and the building vocabulary
+    """
+
+    if sensor_files is None:
+        with DatasetCatalog() as catalog:
+            sensor_files = catalog.traces(root, building, floor, largest_first=False)
+
+    path = vocabulary_path / f"{building}.npy"
+    vocabulary = RadioVocabulary.load(path)
+    known = len(vocabulary)
+
+    radio = {}
+    for sensor_file in sensor_files:
+        data = read_data_file_cached(sensor_file)
+        radio[sensor_file] = (vocabulary.encode(data.wifi), vocabulary.encode(data.ibeacon))
+
+    if len(vocabulary) != known:
+        vocabulary.save(path)
+
+    return radio, vocabulary
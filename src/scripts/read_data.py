@@ -1,12 +1,87 @@
 """
 Script provided by original hosts of the the competition. Can be found at:
 https://github.com/location-competition/indoor-location-competition-20/blob/master/io_f.py
+
+read_data_file has been rewritten to parse the whole file in bulk instead of line by line, Wi-Fi
+and iBeacon readings are returned as columnar RadioData instead of string arrays.
 """
 
-from dataclasses import dataclass
+import csv
+import io
+from dataclasses import dataclass, fields
+from typing import Dict, Tuple
 
 import numpy as np
 
+from src.util.definitions import SENSORS
+
+
+@dataclass
+class RadioData:
+
+    """
+    Columnar Wi-Fi or iBeacon readings. Readings are grouped into scans (readings with the same
+    timestamp), the readings of scan i are offsets[i]:offsets[i + 1]. BSSIDs and beacon ids
+    (uuid_major_minor) are interned, ids index into vocabulary, which is either the trace's own
+    vocabulary or a shared per-building one (see src.scripts.radio_vocabulary).
+
+    iBeacon readings have no separate last seen timestamp, it is the scan timestamp.
+    """
+
+    timestamps: np.ndarray  # int64, one per scan
+    offsets: np.ndarray  # int64, scans + 1
+    ids: np.ndarray  # int32, one per reading
+    rssi: np.ndarray  # int8, one per reading
+    last_seen: np.ndarray  # int64, one per reading
+    vocabulary: np.ndarray  # str, BSSID or beacon id of every id
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def reading_timestamps(self) -> np.ndarray:
+
+        """
+        Function to get the scan timestamp of every reading.
+
+        :return: Timestamps, shape (readings,)
+        """
+
+        return np.repeat(self.timestamps, np.diff(self.offsets))
+
+    def keys(self) -> np.ndarray:
+
+        """
+        Function to get the BSSID or beacon id of every reading as strings.
+
+        :return: Keys, shape (readings,)
+        """
+
+        return self.vocabulary[self.ids]
+
+    def to_arrays(self, prefix: str) -> Dict[str, np.ndarray]:
+
+        """
+        Function to get the columns as arrays for np.savez.
+
+        :param prefix: Prefix of the array names
+        :return: Arrays keyed by prefix_column
+        """
+
+        return {f"{prefix}_{field.name}": getattr(self, field.name) for field in fields(self)}
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix: str) -> "RadioData":
+
+        """
+        Function to restore radio data saved with to_arrays.
+
+        :param arrays: Mapping of array names to arrays, e.g. an open npz file
+        :param prefix: Prefix of the array names
+        :return: Radio data
+        """
+
+        return cls(**{field.name: arrays[f"{prefix}_{field.name}"] for field in fields(cls)})
+
 
 @dataclass
 class ReadData:
@@ -17,109 +92,173 @@ class ReadData:
     magn: np.ndarray
     magn_uncali: np.ndarray
     ahrs: np.ndarray
-    wifi: np.ndarray
-    ibeacon: np.ndarray
+    wifi: RadioData
+    ibeacon: RadioData
     waypoint: np.ndarray
 
 
+# Sensors with one timestamp and three float readings, keyed by ReadData field
+THREE_AXIS_SENSORS = {
+    "acce": "TYPE_ACCELEROMETER",
+    "acce_uncali": "TYPE_ACCELEROMETER_UNCALIBRATED",
+    "gyro": "TYPE_GYROSCOPE",
+    "gyro_uncali": "TYPE_GYROSCOPE_UNCALIBRATED",
+    "magn": "TYPE_MAGNETIC_FIELD",
+    "magn_uncali": "TYPE_MAGNETIC_FIELD_UNCALIBRATED",
+    "ahrs": "TYPE_ROTATION_VECTOR",
+}
+
+
+def get_line_bounds(buffer: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+    Finds start and end offsets of every line of a trace file.
+
+    :param buffer: Raw content of the trace file as bytes
+    :return: Start offsets and end offsets (exclusive, without line break) of every line
+    """
+
+    line_ends = np.append(np.flatnonzero(buffer == ord("\n")), len(buffer))
+    line_starts = np.append(0, line_ends[:-1] + 1)
+
+    return line_starts, line_ends
+
+
+def get_line_sensor_types(
+    buffer: np.ndarray, line_starts: np.ndarray, line_ends: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+    Finds the sensor type of every line of a trace file with vectorized byte comparisons. A line
+    has a sensor type if its second field is one of SENSORS and it has at most 10 fields.
+
+    :param buffer: Raw content of the trace file as bytes
+    :param line_starts: Start offset of every line
+    :param line_ends: End offset of every line
+    :return: Index into SENSORS for every line (-1 for comment, empty and erroneous lines) and
+    number of fields of every line
+    """
+
+    tabs = np.flatnonzero(buffer == ord("\t"))
+    first_tab = np.searchsorted(tabs, line_starts)
+    tab_count = np.searchsorted(tabs, line_ends) - first_tab
+
+    # Sensor type is the field between the first and second tab (or line end)
+    tabs = np.append(tabs, [len(buffer), len(buffer)])
+    type_start = tabs[first_tab] + 1
+    type_end = np.where(tab_count >= 2, tabs[first_tab + 1], line_ends)
+    type_length = np.where((tab_count >= 1) & (tab_count <= 9), type_end - type_start, -1)
+
+    sensor_types = np.full(len(line_starts), -1)
+
+    for sensor_index, sensor in enumerate(SENSORS):
+        name = np.frombuffer(sensor.encode("utf-8"), dtype=np.uint8)
+        candidates = np.flatnonzero(type_length == len(name))
+        type_bytes = buffer[type_start[candidates, None] + np.arange(len(name))]
+        matches = np.all(type_bytes == name, axis=1)
+        sensor_types[candidates[matches]] = sensor_index
+
+    return sensor_types, tab_count + 1
+
+
+def encode_radio(
+    timestamps: np.ndarray, keys: np.ndarray, rssi: np.ndarray, last_seen: np.ndarray
+) -> RadioData:
+
+    """
+    Function to encode radio readings columnar. Readings are sorted by timestamp (stable, so
+    readings of a scan keep their file order) and keys are interned into a sorted vocabulary.
+
+    :param timestamps: Timestamp of every reading
+    :param keys: BSSID or beacon id of every reading
+    :param rssi: RSSI of every reading
+    :param last_seen: Last seen timestamp of every reading
+    :return: Radio data
+    """
+
+    order = np.argsort(timestamps, kind="stable")
+    timestamps = np.asarray(timestamps, dtype=np.int64)[order]
+
+    vocabulary, ids = np.unique(np.asarray(keys, dtype=str)[order], return_inverse=True)
+    starts = np.flatnonzero(np.diff(timestamps, prepend=timestamps[:1] - 1))
+
+    return RadioData(
+        timestamps=timestamps[starts],
+        offsets=np.append(starts, len(timestamps)).astype(np.int64),
+        ids=ids.astype(np.int32),
+        rssi=np.clip(np.asarray(rssi, dtype=np.int64)[order], -128, 127).astype(np.int8),
+        last_seen=np.asarray(last_seen, dtype=np.int64)[order],
+        vocabulary=vocabulary,
+    )
+
+
 def read_data_file(data_filename):
-    acce = []
-    acce_uncali = []
-    gyro = []
-    gyro_uncali = []
-    magn = []
-    magn_uncali = []
-    ahrs = []
-    wifi = []
-    ibeacon = []
-    waypoint = []
-
-    with data_filename.open("r", encoding="utf-8") as file:
-        lines = file.readlines()
-
-    for line_data in lines:
-        line_data = line_data.strip()
-        if not line_data or line_data[0] == "#" or len(line_data.split("\t")) > 10:
-            continue
-
-        line_data = line_data.split("\t")
-
-        if line_data[1] == "TYPE_ACCELEROMETER":
-            acce.append(
-                [int(line_data[0]), float(line_data[2]), float(line_data[3]), float(line_data[4])]
-            )
-            continue
-
-        if line_data[1] == "TYPE_ACCELEROMETER_UNCALIBRATED":
-            acce_uncali.append(
-                [int(line_data[0]), float(line_data[2]), float(line_data[3]), float(line_data[4])]
-            )
-            continue
-
-        if line_data[1] == "TYPE_GYROSCOPE":
-            gyro.append(
-                [int(line_data[0]), float(line_data[2]), float(line_data[3]), float(line_data[4])]
-            )
-            continue
-
-        if line_data[1] == "TYPE_GYROSCOPE_UNCALIBRATED":
-            gyro_uncali.append(
-                [int(line_data[0]), float(line_data[2]), float(line_data[3]), float(line_data[4])]
-            )
-            continue
-
-        if line_data[1] == "TYPE_MAGNETIC_FIELD":
-            magn.append(
-                [int(line_data[0]), float(line_data[2]), float(line_data[3]), float(line_data[4])]
-            )
-            continue
-
-        if line_data[1] == "TYPE_MAGNETIC_FIELD_UNCALIBRATED":
-            magn_uncali.append(
-                [int(line_data[0]), float(line_data[2]), float(line_data[3]), float(line_data[4])]
-            )
-            continue
-
-        if line_data[1] == "TYPE_ROTATION_VECTOR":
-            ahrs.append(
-                [int(line_data[0]), float(line_data[2]), float(line_data[3]), float(line_data[4])]
-            )
-            continue
-
-        if line_data[1] == "TYPE_WIFI":
-            sys_ts = line_data[0]
-            ssid = line_data[2]
-            bssid = line_data[3]
-            rssi = line_data[4]
-            lastseen_ts = line_data[6]
-            wifi_data = [sys_ts, ssid, bssid, rssi, lastseen_ts]
-            wifi.append(wifi_data)
-            continue
-
-        if line_data[1] == "TYPE_BEACON":
-            ts = line_data[0]
-            uuid = line_data[2]
-            major = line_data[3]
-            minor = line_data[4]
-            rssi = line_data[6]
-            ibeacon_data = [ts, "_".join([uuid, major, minor]), rssi]
-            ibeacon.append(ibeacon_data)
-            continue
-
-        if line_data[1] == "TYPE_WAYPOINT":
-            waypoint.append([int(line_data[0]), float(line_data[2]), float(line_data[3])])
-
-    acce = np.array(acce)
-    acce_uncali = np.array(acce_uncali)
-    gyro = np.array(gyro)
-    gyro_uncali = np.array(gyro_uncali)
-    magn = np.array(magn)
-    magn_uncali = np.array(magn_uncali)
-    ahrs = np.array(ahrs)
-    wifi = np.array(wifi)
-    ibeacon = np.array(ibeacon)
-    waypoint = np.array(waypoint)
-
-    return ReadData(
-        acce, acce_uncali, gyro, gyro_uncali, magn, magn_uncali, ahrs, wifi, ibeacon, waypoint
+
+    """
+    Reads a trace file in bulk. Lines are grouped by sensor type with vectorized masks and every
+    group is tokenized in a single pass, instead of splitting and converting line by line.
+    Comment lines and erroneous lines with more than 10 fields are skipped.
+
+    :param data_filename: Path of data text file
+    :return: Parsed sensor data
+    """
+
+    # Imported here, traces read from the trace cache do not need pandas
+    import pandas as pd
+
+    with data_filename.open("rb") as file:
+        data = file.read()
+
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    line_starts, line_ends = get_line_bounds(buffer)
+    sensor_types, field_count = get_line_sensor_types(buffer, line_starts, line_ends)
+
+    def read_lines(sensor_names, columns, dtype):
+        indices = np.flatnonzero(np.isin(sensor_types, [SENSORS.index(s) for s in sensor_names]))
+
+        if len(indices) == 0:
+            return sensor_types[indices], np.empty((0, len(columns)), dtype=dtype)
+
+        starts, ends = line_starts[indices].tolist(), line_ends[indices].tolist()
+        frame = pd.read_csv(
+            io.BytesIO(b"\n".join([data[start:end] for start, end in zip(starts, ends)])),
+            sep="\t",
+            header=None,
+            names=range(field_count[indices].max()),
+            usecols=columns,
+            dtype=dtype,
+            quoting=csv.QUOTE_NONE,
+            na_filter=False,
+            encoding="utf-8",
+        )
+        return sensor_types[indices], frame.to_numpy(dtype=dtype)
+
+    def as_array(values):
+        return values if len(values) else np.array([])
+
+    # All three-axis sensors are tokenized together and split by type afterwards
+    three_axis_types, three_axis_values = read_lines(
+        THREE_AXIS_SENSORS.values(), [0, 2, 3, 4], float
     )
+    three_axis = {
+        field: as_array(three_axis_values[three_axis_types == SENSORS.index(sensor)])
+        for field, sensor in THREE_AXIS_SENSORS.items()
+    }
+
+    _, waypoint = read_lines(["TYPE_WAYPOINT"], [0, 2, 3], float)
+    waypoint = as_array(waypoint)
+
+    radio_types, radio = read_lines(["TYPE_WIFI", "TYPE_BEACON"], [0, 2, 3, 4, 6], object)
+
+    # Wi-Fi columns: timestamp, ssid, bssid, rssi, last seen timestamp
+    wifi = radio[radio_types == SENSORS.index("TYPE_WIFI")]
+    wifi_timestamps = wifi[:, 0].astype(np.int64)
+    wifi = encode_radio(wifi_timestamps, wifi[:, 2], wifi[:, 3], wifi[:, 4].astype(np.int64))
+
+    # iBeacon columns: timestamp, uuid, major, minor, rssi
+    beacon = radio[radio_types == SENSORS.index("TYPE_BEACON")]
+    beacon_ids = beacon[:, 1] + "_" + beacon[:, 2] + "_" + beacon[:, 3]
+    beacon_timestamps = beacon[:, 0].astype(np.int64)
+    ibeacon = encode_radio(beacon_timestamps, beacon_ids, beacon[:, 4], beacon_timestamps)
+
+    return ReadData(**three_axis, wifi=wifi, ibeacon=ibeacon, waypoint=waypoint)
@@ -0,0 +1,297 @@
+import json
+import os
+import tempfile
+import numpy as np
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.util.definitions import RESULTS_PATH
+
+CHUNK_SIZE = 4096
+
+
+def pack_covariances(covariances: np.ndarray) -> np.ndarray:
+
+    """
+    Function to pack symmetric covariances into their upper triangle as float32, 36 instead of
+    64 values for an 8-dim state. Values outside the float32 range become inf.
+
+    :param covariances: Covariances, shape (N, n, n)
+    :return: Packed covariances, shape (N, n * (n + 1) / 2)
+    """
+
+    rows, columns = np.triu_indices(covariances.shape[-1])
+
+    return covariances[:, rows, columns].astype(np.float32)
+
+
+def unpack_covariances(packed: np.ndarray) -> np.ndarray:
+
+    """
+    Function to unpack covariances packed with pack_covariances.
+
+    :param packed: Packed covariances, shape (N, n * (n + 1) / 2)
+    :return: Symmetric float64 covariances, shape (N, n, n)
+    """
+
+    n = int((np.sqrt(8 * packed.shape[-1] + 1) - 1) / 2)
+    rows, columns = np.triu_indices(n)
+
+    covariances = np.empty((len(packed), n, n))
+    covariances[:, rows, columns] = packed
+    covariances[:, columns, rows] = packed
+
+    return covariances
+
+
+def _atomic_write(path: Path, write):
+
+    """
+    Function to write a file through a temporary file which then atomically replaces it.
+
+    :param path: Path of the file to write
+    :param write: Function which writes the content to an open binary file
+    """
+
+    with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as f:
+        write(f)
+
+    os.replace(f.name, path)
+
+
+class ResultWriter:
+
+    """
+    Writer which streams per-sample filter outputs (states, covariances, ...) of one trace to
+    compressed chunks of CHUNK_SIZE samples under root / building / floor / trace. At most one
+    chunk is held in memory, so writing a trace takes constant RAM whatever its length.
+
+    Every field is an array with one row per sample. With compact covariances, fields whose
+    name ends in "covariances" are stored as upper-triangle float32.
+    """
+
+    def __init__(
+        self,
+        building: str,
+        floor: str,
+        trace: str,
+        root: Path = RESULTS_PATH,
+        chunk_size: int = CHUNK_SIZE,
+        compact_covariances: bool = False,
+    ):
+
+        """
+        :param building: Building
+        :param floor: Floor
+        :param trace: Trace name
+        :param root: Result store directory
+        :param chunk_size: Number of samples per chunk
+        :param compact_covariances: If true, covariances are stored as upper-triangle float32
+        """
+
+        self.directory = root / building / floor / trace
+        self.chunk_size = chunk_size
+        self.compact_covariances = compact_covariances
+
+        self._buffer = {}
+        self._buffered = 0
+        self._chunks = []
+        self._attributes = []
+
+        # Drop the metadata of an earlier run first so readers never see a partial trace
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / "meta.json").unlink(missing_ok=True)
+        for old_file in self.directory.glob("*.npz"):
+            old_file.unlink()
+
+    def append(self, timestamps: np.ndarray, **fields: np.ndarray):
+
+        """
+        Function to append samples. Every call must pass the same fields.
+
+        :param timestamps: Timestamps of the samples, shape (N,)
+        :param fields: Arrays with one row per sample, e.g. states=(N, 8), covariances=(N, 8, 8)
+        """
+
+        fields = dict(timestamps=np.asarray(timestamps), **fields)
+        start = 0
+
+        while start < len(timestamps):
+            stop = min(start + self.chunk_size - self._buffered, len(timestamps))
+            rows = slice(self._buffered, self._buffered + stop - start)
+
+            for name, values in fields.items():
+                values = np.asarray(values)
+                if name not in self._buffer:
+                    self._buffer[name] = np.empty(
+                        (self.chunk_size,) + values.shape[1:], values.dtype
+                    )
+                self._buffer[name][rows] = values[start:stop]
+
+            self._buffered += stop - start
+            start = stop
+
+            if self._buffered == self.chunk_size:
+                self._write_chunk()
+
+    def write_attributes(self, **attributes: np.ndarray):
+
+        """
+        Function to store per-trace arrays which are not sampled per step, such as waypoints or
+        the floor size.
+
+        :param attributes: Arrays to store
+        """
+
+        _atomic_write(self.directory / "attributes.npz", lambda f: np.savez(f, **attributes))
+        self._attributes = sorted(attributes)
+
+    def _write_chunk(self):
+        chunk = {name: values[: self._buffered] for name, values in self._buffer.items()}
+
+        if self.compact_covariances:
+            for name in chunk:
+                if name.endswith("covariances"):
+                    chunk[name] = pack_covariances(chunk[name])
+
+        filename = f"chunk_{len(self._chunks):06d}.npz"
+        _atomic_write(self.directory / filename, lambda f: np.savez_compressed(f, **chunk))
+
+        timestamps = chunk["timestamps"]
+        self._chunks.append(
+            dict(
+                file=filename,
+                samples=int(self._buffered),
+                t_start=float(timestamps.min()),
+                t_end=float(timestamps.max()),
+            )
+        )
+        self._buffered = 0
+
+    def close(self):
+
+        """
+        Function to write the last chunk and the metadata. The trace only becomes visible to
+        readers once its metadata is written.
+        """
+
+        if self._buffered:
+            self._write_chunk()
+
+        meta = dict(
+            chunks=self._chunks,
+            fields=sorted(self._buffer),
+            attributes=self._attributes,
+            compact_covariances=self.compact_covariances,
+        )
+        _atomic_write(self.directory / "meta.json", lambda f: f.write(json.dumps(meta).encode()))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+
+
+class ResultReader:
+
+    """
+    Reader of results written with ResultWriter. Only chunks overlapping the requested time
+    range are loaded.
+    """
+
+    def __init__(self, building: str, floor: str, trace: str, root: Path = RESULTS_PATH):
+
+        """
+        :param building: Building
+        :param floor: Floor
+        :param trace: Trace name
+        :param root: Result store directory
+        """
+
+        self.directory = root / building / floor / trace
+
+        with (self.directory / "meta.json").open() as f:
+            self.meta = json.load(f)
+
+    @property
+    def fields(self) -> List[str]:
+        return self.meta["fields"]
+
+    def read(
+        self,
+        t_start: Optional[float] = None,
+        t_end: Optional[float] = None,
+        fields: Optional[Iterable[str]] = None,
+    ) -> Dict[str, np.ndarray]:
+
+        """
+        Function to read the samples with t_start <= timestamp <= t_end.
+
+        :param t_start: First timestamp to read, from the start of the trace if None
+        :param t_end: Last timestamp to read, to the end of the trace if None
+        :param fields: Fields to read, all if None. Timestamps are always read
+        :return: Arrays keyed by field name, covariances unpacked to float64
+        """
+
+        t_start = -np.inf if t_start is None else t_start
+        t_end = np.inf if t_end is None else t_end
+        fields = ["timestamps"] + [
+            name for name in (self.fields if fields is None else fields) if name != "timestamps"
+        ]
+
+        parts = {name: [] for name in fields}
+
+        for chunk in self.meta["chunks"]:
+            if chunk["t_end"] < t_start or chunk["t_start"] > t_end:
+                continue
+
+            with np.load(self.directory / chunk["file"]) as data:
+                timestamps = data["timestamps"]
+                selected = (timestamps >= t_start) & (timestamps <= t_end)
+
+                for name in fields:
+                    values = data[name][selected]
+                    if self.meta["compact_covariances"] and name.endswith("covariances"):
+                        values = unpack_covariances(values)
+                    parts[name].append(values)
+
+        return {
+            name: np.concatenate(values) if values else np.empty(0)
+            for name, values in parts.items()
+        }
+
+    def attributes(self) -> Dict[str, np.ndarray]:
+
+        """
+        Function to read the per-trace arrays stored with ResultWriter.write_attributes.
+
+        :return: Arrays keyed by name
+        """
+
+        if not self.meta["attributes"]:
+            return {}
+
+        with np.load(self.directory / "attributes.npz") as data:
+            return {name: data[name] for name in data.files}
+
+
+def list_results(
+    root: Path = RESULTS_PATH, building: str = "*", floor: str = "*"
+) -> List[Tuple[str, str, str]]:
+
+    """
+    Function to list the traces in the result store by building and floor glob patterns.
+
+    :param root: Result store directory
+    :param building: Building glob pattern
+    :param floor: Floor glob pattern
+    :return: List of (building, floor, trace)
+    """
+
+    return sorted(
+        (meta.parent.parent.parent.name, meta.parent.parent.name, meta.parent.name)
+        for meta in root.glob(f"{building}/{floor}/*/meta.json")
+    )
@@ -0,0 +1,210 @@
+import csv
+import json
+import os
+import re
+import numpy as np
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Columns of the competition submission, site_path_timestamp joins the building, trace and
+# requested timestamp with underscores
+SUBMISSION_COLUMNS = ("site_path_timestamp", "floor", "x", "y")
+
+
+def floor_number(floor: str) -> int:
+
+    """
+    Function to convert a floor name of the dataset to the floor number of the submission.
+    Basements are negative and the ground floor is 0, so B1 is -1 and both F1 and 1F are 0.
+
+    :param floor: Floor name, e.g. B2, B1, F1, 1F, F3 or 3F
+    :return: Floor number
+    """
+
+    basement = re.fullmatch(r"B(\d+)", floor)
+    if basement:
+        return -int(basement.group(1))
+
+    level = re.fullmatch(r"F(\d+)|(\d+)F", floor)
+    if level:
+        return int(level.group(1) or level.group(2)) - 1
+
+    raise ValueError(f"Unknown floor name {floor}")
+
+
+def read_sample_submission(
+    path: Path,
+) -> Dict[Tuple[str, str], Tuple[np.ndarray, List[str]]]:
+
+    """
+    Function to read the requested timestamps of every test trace from a sample submission.
+
+    :param path: Sample submission CSV
+    :return: Requested timestamps (ms) and the sample rows of every trace, keyed by
+    (building, trace) in the order of the file
+    """
+
+    requests = OrderedDict()
+
+    with path.open(newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        for row in reader:
+            building, trace, timestamp = row[0].split("_")
+            timestamps, rows = requests.setdefault((building, trace), ([], []))
+            timestamps.append(int(timestamp))
+            rows.append(",".join(row))
+
+    return OrderedDict(
+        (key, (np.array(timestamps, dtype=np.int64), rows))
+        for key, (timestamps, rows) in requests.items()
+    )
+
+
+def submission_rows(
+    building: str, trace: str, timestamps: np.ndarray, floor: int, positions: np.ndarray
+) -> List[str]:
+
+    """
+    Function to format the submission rows of one trace.
+
+    :param building: Building
+    :param trace: Trace
+    :param timestamps: Requested timestamps (ms)
+    :param floor: Floor number
+    :param positions: Predicted positions (x, y) at the requested timestamps
+    :return: CSV rows without line endings
+    """
+
+    return [
+        f"{building}_{trace}_{timestamp:013d},{floor},{x:.6f},{y:.6f}"
+        for timestamp, (x, y) in zip(timestamps, positions)
+    ]
+
+
+def checkpoint_path(directory: Path, trace: str) -> Path:
+
+    """
+    Function to get the checkpoint file of a trace.
+
+    :param directory: Checkpoint directory
+    :param trace: Trace
+    :return: Path of the checkpoint file
+    """
+
+    return directory / f"{trace}.csv"
+
+
+def write_checkpoint(directory: Path, trace: str, rows: Sequence[str]):
+
+    """
+    Function to save the submission rows of a finished trace. The rows are written to a
+    temporary file which is then renamed, so an interrupted run never leaves a partial
+    checkpoint behind.
+
+    :param directory: Checkpoint directory
+    :param trace: Trace
+    :param rows: Submission rows of the trace
+    """
+
+    path = checkpoint_path(directory, trace)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(f".{path.name}.{os.getpid()}")
+
+    with partial.open("w") as f:
+        f.writelines(f"{row}\n" for row in rows)
+    os.replace(partial, path)
+
+
+def read_checkpoint(directory: Path, trace: str) -> Optional[List[str]]:
+
+    """
+    Function to load the submission rows of a trace finished by an earlier run.
+
+    :param directory: Checkpoint directory
+    :param trace: Trace
+    :return: Submission rows, None if the trace has no checkpoint
+    """
+
+    path = checkpoint_path(directory, trace)
+
+    if not path.exists():
+        return None
+
+    return path.read_text().splitlines()
+
+
+def check_checkpoint_setup(directory: Path, setup: Dict[str, str]):
+
+    """
+    Function to record the setup of the runs of a checkpoint directory, or to check that a
+    resumed run uses the same one. Checkpoints only depend on the trace otherwise, so rows of
+    runs with other parameters would silently end up in the same submission.
+
+    :param directory: Checkpoint directory
+    :param setup: Values the rows of a trace depend on, e.g. a parameters digest
+    :raises ValueError: If the checkpoints were written with another setup
+    """
+
+    path = directory / "setup.json"
+
+    if path.exists():
+        with path.open() as f:
+            recorded = json.load(f)
+        for name, value in setup.items():
+            if recorded.get(name) != value:
+                raise ValueError(
+                    f"Checkpoints in {directory} were written with other {name}, delete them or "
+                    "use another checkpoint directory"
+                )
+        return
+
+    directory.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(f".{path.name}.{os.getpid()}")
+    with partial.open("w") as f:
+        json.dump(setup, f)
+    os.replace(partial, path)
+
+
+class SubmissionWriter:
+
+    """
+    Context manager to stream rows into a submission CSV as traces finish. Rows go to a
+    partial file next to the submission, which replaces the submission only when the writer is
+    closed without an error, so an interrupted run does not leave a truncated submission.
+    """
+
+    def __init__(self, path: Path):
+
+        """
+        :param path: Submission CSV
+        """
+
+        self.path = path
+        self.partial = path.with_name(f"{path.name}.partial")
+        self.rows = 0
+
+    def __enter__(self) -> "SubmissionWriter":
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = self.partial.open("w")
+        self.file.write(",".join(SUBMISSION_COLUMNS) + "\n")
+        return self
+
+    def write(self, rows: Sequence[str]):
+
+        """
+        Function to append rows to the submission.
+
+        :param rows: Submission rows
+        """
+
+        self.file.writelines(f"{row}\n" for row in rows)
+        self.file.flush()
+        self.rows += len(rows)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.partial, self.path)
@@ -0,0 +1,139 @@
+import json
+import numpy as np
+
+from pathlib import Path
+
+THREE_AXIS_SYNTHETIC_SENSORS = (
+    "TYPE_ACCELEROMETER",
+    "TYPE_MAGNETIC_FIELD",
+    "TYPE_GYROSCOPE",
+    "TYPE_ROTATION_VECTOR",
+)
+
+UNCALIBRATED_SYNTHETIC_SENSORS = (
+    "TYPE_MAGNETIC_FIELD_UNCALIBRATED",
+    "TYPE_GYROSCOPE_UNCALIBRATED",
+    "TYPE_ACCELEROMETER_UNCALIBRATED",
+)
+
+
+def write_synthetic_trace(
+    filepath: Path,
+    duration: float = 60.0,
+    rate: float = 50.0,
+    waypoint_interval: float = 5.0,
+    wifi_interval: float = 2.0,
+    width: float = 200.0,
+    height: float = 150.0,
+    seed: int = 0,
+):
+
+    """
+    Function to write a synthetic trace file in the competition's text format. A person walks a
+    random smooth path over the floor, sensors are sampled at a fixed rate and waypoints, Wi-Fi
+    scans and iBeacon readings are added at fixed intervals.
+
+    :param filepath: Path of the trace file to write
+    :param duration: Length of the trace in seconds
+    :param rate: Sensor sampling rate in Hz
+    :param waypoint_interval: Seconds between waypoints
+    :param wifi_interval: Seconds between Wi-Fi scans and iBeacon readings
+    :param width: Floor width in meters
+    :param height: Floor height in meters
+    :param seed: Random seed
+    """
+
+    rng = np.random.default_rng(seed)
+
+    start_time = 1578462618000
+    sample_count = int(duration * rate)
+    timestamps = start_time + np.round(np.arange(sample_count) * 1000 / rate).astype(np.int64)
+
+    # Walk at roughly 1.2 m/s with a slowly changing heading, reflected at the floor edges
+    heading = np.cumsum(rng.normal(0.0, 0.05, sample_count))
+    step = 1.2 / rate
+    x = np.abs(np.cumsum(step * np.cos(heading)) + width / 2) % (2 * width)
+    y = np.abs(np.cumsum(step * np.sin(heading)) + height / 2) % (2 * height)
+    x = np.where(x > width, 2 * width - x, x)
+    y = np.where(y > height, 2 * height - y, y)
+
+    lines = [
+        "#\tSiteID:synthetic\tSiteName:synthetic\tFloorId:F1\tFloorName:F1",
+        f"#\tstartTime:{start_time}",
+    ]
+
+    step_phase = 2 * np.pi * 2.0 * np.arange(sample_count) / rate
+    acceleration = np.column_stack(
+        (
+            rng.normal(0.0, 0.3, sample_count),
+            1.5 * np.sin(step_phase) + rng.normal(0.0, 0.3, sample_count),
+            9.81 + 2.0 * np.sin(2 * step_phase) + rng.normal(0.0, 0.3, sample_count),
+        )
+    )
+    readings = {
+        "TYPE_ACCELEROMETER": acceleration,
+        "TYPE_MAGNETIC_FIELD": rng.normal(0.0, 1.0, (sample_count, 3)) + [20.0, -5.0, -40.0],
+        "TYPE_GYROSCOPE": np.column_stack(
+            (rng.normal(0.0, 0.1, (sample_count, 2)), np.gradient(heading) * rate)
+        ),
+        "TYPE_ROTATION_VECTOR": np.column_stack(
+            (rng.normal(0.0, 0.01, (sample_count, 2)), np.sin(heading / 2))
+        ),
+    }
+
+    wifi_every = max(int(wifi_interval * rate), 1)
+    waypoint_every = max(int(waypoint_interval * rate), 1)
+    access_points = [f"{k:02x}:1c:2d:3e:4f:{k * 7 % 256:02x}" for k in range(30)]
+    access_point_positions = rng.uniform((0.0, 0.0), (width, height), (len(access_points), 2))
+
+    for i in range(sample_count):
+        timestamp = timestamps[i]
+
+        for sensor in THREE_AXIS_SYNTHETIC_SENSORS:
+            value = readings[sensor][i]
+            values = "\t".join(f"{v:.6f}" for v in value)
+            lines.append(f"{timestamp}\t{sensor}\t{values}\t3")
+
+        for sensor in UNCALIBRATED_SYNTHETIC_SENSORS:
+            value = readings[sensor.replace("_UNCALIBRATED", "")][i]
+            bias = rng.normal(0.0, 0.01, 3)
+            values = "\t".join(f"{v:.6f}" for v in np.concatenate((value + bias, bias)))
+            lines.append(f"{timestamp}\t{sensor}\t{values}\t3")
+
+        if i % wifi_every == 0:
+            distances = np.hypot(*(access_point_positions - [x[i], y[i]]).T)
+            for k in np.argsort(distances)[:10]:
+                rssi = int(-30 - 20 * np.log10(distances[k] + 1.0) + rng.normal(0.0, 2.0))
+                lines.append(
+                    f"{timestamp}\tTYPE_WIFI\tssid_{k}\t{access_points[k]}\t{rssi}\t2412\t"
+                    f"{timestamp - int(rng.integers(0, 2000))}"
+                )
+            lines.append(
+                f"{timestamp}\tTYPE_BEACON\tFDA50693-A4E2-4FB1-AFCF-C6EB07647825\t10073\t"
+                f"{61418 + i % 3}\t-65\t{int(-60 - rng.integers(0, 30))}\t3.5\t"
+                f"{access_points[i % len(access_points)]}\t{timestamp}"
+            )
+
+        if i % waypoint_every == 0 or i == sample_count - 1:
+            lines.append(f"{timestamp}\tTYPE_WAYPOINT\t{x[i]:.5f}\t{y[i]:.5f}")
+
+    lines.append(f"#\tendTime:{timestamps[-1]}")
+
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    with filepath.open("w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def write_synthetic_floor_info(filepath: Path, width: float = 200.0, height: float = 150.0):
+
+    """
+    Function to write a floor_info.json file for a synthetic floor.
+
+    :param filepath: Path of the floor info file to write
+    :param width: Floor width in meters
+    :param height: Floor height in meters
+    """
+
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    with filepath.open("w", encoding="utf-8") as f:
+        json.dump({"map_info": {"width": width, "height": height}}, f)
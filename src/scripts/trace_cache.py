@@ -0,0 +1,222 @@
+import hashlib
+import os
+import sys
+import tempfile
+import time
+import zipfile
+import numpy as np
+
+from dataclasses import fields
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.scripts.read_data import RadioData, ReadData, read_data_file
+from src.util.definitions import CACHE_PATH, MAX_CACHE_BYTES
+
+# Temporary files older than this (s) are left over from writers which died mid-write
+STALE_TEMP_SECONDS = 3600
+
+# Estimated total size of every cache directory this process has written to. The directory is
+# scanned once, then only the files this process writes are added, and the estimate is reset to
+# the real size whenever it goes over budget and the directory is scanned to evict entries.
+_cache_bytes: Dict[Path, int] = {}
+
+
+def cache_key(filepath: Path) -> str:
+
+    """
+    Function to compute cache key of a trace file. The key changes whenever the file is moved,
+    modified or resized, so stale entries are never read.
+
+    :param filepath: Path of data text file
+    :return: Hex digest identifying the current version of the file
+    """
+
+    stat = filepath.stat()
+    key = f"{filepath.resolve()}|{stat.st_mtime_ns}|{stat.st_size}"
+
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def data_arrays(data: ReadData) -> Dict[str, np.ndarray]:
+
+    """
+    Function to flatten parsed trace data into named arrays, radio data columns are named
+    field_column.
+
+    :param data: Parsed data
+    :return: Arrays keyed by name
+    """
+
+    arrays = {}
+    for field in fields(ReadData):
+        value = getattr(data, field.name)
+        if isinstance(value, RadioData):
+            arrays.update(value.to_arrays(field.name))
+        else:
+            arrays[field.name] = value
+
+    return arrays
+
+
+def data_from_arrays(arrays) -> ReadData:
+
+    """
+    Function to restore parsed trace data flattened with data_arrays.
+
+    :param arrays: Mapping of array names to arrays, e.g. an open npz file
+    :return: Parsed data
+    """
+
+    values = {}
+    for field in fields(ReadData):
+        if field.type is RadioData:
+            values[field.name] = RadioData.from_arrays(arrays, field.name)
+        else:
+            values[field.name] = arrays[field.name]
+
+    return ReadData(**values)
+
+
+def load_cached_data(filepath: Path, cache_dir: Path = CACHE_PATH) -> Optional[ReadData]:
+
+    """
+    Function to load parsed trace data from cache.
+
+    :param filepath: Path of data text file
+    :param cache_dir: Cache directory
+    :return: Parsed data, or None if the trace is not cached
+    """
+
+    cache_file = cache_dir / f"{cache_key(filepath)}.npz"
+
+    try:
+        with np.load(cache_file, allow_pickle=False) as cached:
+            data = data_from_arrays(cached)
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+    # Refresh modification time so that eviction drops least recently used traces first. A
+    # read-only cache or an entry evicted since it was loaded is still a hit
+    try:
+        os.utime(cache_file)
+    except OSError:
+        pass
+
+    return data
+
+
+def save_cached_data(
+    filepath: Path, data: ReadData, cache_dir: Path = CACHE_PATH, max_bytes: int = MAX_CACHE_BYTES
+):
+
+    """
+    Function to save parsed trace data to cache. The cache file is written to a temporary file
+    first and then moved in place, so concurrent readers never see a partial file. The cache
+    directory is only scanned for eviction when its estimated size goes over max_bytes.
+
+    :param filepath: Path of data text file
+    :param data: Parsed data
+    :param cache_dir: Cache directory
+    :param max_bytes: Maximum total size of the cache directory
+    """
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    cache_file = cache_dir / f"{cache_key(filepath)}.npz"
+
+    f = tempfile.NamedTemporaryFile(dir=cache_dir, suffix=".tmp", delete=False)
+    temp_file = Path(f.name)
+    try:
+        with f:
+            np.savez(f, **data_arrays(data))
+        size = temp_file.stat().st_size
+        os.replace(temp_file, cache_file)
+    finally:
+        temp_file.unlink(missing_ok=True)
+
+    if cache_dir not in _cache_bytes:
+        _cache_bytes[cache_dir] = cache_size(cache_dir)
+    else:
+        _cache_bytes[cache_dir] += size
+
+    if _cache_bytes[cache_dir] > max_bytes:
+        _cache_bytes[cache_dir] = evict_cache(cache_dir, max_bytes)
+
+
+def cache_size(cache_dir: Path = CACHE_PATH) -> int:
+
+    """
+    Function to get the total size of the cache files in a cache directory.
+
+    :param cache_dir: Cache directory
+    :return: Total size in bytes
+    """
+
+    return sum(size for _, size, _ in _cache_files(cache_dir))
+
+
+def _cache_files(cache_dir: Path):
+    for cache_file in cache_dir.glob("*.npz"):
+        try:
+            stat = cache_file.stat()
+        except FileNotFoundError:
+            continue
+        yield stat.st_mtime, stat.st_size, cache_file
+
+
+def evict_cache(cache_dir: Path = CACHE_PATH, max_bytes: int = MAX_CACHE_BYTES) -> int:
+
+    """
+    Function to remove least recently used cache files until the cache fits in max_bytes.
+    Temporary files left behind by writers which died mid-write are removed as well.
+
+    :param cache_dir: Cache directory
+    :param max_bytes: Maximum total size of the cache directory
+    :return: Total size of the remaining cache files
+    """
+
+    stale = time.time() - STALE_TEMP_SECONDS
+    for temp_file in cache_dir.glob("*.tmp"):
+        try:
+            if temp_file.stat().st_mtime < stale:
+                temp_file.unlink()
+        except FileNotFoundError:
+            continue
+
+    cache_files = list(_cache_files(cache_dir))
+    total_bytes = sum(size for _, size, _ in cache_files)
+
+    for _, size, cache_file in sorted(cache_files):
+        if total_bytes <= max_bytes:
+            break
+        cache_file.unlink(missing_ok=True)
+        total_bytes -= size
+
+    return total_bytes
+
+
+def read_data_file_cached(
+    filepath: Path, cache_dir: Path = CACHE_PATH, max_bytes: int = MAX_CACHE_BYTES
+) -> ReadData:
+
+    """
+    Function to read a trace file through the on-disk cache. The text file is only parsed if it
+    is not cached yet or has changed since it was cached. A cache which cannot be written, e.g.
+    a read-only directory, is reported and the parsed data is returned anyway.
+
+    :param filepath: Path of data text file
+    :param cache_dir: Cache directory
+    :param max_bytes: Maximum total size of the cache directory
+    :return: Parsed data
+    """
+
+    data = load_cached_data(filepath, cache_dir)
+
+    if data is None:
+        data = read_data_file(filepath)
+        try:
+            save_cached_data(filepath, data, cache_dir, max_bytes)
+        except OSError as error:
+            print(f"Could not cache {filepath}: {error!r}", file=sys.stderr)
+
+    return data
@@ -1,3 +1,5 @@
+import os
+
 from pathlib import Path
 
 PROJECT_PATH: Path = Path(__file__).parent.parent.parent
@@ -6,6 +8,20 @@ DATA_PATH: Path = PROJECT_PATH / "data"
 TRAIN_PATH: Path = DATA_PATH / "train"
 TEST_PATH: Path = DATA_PATH / "test"
 METADATA_PATH: Path = DATA_PATH / "metadata"
+RESULTS_PATH: Path = PROJECT_PATH / "results"
+CACHE_PATH: Path = Path(os.environ.get("INDOOR_CACHE_PATH", DATA_PATH / "cache"))
+
+CATALOG_PATH: Path = Path(os.environ.get("INDOOR_CATALOG_PATH", DATA_PATH / "catalog.sqlite"))
+DATA_FIX_MANIFEST_PATH: Path = DATA_PATH / "data_fix_manifest.json"
+FINGERPRINT_PATH: Path = DATA_PATH / "fingerprints"
+VOCABULARY_PATH: Path = DATA_PATH / "vocabulary"
+SWEEP_PATH: Path = RESULTS_PATH / "sweeps"
+SAMPLE_SUBMISSION_PATH: Path = DATA_PATH / "sample_submission.csv"
+SUBMISSION_PATH: Path = RESULTS_PATH / "submission.csv"
+CHECKPOINT_PATH: Path = RESULTS_PATH / "checkpoints"
+
+# Upper bound on the size of the parsed trace cache, least recently used traces are evicted first
+MAX_CACHE_BYTES: int = 2 * 1024 ** 3
 
 SENSORS = (
     "TYPE_ACCELEROMETER",
@@ -20,8 +36,10 @@ SENSORS = (
     "TYPE_WAYPOINT",
 )
 
-sensor_train_files = list(TRAIN_PATH.glob(r"**/*.txt"))
+# Trace files are looked up through src.scripts.dataset_catalog, nothing is globbed at import time
+EXAMPLE_BUILDING = "5a0546857ecc773753327266"
+EXAMPLE_FLOOR = "B1"
 
-example_train = list(TRAIN_PATH.glob(r"5a0546857ecc773753327266/B1/5e158ee91506f2000638fd17.txt"))
-example_floor_plan = list(METADATA_PATH.glob(r"5a0546857ecc773753327266/B1/floor_image.png"))
-example_json_plan = list(METADATA_PATH.glob(r"5a0546857ecc773753327266/B1/floor_info.json"))
+example_train: Path = TRAIN_PATH / EXAMPLE_BUILDING / EXAMPLE_FLOOR / "5e158ee91506f2000638fd17.txt"
+example_floor_plan: Path = METADATA_PATH / EXAMPLE_BUILDING / EXAMPLE_FLOOR / "floor_image.png"
+example_json_plan: Path = METADATA_PATH / EXAMPLE_BUILDING / EXAMPLE_FLOOR / "floor_info.json"
@@ -0,0 +1,129 @@
+import numpy as np
+
+from collections import defaultdict
+from typing import List
+
+
+class FilterObserver:
+
+    """
+    Observer which the filter loop, compute_sigmas, perform_ut, update and rts_smoother report
+    to. Every hook of this base class does nothing, so it can be used as a zero-cost default.
+    """
+
+    def on_stage(self, stage: str, seconds: float):
+
+        """
+        Called after a stage (function) of the filter has run.
+
+        :param stage: Stage name
+        :param seconds: Wall time spent in the stage
+        """
+
+    def on_innovation(self, innovation: np.ndarray, innovation_covariance: np.ndarray):
+
+        """
+        Called by the update step with the measurement residual.
+
+        :param innovation: Measurement minus predicted measurement
+        :param innovation_covariance: Covariance of the predicted measurement
+        """
+
+    def on_step(self, measurement: np.ndarray, state: np.ndarray, covariance: np.ndarray):
+
+        """
+        Called after every filter step.
+
+        :param measurement: Measurement of the step
+        :param state: Estimated state
+        :param covariance: Estimated covariance
+        """
+
+
+NULL_OBSERVER = FilterObserver()
+
+
+class MetricsObserver(FilterObserver):
+
+    """
+    Observer which collects per-stage wall time, step counts, innovation norms and covariance
+    condition numbers.
+    """
+
+    def __init__(self):
+        self.stage_seconds = defaultdict(float)
+        self.stage_calls = defaultdict(int)
+        self.steps = 0
+        self.innovation_norms = []
+        self.condition_numbers = []
+
+    def on_stage(self, stage: str, seconds: float):
+        self.stage_seconds[stage] += seconds
+        self.stage_calls[stage] += 1
+
+    def on_innovation(self, innovation: np.ndarray, innovation_covariance: np.ndarray):
+        self.innovation_norms.append(np.linalg.norm(innovation))
+
+    def on_step(self, measurement: np.ndarray, state: np.ndarray, covariance: np.ndarray):
+        self.steps += 1
+        self.condition_numbers.append(np.linalg.cond(covariance))
+
+    def summary(self) -> str:
+
+        """
+        Function to get a text report of the collected metrics.
+
+        :return: Report
+        """
+
+        lines = [f"{'stage':<16}{'calls':>10}{'total s':>12}{'mean ms':>12}"]
+        for stage, seconds in sorted(self.stage_seconds.items(), key=lambda item: -item[1]):
+            calls = self.stage_calls[stage]
+            lines.append(f"{stage:<16}{calls:>10}{seconds:>12.3f}{1000 * seconds / calls:>12.4f}")
+
+        lines.append(f"steps: {self.steps}")
+
+        for name, values in (
+            ("innovation norm", self.innovation_norms),
+            ("covariance condition number", self.condition_numbers),
+        ):
+            if values:
+                lines.append(
+                    f"{name}: mean {np.mean(values):.4g}, median {np.median(values):.4g}, "
+                    f"max {np.max(values):.4g}"
+                )
+
+        return "\n".join(lines)
+
+
+class PrintObserver(FilterObserver):
+
+    """
+    Observer which prints measured and predicted positions of every step.
+    """
+
+    def on_step(self, measurement: np.ndarray, state: np.ndarray, covariance: np.ndarray):
+        print("Measurement: ", "(", measurement[0], measurement[1], ")")
+        print("predictions: ", "(", state[0], state[1], ")")
+
+
+class CompositeObserver(FilterObserver):
+
+    """
+    Observer which forwards every hook to several observers.
+    """
+
+    def __init__(self, observers: List[FilterObserver]):
+        self.observers = observers
+
+    def on_stage(self, stage: str, seconds: float):
+        for observer in self.observers:
+            observer.on_stage(stage, seconds)
+
+    def on_innovation(self, innovation: np.ndarray, innovation_covariance: np.ndarray):
+        for observer in self.observers:
+            observer.on_innovation(innovation, innovation_covariance)
+
+    def on_step(self, measurement: np.ndarray, state: np.ndarray, covariance: np.ndarray):
+        for observer in self.observers:
+            observer.on_step(measurement, state, covariance)
@@ -1,15 +1,32 @@
+import json
 import numpy as np
-import sklearn.datasets as sk
 
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
+from pathlib import Path
 from scipy.linalg import block_diag
+from typing import Optional
+
+# Fields of Params which hold matrices, the remaining fields are scalars
+MATRIX_FIELDS = (
+    "initial_mu_",
+    "initial_covariance_",
+    "R_",
+    "waypoint_process_noise",
+    "linear_acc_process_noise",
+    "angle_process_noise",
+    "process_noise",
+)
 
 
 @dataclass
 class Params:
 
     """
-    Dataclass to store initial system states
+    Dataclass to store initial system states and the sigma point parameters. Matrices which are
+    not given are drawn randomly when an instance is created, from a generator seeded with seed,
+    so the same seed gives the same matrices on every run. Parameters can be saved to and loaded
+    from a file, a loaded .npz file holds every matrix and skips drawing them (and importing
+    scikit-learn) completely.
     """
 
     mu_x: int = 100
@@ -20,19 +37,158 @@ class Params:
     mu_yaw: float = 0.01
     mu_pitch: float = 0.01
     mu_roll: float = 0.01
+    alpha: float = 0.3
+    beta: float = 2.0
+    kappa: float = -5
+    seed: Optional[int] = None
+
+    initial_mu_: Optional[np.ndarray] = None
+    initial_covariance_: Optional[np.ndarray] = None
+    R_: Optional[np.ndarray] = None
+    waypoint_process_noise: Optional[np.ndarray] = None
+    linear_acc_process_noise: Optional[np.ndarray] = None
+    angle_process_noise: Optional[np.ndarray] = None
+    process_noise: Optional[np.ndarray] = None
+
+    def __post_init__(self):
+        for name in MATRIX_FIELDS:
+            if getattr(self, name) is not None:
+                setattr(self, name, np.asarray(getattr(self, name), dtype=float))
+
+        if self.initial_mu_ is None:
+            self.initial_mu_ = np.array(
+                [
+                    self.mu_x,
+                    self.mu_y,
+                    self.mu_laccx,
+                    self.mu_laccy,
+                    self.mu_laccz,
+                    self.mu_yaw,
+                    self.mu_pitch,
+                    self.mu_roll,
+                ]
+            )
+
+        if all(getattr(self, name) is not None for name in MATRIX_FIELDS):
+            return
+
+        # Every draw is made even if its matrix is given, so the other matrices do not depend on
+        # which ones were given
+        rng = np.random.default_rng(self.seed)
+
+        # sklearn takes a legacy seed, it is drawn from the generator to follow the seed as well
+        covariance_seed = int(rng.integers(2 ** 31))
+        if self.initial_covariance_ is None:
+            import sklearn.datasets as sk
+
+            self.initial_covariance_ = sk.make_sparse_spd_matrix(8, random_state=covariance_seed)
+            self.initial_covariance_[0, 0], self.initial_covariance_[1, 1] = 100, 100
+
+        draws = (
+            ("R_", 0.0, 1.0, (8, 8)),
+            ("waypoint_process_noise", 100.0, 100, (2, 2)),
+            ("linear_acc_process_noise", 0.0, 5.0, (3, 3)),
+            ("angle_process_noise", 0.0, 2 * np.pi, (3, 3)),
+        )
+        for name, loc, scale, shape in draws:
+            matrix = rng.normal(loc, scale, shape)
+            if getattr(self, name) is None:
+                setattr(self, name, matrix)
+
+        if self.process_noise is None:
+            self.process_noise = block_diag(
+                self.waypoint_process_noise,
+                self.linear_acc_process_noise,
+                self.angle_process_noise,
+            )
+
+    def generator(self, index: int = 0) -> np.random.Generator:
+
+        """
+        Function to get a random generator for the fx and hx noise of a run. Generators follow
+        the seed, but are independent of the generator of the matrices above and of each other.
+
+        :param index: Index of the run, e.g. of the trace in a dataset run
+        :return: Random generator
+        """
+
+        return np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(index,)))
+
+    def save(self, path: Path):
+
+        """
+        Function to save the parameters, including every matrix.
+
+        :param path: Parameter file, .npz, .json, .yaml or .yml
+        """
+
+        values = {field.name: getattr(self, field.name) for field in fields(self)}
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        if path.suffix == ".npz":
+            if values["seed"] is None:
+                del values["seed"]
+            np.savez(path, **values)
+            return
+
+        values = {
+            name: value.tolist() if isinstance(value, np.ndarray) else value
+            for name, value in values.items()
+        }
+        with path.open("w") as f:
+            if path.suffix in (".yaml", ".yml"):
+                import yaml
+
+                yaml.safe_dump(values, f)
+            else:
+                json.dump(values, f, indent=2)
+
+    @classmethod
+    def load(cls, path: Path) -> "Params":
+
+        """
+        Function to load parameters. Files may hold any subset of the fields, missing scalars
+        get their defaults and missing matrices are drawn from the seed.
+
+        :param path: Parameter file, .npz, .json, .yaml or .yml
+        :return: Parameters
+        """
+
+        if path.suffix == ".npz":
+            with np.load(path, allow_pickle=False) as f:
+                values = {name: f[name] for name in f.files}
+            values = {
+                name: value if name in MATRIX_FIELDS else value.item()
+                for name, value in values.items()
+            }
+        else:
+            with path.open() as f:
+                if path.suffix in (".yaml", ".yml"):
+                    import yaml
+
+                    values = yaml.safe_load(f) or {}
+                else:
+                    values = json.load(f)
+
+        return cls(**values)
+
+    @classmethod
+    def load_or_create(cls, path: Path, seed: Optional[int] = None) -> "Params":
+
+        """
+        Function to load parameters from a file, or to create them from seed and save them to
+        the file if it does not exist yet. With an .npz file, later runs load every matrix
+        instead of drawing it.
 
-    initial_mu_: np.ndarray = np.array(
-        [mu_x, mu_y, mu_laccx, mu_laccy, mu_laccz, mu_yaw, mu_pitch, mu_roll]
-    )
+        :param path: Parameter file
+        :param seed: Seed of new parameters
+        :return: Parameters
+        """
 
-    initial_covariance_: np.ndarray = sk.make_sparse_spd_matrix(8)
-    initial_covariance_[0, 0], initial_covariance_[1, 1] = 100, 100
+        if path.exists():
+            return cls.load(path)
 
-    R_: np.ndarray = np.random.normal(0.0, 1.0, (8, 8))
+        parameters = cls(seed=seed)
+        parameters.save(path)
 
-    waypoint_process_noise = np.random.normal(100.0, 100, (2, 2))
-    linear_acc_process_noise = np.random.normal(0.0, 5.0, (3, 3))
-    angle_process_noise = np.random.normal(0.0, 2 * np.pi, (3, 3))
-    process_noise = block_diag(
-        waypoint_process_noise, linear_acc_process_noise, angle_process_noise
-    )
+        return parameters
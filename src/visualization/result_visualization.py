@@ -1,39 +1,120 @@
+import json
 import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
 import plotly.graph_objs as go
 from PIL import Image
 
+from functools import lru_cache
+from matplotlib.figure import Figure
+from pathlib import Path
 from typing import NoReturn, List, Tuple
 
+# Trajectories longer than this are decimated with lttb before they are plotted
+MAX_PLOT_POINTS = 1000
+
+
+@lru_cache(maxsize=32)
+def load_floor_image(floor_plan_filename: Path) -> Image.Image:
+
+    """
+    Function to load a floor plan image once per process, later calls return the cached image.
+
+    :param floor_plan_filename: Path of floor_image.png
+    :return: Floor plan image
+    """
+
+    image = Image.open(floor_plan_filename)
+    image.load()
+
+    return image
+
+
+@lru_cache(maxsize=32)
+def load_floor_size(json_floor_file: Path) -> Tuple[float, float]:
+
+    """
+    Function to load the floor size once per process, later calls return the cached size.
+
+    :param json_floor_file: Path of floor_info.json
+    :return: Floor width and height in meters
+    """
+
+    with json_floor_file.open() as j:
+        map_info = json.load(j)["map_info"]
+
+    return map_info["width"], map_info["height"]
+
+
+def lttb(trajectory: np.ndarray, threshold: int = MAX_PLOT_POINTS) -> np.ndarray:
+
+    """
+    Function to decimate a trajectory with Largest-Triangle-Three-Buckets. Points are split
+    into threshold - 2 buckets in time order and every bucket keeps the point which forms the
+    largest triangle with the point kept from the previous bucket and the mean of the next
+    bucket, so turns survive decimation while straight stretches are thinned out. Triangles
+    are taken in the (x, y) plane of the trajectory.
+
+    :param trajectory: Positions in time order, shape (N, 2)
+    :param threshold: Number of points to keep, at least 3
+    :return: Indices of the kept points, first and last point included
+    """
+
+    n = len(trajectory)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    edges = np.append(edges, n)
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_mean = trajectory[end : edges[bucket + 2]].mean(axis=0)
+        previous = trajectory[selected[bucket]]
+
+        candidates = trajectory[start:end] - previous
+        areas = np.abs(
+            candidates[:, 0] * (next_mean[1] - previous[1])
+            - candidates[:, 1] * (next_mean[0] - previous[0])
+        )
+        selected[bucket + 1] = start + np.argmax(areas)
+
+    return selected
+
 
 def trace_fix(trajectory: np.ndarray, colour_str: str) -> Tuple[List, ...]:
 
     """
+    Function to get marker sizes, colours and labels of a trajectory. Labels are point indices,
+    indented once more for every earlier point at the same position so they do not overlap.
 
-    :param trajectory:
-    :param colour_str:
-    :return:
+    :param trajectory: Positions, shape (N, 2)
+    :param colour_str: Marker colour
+    :return: Marker sizes, colours and labels
     """
 
-    size_list = [6] * trajectory.shape[0]
+    n = trajectory.shape[0]
+
+    size_list = [6] * n
     size_list[0] = 10
     size_list[-1] = 10
 
-    color_list = [colour_str] * trajectory.shape[0]
-    color_list[0] = colour_str
-    color_list[-1] = colour_str
-
-    position_count = {}
-    text_list = []
-    for i in range(trajectory.shape[0]):
-        if str(trajectory[i]) in position_count:
-            position_count[str(trajectory[i])] += 1
-        else:
-            position_count[str(trajectory[i])] = 0
-        text_list.append("        " * position_count[str(trajectory[i])] + f"{i}")
+    color_list = [colour_str] * n
+
+    # Number of earlier points at the same position, counted within groups of equal rows
+    _, inverse = np.unique(trajectory, axis=0, return_inverse=True)
+    order = np.argsort(inverse.ravel(), kind="stable")
+    grouped = inverse.ravel()[order]
+    group_starts = np.flatnonzero(np.r_[True, grouped[1:] != grouped[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, n])
+    position_count = np.empty(n, dtype=int)
+    position_count[order] = np.arange(n) - np.repeat(group_starts, group_sizes)
+
+    text_list = ["        " * count + str(i) for i, count in enumerate(position_count.tolist())]
     text_list[0] = "Start Point: 0"
-    text_list[-1] = f"End Point: {trajectory.shape[0] - 1}"
+    text_list[-1] = f"End Point: {n - 1}"
 
     return size_list, color_list, text_list
 
@@ -98,7 +179,7 @@ def visualize_trajectory(
     )
 
     # add floor plan
-    floor_plan = Image.open(floor_plan_filename)
+    floor_plan = load_floor_image(Path(floor_plan_filename))
     fig.update_layout(
         images=[
             go.layout.Image(
@@ -131,3 +212,42 @@ def visualize_trajectory(
         fig.show()
 
     return fig
+
+
+def save_trajectory_image(
+    trajectory: np.ndarray,
+    estimated_way: np.ndarray,
+    floor_plan_filename: Path,
+    width_meter: float,
+    height_meter: float,
+    output_file: Path,
+    title: str = None,
+):
+
+    """
+    Function to save a static image of the waypoints and the estimated trajectory on the floor
+    plan. Uses a bare matplotlib Figure, so it needs no display and runs in worker processes.
+
+    :param trajectory: Waypoints, shape (N, 2)
+    :param estimated_way: Estimated trajectory, shape (M, 2)
+    :param floor_plan_filename: Path of floor_image.png
+    :param width_meter: Floor width in meters
+    :param height_meter: Floor height in meters
+    :param output_file: Image file to write, the format follows the suffix
+    :param title: Plot title
+    """
+
+    fig = Figure(figsize=(9, 9 * height_meter / width_meter + 0.5))
+    ax = fig.subplots()
+
+    ax.imshow(load_floor_image(Path(floor_plan_filename)), extent=(0, width_meter, 0, height_meter))
+    ax.plot(estimated_way[:, 0], estimated_way[:, 1], color="mediumseagreen", linewidth=1)
+    ax.scatter(trajectory[:, 0], trajectory[:, 1], s=12, color="darkmagenta", zorder=3)
+    ax.scatter(*trajectory[[0, -1]].T, s=40, color="darkmagenta", zorder=3)
+
+    ax.set_xlim(0, width_meter)
+    ax.set_ylim(0, height_meter)
+    ax.set_aspect("equal")
+    ax.set_title(title or "No title.")
+
+    fig.savefig(output_file, bbox_inches="tight")
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from run_ukf import get_data_for_ukf
+from src.scripts.get_required_data import get_data
+from src.scripts.synthetic_trace import write_synthetic_trace, write_synthetic_floor_info
+
+
+@pytest.fixture(scope="session")
+def filter_parameters():
+
+    """
+    Initial state, initial covariance, measurement noise and process noise which keep the filter
+    well conditioned, so filter variants can be compared with tight tolerances.
+    """
+
+    initial_mu = np.array([100, 75, 0.5, 3.0, 3.0, 0.01, 0.01, 0.01])
+    initial_covariance = np.diag([1.0, 1.0, 0.1, 0.1, 0.1, 0.01, 0.01, 0.01])
+    R = 0.5 * np.eye(8)
+    Q = np.diag([0.5, 0.5, 0.1, 0.1, 0.1, 0.01, 0.01, 0.01])
+
+    return initial_mu, initial_covariance, R, Q
+
+
+@pytest.fixture(scope="session")
+def sigma_parameters():
+
+    """
+    Sigma point parameters with positive weights. The default parameters (alpha 0.3, kappa -5)
+    give the central sigma point a large negative covariance weight, with which covariances
+    soon become indefinite and runs can only be compared over a few steps.
+    """
+
+    return dict(alpha=1.0, beta=2.0, kappa=1.0)
+
+
+@pytest.fixture(scope="session")
+def synthetic_traces(tmp_path_factory):
+
+    """
+    Three short synthetic traces of different lengths, parsed and prepared for the filter.
+
+    :return: List of (trace file, acc, gyro, waypoints, timesteps, measurements)
+    """
+
+    directory = tmp_path_factory.mktemp("traces")
+    floor_file = directory / "floor_info.json"
+    write_synthetic_floor_info(floor_file)
+
+    traces = []
+    for i, duration in enumerate((6.0, 8.0, 10.0)):
+        trace_file = directory / f"trace_{i}.txt"
+        write_synthetic_trace(trace_file, duration=duration, rate=10.0, seed=i)
+        acc, gyro, way = get_data(trace_file, cache=False)
+        _, _, timestep, measurements = get_data_for_ukf(acc, gyro, way, floor_file)
+        traces.append((trace_file, acc, gyro, way, timestep, measurements))
+
+    return traces
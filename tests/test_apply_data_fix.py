@@ -0,0 +1,88 @@
+import json
+
+from src.scripts.apply_data_fix import fix_data_issues
+from src.scripts.synthetic_trace import write_synthetic_trace
+
+
+def write_broken_trace(filepath, seed=0):
+
+    """
+    Synthetic trace in which every accelerometer line is run together with the two lines after
+    it, as in the erroneous lines of the dataset.
+
+    :return: Content of the intact trace
+    """
+
+    write_synthetic_trace(filepath, duration=2.0, rate=10.0, seed=seed)
+    intact = filepath.read_text()
+    lines = intact.splitlines(True)
+
+    broken = []
+    index = 0
+    while index < len(lines):
+        if "TYPE_ACCELEROMETER\t" in lines[index]:
+            broken.append("".join(line.rstrip("\n") for line in lines[index : index + 3]) + "\n")
+            index += 3
+        else:
+            broken.append(lines[index])
+            index += 1
+    filepath.write_text("".join(broken))
+
+    return intact
+
+
+def test_split_lines_keep_their_order(tmp_path):
+    trace_file = tmp_path / "trace.txt"
+    intact = write_broken_trace(trace_file)
+    broken = trace_file.read_text()
+    manifest_path = tmp_path / "manifest.json"
+
+    # A dry run only counts
+    counts = fix_data_issues([trace_file], dry_run=True, workers=1, manifest_path=manifest_path)
+    assert counts["fixed_files"] == 1 and counts["error_lines"] == 20
+    assert trace_file.read_text() == broken
+    assert not manifest_path.exists()
+
+    counts = fix_data_issues([trace_file], workers=1, manifest_path=manifest_path)
+    assert counts["error_lines"] == 20
+    assert trace_file.read_text() == intact
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["manifest.json", "trace.txt"]
+
+
+def test_manifest_skips_unchanged_files(tmp_path):
+    trace_files = [tmp_path / f"trace_{i}.txt" for i in range(3)]
+    for seed, trace_file in enumerate(trace_files):
+        write_broken_trace(trace_file, seed)
+    manifest_path = tmp_path / "manifest.json"
+
+    counts = fix_data_issues(trace_files[:2], workers=1, manifest_path=manifest_path)
+    assert (counts["checked"], counts["skipped"], counts["fixed_files"]) == (2, 0, 2)
+
+    counts = fix_data_issues(trace_files, workers=1, manifest_path=manifest_path)
+    assert (counts["checked"], counts["skipped"], counts["fixed_files"]) == (1, 2, 1)
+
+    # A forced run checks every given file and keeps the entries of the others
+    counts = fix_data_issues(trace_files[:1], workers=1, manifest_path=manifest_path, force=True)
+    assert (counts["checked"], counts["skipped"], counts["fixed_files"]) == (1, 0, 0)
+    manifest = json.loads(manifest_path.read_text())
+    assert sorted(manifest) == sorted(str(trace_file) for trace_file in trace_files)
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_failed_file_does_not_abort_the_run(tmp_path, capsys):
+    good_file, bad_file = tmp_path / "good.txt", tmp_path / "bad.txt"
+    intact = write_broken_trace(good_file)
+    bad_file.write_bytes(b"1578462618000\tTYPE_WIFI\t\xff\xfe\n")
+    manifest_path = tmp_path / "manifest.json"
+
+    counts = fix_data_issues([bad_file, good_file], workers=1, manifest_path=manifest_path)
+
+    assert (counts["failed_files"], counts["fixed_files"]) == (1, 1)
+    assert good_file.read_text() == intact
+    assert "bad.txt failed" in capsys.readouterr().err
+    assert list(json.loads(manifest_path.read_text())) == [str(good_file)]
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "bad.txt",
+        "good.txt",
+        "manifest.json",
+    ]
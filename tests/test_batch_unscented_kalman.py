@@ -0,0 +1,69 @@
+import numpy as np
+
+from run_ukf import perform_ukf
+from src.model.batch_unscented_kalman import perform_ukf_batch, perform_ukf_batches
+from src.model.means_and_residuals import state_mean, state_residual
+
+# Number of steps of the longest trace in a batch, shorter traces are padded
+STEPS = 40
+
+
+def test_state_mean_and_residual_of_stacked_sigmas():
+    rng = np.random.default_rng(0)
+    sigmas = rng.normal(0.0, 3.0, (4, 17, 8))
+    wm = rng.dirichlet(np.ones(17))
+
+    means = state_mean(sigmas, wm)
+    residuals = state_residual(sigmas, means[:, np.newaxis, :])
+
+    for i in range(len(sigmas)):
+        np.testing.assert_allclose(means[i], state_mean(sigmas[i], wm))
+        np.testing.assert_allclose(residuals[i], state_residual(sigmas[i], means[i]))
+
+
+def test_batch_with_generator_per_trace_matches_perform_ukf(
+    filter_parameters, sigma_parameters, synthetic_traces
+):
+    measurements = [trace[5][: STEPS - 10 * i] for i, trace in enumerate(synthetic_traces)]
+    timesteps = [trace[4][: STEPS - 10 * i] for i, trace in enumerate(synthetic_traces)]
+
+    states, covariances = perform_ukf_batch(
+        measurements,
+        timesteps,
+        *filter_parameters,
+        rng=[np.random.default_rng(i) for i in range(len(measurements))],
+        **sigma_parameters,
+    )
+
+    for i, (measurement, timestep) in enumerate(zip(measurements, timesteps)):
+        expected_states, expected_covariances = perform_ukf(
+            measurement,
+            timestep,
+            *filter_parameters,
+            rng=np.random.default_rng(i),
+            **sigma_parameters,
+        )
+        assert states[i].shape == expected_states.shape
+        np.testing.assert_allclose(states[i], expected_states, atol=1e-6)
+        np.testing.assert_allclose(covariances[i], expected_covariances, atol=1e-6)
+
+
+def test_batches_keep_input_order(filter_parameters, sigma_parameters, synthetic_traces):
+    # Longest trace first, so sorting by length into batches reorders the traces
+    measurements = [trace[5][: STEPS - 10 * i] for i, trace in enumerate(synthetic_traces)]
+    timesteps = [trace[4][: STEPS - 10 * i] for i, trace in enumerate(synthetic_traces)]
+    rngs = [np.random.default_rng(i) for i in range(len(measurements))]
+
+    states, _ = perform_ukf_batches(
+        measurements, timesteps, *filter_parameters, batch_size=2, rng=rngs, **sigma_parameters
+    )
+
+    for i, (measurement, timestep) in enumerate(zip(measurements, timesteps)):
+        expected_states, _ = perform_ukf(
+            measurement,
+            timestep,
+            *filter_parameters,
+            rng=np.random.default_rng(i),
+            **sigma_parameters,
+        )
+        np.testing.assert_allclose(states[i], expected_states, atol=1e-6)
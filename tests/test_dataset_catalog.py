@@ -0,0 +1,55 @@
+import os
+
+from src.scripts.dataset_catalog import DatasetCatalog
+from src.scripts.read_data import read_data_file
+from src.scripts.synthetic_trace import write_synthetic_trace, write_synthetic_floor_info
+
+
+def test_catalog_lookups(tmp_path):
+    train, test, metadata = tmp_path / "train", tmp_path / "test", tmp_path / "metadata"
+    for building, floor, trace, duration in (
+        ("B1", "F1", "short", 2.0),
+        ("B1", "F1", "long", 4.0),
+        ("B1", "F2", "other", 3.0),
+        ("B2", "F1", "elsewhere", 3.0),
+    ):
+        write_synthetic_trace(train / building / floor / f"{trace}.txt", duration, rate=10.0)
+    write_synthetic_floor_info(metadata / "B1" / "F1" / "floor_info.json")
+
+    test.mkdir()
+    test_trace = test / "unknown.txt"
+    test_trace.write_text(
+        (train / "B2" / "F1" / "elsewhere.txt").read_text().replace("SiteID:synthetic", "SiteID:B2")
+    )
+
+    with DatasetCatalog(tmp_path / "catalog.sqlite", metadata) as catalog:
+        assert [path.stem for path in catalog.traces(train, "B1", "F1")] == ["long", "short"]
+        assert catalog.floors(train) == [("B1", "F1"), ("B1", "F2"), ("B2", "F1")]
+        assert catalog.floors(test) == [("B2", "")]
+
+        info = catalog.trace_info(train / "B1" / "F1" / "long.txt")
+        assert (info["building"], info["floor"], info["trace"]) == ("B1", "F1", "long")
+        data = read_data_file(train / "B1" / "F1" / "long.txt")
+        assert info["sensor_counts"]["TYPE_ACCELEROMETER"] == len(data.acce)
+        assert info["sensor_counts"]["TYPE_WAYPOINT"] == len(data.waypoint)
+        assert catalog.trace_info(test_trace)["building"] == "B2"
+
+        # Floors are looked up by dataset directory, a floor without metadata has none
+        floor_info, floor_image = catalog.floor_metadata(train, "B1", "F1")
+        assert floor_info == (metadata / "B1" / "F1" / "floor_info.json").resolve()
+        assert floor_image is None
+        assert catalog.floor_metadata(train, "B1", "F2") == (None, None)
+
+    # Only new and changed traces are read again, deleted ones are dropped
+    (train / "B1" / "F2" / "other.txt").unlink()
+    write_synthetic_trace(train / "B1" / "F2" / "new.txt", 1.0, rate=10.0)
+    changed = train / "B1" / "F1" / "short.txt"
+    with changed.open("a") as f:
+        f.write("\n")
+    os.utime(changed, ns=(0, changed.stat().st_mtime_ns + 1))
+
+    with DatasetCatalog(tmp_path / "catalog.sqlite", metadata) as catalog:
+        assert len(catalog.traces(train)) == 4
+        assert catalog.refresh(train) == 2
+        assert [path.stem for path in catalog.traces(train, "B1", "F2")] == ["new"]
+        assert catalog.refresh(train) == 0
@@ -0,0 +1,130 @@
+import numpy as np
+import pytest
+
+from src.scripts.evaluation import (
+    evaluate_results,
+    grouped_percentiles,
+    interpolate_positions,
+    waypoint_errors,
+)
+from src.scripts.result_store import ResultWriter
+
+
+def random_traces(lengths, query_counts, seed=0):
+    rng = np.random.default_rng(seed)
+    timestamps, positions, queries = [], [], []
+
+    for length, query_count in zip(lengths, query_counts):
+        start = 1578462618000 + rng.integers(0, 10**6)
+        trace_timestamps = start + np.cumsum(rng.integers(1, 50, size=length)).astype(float)
+        timestamps.append(trace_timestamps)
+        positions.append(rng.normal(scale=50.0, size=(length, 2)))
+        # Queries before, inside and after the trace, on samples and between them
+        queries.append(
+            np.sort(
+                np.concatenate(
+                    (
+                        rng.uniform(
+                            trace_timestamps[0] - 100, trace_timestamps[-1] + 100, query_count
+                        ),
+                        trace_timestamps[rng.integers(0, length, size=2)],
+                    )
+                )
+            )
+        )
+
+    return timestamps, positions, queries
+
+
+def offsets(parts):
+    return np.concatenate(([0], np.cumsum([len(part) for part in parts])))
+
+
+def test_interpolate_positions_matches_np_interp():
+    timestamps, positions, queries = random_traces((1, 2, 40, 7, 300), (3, 5, 20, 0, 50))
+
+    interpolated = interpolate_positions(
+        np.concatenate(timestamps),
+        np.concatenate(positions),
+        offsets(timestamps),
+        np.concatenate(queries),
+        offsets(queries),
+    )
+
+    expected = np.concatenate(
+        [
+            np.column_stack([np.interp(query, t, p[:, i]) for i in range(2)])
+            for t, p, query in zip(timestamps, positions, queries)
+        ]
+    )
+    np.testing.assert_allclose(interpolated, expected, rtol=1e-12, atol=1e-9)
+
+
+def test_waypoint_errors():
+    timestamps = np.array([0.0, 1000.0, 2000.0])
+    states = np.zeros((3, 8))
+    states[:, 0] = [0.0, 10.0, 20.0]
+    waypoints = np.array([[500.0, 5.0, 3.0], [2500.0, 20.0, -4.0]])
+
+    np.testing.assert_allclose(waypoint_errors(states, timestamps, waypoints), [3.0, 4.0])
+
+
+@pytest.mark.parametrize("percentiles", [(50, 75, 90, 95), (0, 12.5, 100)])
+def test_grouped_percentiles_match_np_percentile(percentiles):
+    rng = np.random.default_rng(1)
+    counts = [1, 2, 7, 100]
+    groups = rng.permutation(np.repeat(np.arange(len(counts)), counts))
+    values = rng.exponential(size=len(groups))
+
+    expected = [np.percentile(values[groups == group], percentiles) for group in range(len(counts))]
+    np.testing.assert_allclose(grouped_percentiles(values, groups, percentiles), expected)
+
+
+def test_evaluate_results(tmp_path):
+    rng = np.random.default_rng(2)
+    expected = {}
+
+    for building, floor, trace, length in (
+        ("B1", "F1", "a", 50),
+        ("B1", "F1", "b", 80),
+        ("B1", "F2", "c", 30),
+        ("B2", "F1", "d", 60),
+    ):
+        timestamps = 1578462618000 + 20 * np.arange(length)
+        states = rng.normal(scale=20.0, size=(length, 8))
+        waypoints = np.column_stack(
+            (np.sort(rng.uniform(timestamps[0], timestamps[-1], 4)), rng.normal(size=(4, 2)))
+        )
+        expected[(building, floor, trace)] = waypoint_errors(states, timestamps, waypoints)
+
+        with ResultWriter(building, floor, trace, tmp_path, chunk_size=16) as writer:
+            writer.write_attributes(waypoints=waypoints)
+            writer.append(timestamps, states=states, smoothed_states=states + 1000.0)
+
+    # Results without waypoints are left out
+    with ResultWriter("B2", "F1", "nowaypoints", tmp_path) as writer:
+        writer.append(timestamps, states=states)
+
+    evaluation = evaluate_results(root=tmp_path, states_field="states", workers=2, chunk_traces=3)
+
+    assert evaluation.traces == sorted(expected)
+    np.testing.assert_allclose(
+        evaluation.errors, np.concatenate([expected[trace] for trace in evaluation.traces])
+    )
+
+    floors = evaluation.summary("floor")
+    assert sorted(floors) == [("B1", "F1"), ("B1", "F2"), ("B2", "F1")]
+    b1_f1 = np.concatenate((expected[("B1", "F1", "a")], expected[("B1", "F1", "b")]))
+    assert floors[("B1", "F1")]["traces"] == 2
+    assert floors[("B1", "F1")]["waypoints"] == 8
+    assert floors[("B1", "F1")]["mean_error"] == pytest.approx(b1_f1.mean())
+    assert floors[("B1", "F1")]["p90"] == pytest.approx(np.percentile(b1_f1, 90))
+
+    everything = evaluation.summary("all")[()]
+    assert everything["traces"] == 4
+    assert everything["mean_error"] == pytest.approx(evaluation.errors.mean())
+
+    # Smoothed states are evaluated by default where a trace has them
+    smoothed = evaluate_results(root=tmp_path, building="B1", workers=1)
+    assert len(smoothed.traces) == 3
+    assert np.all(smoothed.errors > 900.0)
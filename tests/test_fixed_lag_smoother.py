@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from run_ukf import perform_ukf
+from src.model.fixed_lag_smoother import FixedLagSmoother
+from src.model.rts_smoother import rts_smoother_from_predictions
+
+
+def run_fixed_lag(lag, measurements, timestep, filter_parameters, sigma_parameters):
+    smoother = FixedLagSmoother(
+        lag, *filter_parameters, rng=np.random.default_rng(4), **sigma_parameters
+    )
+    states, covariances = zip(*smoother.filter(zip(measurements, timestep)))
+
+    return np.array(states), np.array(covariances)
+
+
+def run_rts(measurements, timestep, filter_parameters, sigma_parameters):
+    estimated_mu, estimated_cov, *predictions = perform_ukf(
+        measurements,
+        timestep,
+        *filter_parameters,
+        record_predictions=True,
+        rng=np.random.default_rng(4),
+        **sigma_parameters,
+    )
+
+    smoothed_mu, smoothed_cov, smoothed_fraction = rts_smoother_from_predictions(
+        estimated_mu, estimated_cov, *predictions
+    )
+    assert smoothed_fraction == 1.0
+
+    return estimated_mu, (smoothed_mu, smoothed_cov)
+
+
+def test_lag_over_trace_length_is_full_rts(synthetic_traces, filter_parameters, sigma_parameters):
+    _, _, _, _, timestep, measurements = synthetic_traces[0]
+
+    states, covariances = run_fixed_lag(
+        len(measurements), measurements, timestep, filter_parameters, sigma_parameters
+    )
+    _, (expected_states, expected_cov) = run_rts(
+        measurements, timestep, filter_parameters, sigma_parameters
+    )
+
+    np.testing.assert_allclose(states, expected_states, rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(covariances, expected_cov, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("lag", [0, 5])
+def test_fixed_lag_is_rts_over_window(lag, synthetic_traces, filter_parameters, sigma_parameters):
+    _, _, _, _, timestep, measurements = synthetic_traces[0]
+
+    states, _ = run_fixed_lag(lag, measurements, timestep, filter_parameters, sigma_parameters)
+    assert len(states) == len(measurements)
+
+    # The estimate of sample i is smoothed by the samples up to i + lag only, so it is the full
+    # RTS estimate of the trace cut after sample i + lag. The noise stream does not depend on
+    # the trace length, so the cut trace sees the same noise
+    for index in (0, 17, len(measurements) - lag - 1, len(measurements) - 1):
+        end = min(index + lag + 1, len(measurements))
+        filtered, (expected_states, _) = run_rts(
+            measurements[:end], timestep[:end], filter_parameters, sigma_parameters
+        )
+        np.testing.assert_allclose(states[index], expected_states[index], rtol=1e-9, atol=1e-9)
+        if lag == 0:
+            np.testing.assert_allclose(states[index], filtered[index], rtol=1e-9, atol=1e-9)
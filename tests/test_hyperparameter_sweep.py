@@ -0,0 +1,148 @@
+import functools
+
+import numpy as np
+import pytest
+
+from src.scripts import hyperparameter_sweep
+from src.scripts.hyperparameter_sweep import (
+    SweepConfig,
+    SweepResult,
+    SweepTable,
+    SweepTraces,
+    evaluate_config,
+    grid_configs,
+    parameters_digest,
+    prepare_sweep_traces,
+    random_configs,
+    run_sweep,
+)
+from src.scripts.get_required_data import get_data
+from src.util.parameters import Params
+
+
+@pytest.fixture
+def sweep_traces(synthetic_traces, tmp_path, monkeypatch):
+    monkeypatch.setattr(hyperparameter_sweep, "get_data", functools.partial(get_data, cache=False))
+
+    # Longest trace first, so the sweep order differs from the given order
+    trace_files = [trace[0] for trace in reversed(synthetic_traces)]
+
+    return trace_files, tmp_path / "sweep"
+
+
+def test_configs():
+    grid = grid_configs(alpha=[0.1, 0.3], q_scale=[1, 10])
+    assert grid == [
+        SweepConfig(alpha=0.1, q_scale=1.0),
+        SweepConfig(alpha=0.1, q_scale=10.0),
+        SweepConfig(alpha=0.3, q_scale=1.0),
+        SweepConfig(alpha=0.3, q_scale=10.0),
+    ]
+
+    configs = random_configs(20, seed=3)
+    assert configs == random_configs(20, seed=3)
+    assert configs != random_configs(20, seed=4)
+    for config in configs:
+        assert 1e-3 <= config.alpha <= 1.0
+        assert -7.5 <= config.kappa <= 3.0
+
+
+def test_config_scales_noise():
+    parameters = Params(seed=0)
+    scaled = SweepConfig(alpha=1.0, q_scale=2.0, r_scale=0.5).apply(parameters)
+
+    assert scaled.alpha == 1.0
+    np.testing.assert_array_equal(scaled.process_noise, 2.0 * parameters.process_noise)
+    np.testing.assert_array_equal(scaled.R_, 0.5 * parameters.R_)
+    np.testing.assert_array_equal(scaled.initial_covariance_, parameters.initial_covariance_)
+    assert parameters_digest(scaled) != parameters_digest(parameters)
+    assert parameters_digest(Params(seed=0)) == parameters_digest(parameters)
+
+
+def test_prepared_traces_and_early_stopping(sweep_traces):
+    trace_files, sweep_dir = sweep_traces
+
+    ordered = prepare_sweep_traces(trace_files, sweep_dir / "traces")
+    assert ordered == trace_files[::-1]
+
+    traces = SweepTraces.load(sweep_dir / "traces")
+    assert len(traces) == 3
+    assert traces.offsets[-1] == len(traces.measurements) == len(traces.timestamps)
+
+    # Prepared traces are reused, whatever order the traces are given in
+    modified = (sweep_dir / "traces" / "measurements.npy").stat().st_mtime_ns
+    assert prepare_sweep_traces(ordered, sweep_dir / "traces") == ordered
+    assert (sweep_dir / "traces" / "measurements.npy").stat().st_mtime_ns == modified
+
+    parameters = Params(seed=0)
+    config = SweepConfig(alpha=1.0, beta=2.0, kappa=1.0)
+    result = evaluate_config(config, traces, parameters)
+    assert result.complete
+    assert len(result.trace_errors) == 3
+    assert np.all(np.isfinite(result.trace_errors))
+
+    # Trace noise comes from the seed of the parameters, so a rerun gives the same errors
+    np.testing.assert_array_equal(
+        evaluate_config(config, traces, parameters).trace_errors, result.trace_errors
+    )
+
+    # A configuration worse than the baseline stops after min_traces
+    baseline = result.running_scores() / 10
+    stopped = evaluate_config(config, traces, parameters, baseline=baseline, min_traces=2)
+    assert not stopped.complete
+    assert len(stopped.trace_errors) == 2
+
+
+def test_sweep_table(tmp_path):
+    parameters = Params(seed=0)
+    traces = [tmp_path / "a.txt", tmp_path / "b.txt"]
+    results = [
+        SweepResult(SweepConfig(alpha=alpha), np.array(errors), np.array([1, 1]), complete, 1.0)
+        for alpha, errors, complete in (
+            (0.1, [1.0, 2.0], True),
+            (0.2, [0.5], False),
+            (0.3, [0.5, 1.0], True),
+        )
+    ]
+
+    with SweepTable(tmp_path / "results.sqlite") as table:
+        table.check_setup(traces, parameters)
+        for result in results:
+            table.add(result)
+
+    with SweepTable(tmp_path / "results.sqlite") as table:
+        table.check_setup(traces, parameters)
+        assert table.keys() == {result.config.key for result in results}
+        assert [result.config.alpha for result in table.results()] == [0.3, 0.1, 0.2]
+        best = table.best()
+        assert best.config == results[2].config
+        np.testing.assert_array_equal(best.running_scores(), [0.5, 0.75])
+
+        # A resumed sweep has to use the same traces and base parameters
+        with pytest.raises(ValueError, match="traces"):
+            table.check_setup(traces[::-1], parameters)
+        with pytest.raises(ValueError, match="parameters"):
+            table.check_setup(traces, Params(seed=1))
+
+
+def test_run_sweep_resumes(sweep_traces):
+    trace_files, sweep_dir = sweep_traces
+    parameters = Params(seed=0)
+    configs = grid_configs(alpha=[1.0], beta=[2.0], kappa=[0.0, 1.0])
+
+    best = run_sweep(configs, trace_files, parameters, sweep_dir, workers=1)
+    assert best is not None and best.config in configs
+
+    with SweepTable(sweep_dir / "results.sqlite") as table:
+        first = {result.config: result for result in table.results()}
+    assert set(first) == set(configs)
+
+    # Only the new configuration is evaluated when the sweep is run again
+    more = configs + grid_configs(alpha=[1.0], beta=[2.0], kappa=[2.0])
+    run_sweep(more, trace_files, parameters, sweep_dir, workers=1)
+
+    with SweepTable(sweep_dir / "results.sqlite") as table:
+        second = {result.config: result for result in table.results()}
+    assert set(second) == set(more)
+    for config in configs:
+        assert second[config].seconds == first[config].seconds
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from run_ukf import perform_ukf
+from src.model.measurement_scheduler import perform_scheduled_ukf
+from src.model.waypoint_measurement_fix import fix_waypoint
+from src.util.metrics import MetricsObserver
+
+
+def position_error(states, positions):
+    return np.mean(np.hypot(*(states[:, :2] - positions).T))
+
+
+def test_all_update_mode_matches_perform_ukf(synthetic_traces, filter_parameters, sigma_parameters):
+    _, acc, _, way, timestep, measurements = synthetic_traces[1]
+
+    # An update rate above the sample rate makes every sample a position fix
+    states, covariances = perform_scheduled_ukf(
+        measurements,
+        timestep,
+        acc[:, 0],
+        way[:, 0],
+        *filter_parameters,
+        update_rate=1000.0,
+        rng=np.random.default_rng(6),
+        **sigma_parameters,
+    )
+    expected_mu, expected_cov = perform_ukf(
+        measurements, timestep, *filter_parameters, rng=np.random.default_rng(6), **sigma_parameters
+    )
+
+    np.testing.assert_array_equal(states, expected_mu)
+    np.testing.assert_array_equal(covariances, expected_cov)
+
+
+@pytest.mark.parametrize("smooth", [False, True])
+def test_decimated_mode_accuracy(smooth, synthetic_traces, filter_parameters, sigma_parameters):
+    _, acc, _, way, timestep, measurements = synthetic_traces[2]
+    positions = fix_waypoint(acc[:, 0], way)
+
+    errors, steps = [], []
+    for decimation in (1, 5):
+        metrics = MetricsObserver()
+        states, covariances, *smoothing = perform_scheduled_ukf(
+            measurements,
+            timestep,
+            acc[:, 0],
+            way[:, 0],
+            *filter_parameters,
+            update_rate=1.0,
+            decimation=decimation,
+            smooth=smooth,
+            observer=metrics,
+            rng=np.random.default_rng(0),
+            **sigma_parameters,
+        )
+        assert smoothing == ([1.0] if smooth else [])
+        assert np.all(np.isfinite(states)) and np.all(np.isfinite(covariances))
+        errors.append(position_error(states, positions))
+        # Every filtered sample runs a full update, only decimation drops steps
+        assert len(metrics.innovation_norms) == metrics.steps
+        steps.append(metrics.steps)
+
+    assert steps[0] == len(measurements) and steps[1] < len(measurements) / 3
+
+    # Predict-only steps between fixes used to diverge to errors of 1e5 m and more. Both runs
+    # stay within the diagonal of the 200 x 150 m synthetic floor and the decimated run within
+    # a few times the error of the run over every sample
+    assert max(errors) < 250
+    assert errors[1] < 3 * errors[0]
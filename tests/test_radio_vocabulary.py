@@ -0,0 +1,105 @@
+import functools
+import numpy as np
+
+from src.scripts import radio_vocabulary
+from src.scripts.radio_vocabulary import RadioVocabulary, concatenate_radio, load_building_radio
+from src.scripts.read_data import read_data_file
+from src.scripts.synthetic_trace import write_synthetic_trace
+from src.scripts.trace_cache import read_data_file_cached
+
+
+def write_traces(directory):
+
+    """
+    Two synthetic traces of one building, the second one with BSSIDs the first one never sees.
+
+    :return: Trace files
+    """
+
+    first, second = directory / "first.txt", directory / "second.txt"
+    write_synthetic_trace(first, duration=6.0, rate=10.0, seed=0)
+    write_synthetic_trace(second, duration=6.0, rate=10.0, seed=1)
+    second.write_text(second.read_text().replace(":1c:2d:3e:4f:", ":99:2d:3e:4f:"))
+
+    return [first, second]
+
+
+def test_encode_round_trip(tmp_path):
+    trace_files = write_traces(tmp_path)
+    vocabulary = RadioVocabulary(["unrelated"])
+
+    for trace_file in trace_files:
+        data = read_data_file(trace_file)
+        for radio in (data.wifi, data.ibeacon):
+            encoded = vocabulary.encode(radio)
+
+            np.testing.assert_array_equal(encoded.keys(), radio.keys())
+            np.testing.assert_array_equal(encoded.offsets, radio.offsets)
+            np.testing.assert_array_equal(encoded.rssi, radio.rssi)
+            assert encoded.ids.dtype == np.int32
+            assert np.all(encoded.ids > 0)
+
+    keys = vocabulary.keys
+    np.testing.assert_array_equal(vocabulary.lookup(keys[::-1]), np.arange(len(keys))[::-1])
+    np.testing.assert_array_equal(vocabulary.lookup(np.array(["missing", keys[1]])), [-1, 1])
+
+    vocabulary.save(tmp_path / "vocabulary" / "B.npy")
+    np.testing.assert_array_equal(
+        RadioVocabulary.load(tmp_path / "vocabulary" / "B.npy").keys, keys
+    )
+    assert len(RadioVocabulary.load(tmp_path / "vocabulary" / "other.npy")) == 0
+
+
+def test_ids_stay_stable_when_traces_are_added(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        radio_vocabulary,
+        "read_data_file_cached",
+        functools.partial(read_data_file_cached, cache_dir=tmp_path / "cache"),
+    )
+    first, second = write_traces(tmp_path)
+    vocabulary_path = tmp_path / "vocabulary"
+
+    radio, vocabulary = load_building_radio(
+        "B", vocabulary_path=vocabulary_path, sensor_files=[first]
+    )
+    known = vocabulary.keys.copy()
+
+    # Loading more traces appends their keys, the ids of known keys do not change
+    more_radio, more_vocabulary = load_building_radio(
+        "B", vocabulary_path=vocabulary_path, sensor_files=[second, first]
+    )
+    assert len(more_vocabulary) > len(known)
+    np.testing.assert_array_equal(more_vocabulary.keys[: len(known)], known)
+    np.testing.assert_array_equal(
+        RadioVocabulary.load(vocabulary_path / "B.npy").keys, more_vocabulary.keys
+    )
+
+    for before, after in zip(radio[first], more_radio[first]):
+        np.testing.assert_array_equal(after.ids, before.ids)
+        np.testing.assert_array_equal(after.keys(), before.keys())
+    assert np.all(more_radio[second][0].ids >= len(known))
+
+
+def test_concatenate_radio_offsets(tmp_path):
+    vocabulary = RadioVocabulary()
+    radios = [vocabulary.encode(read_data_file(path).wifi) for path in write_traces(tmp_path)]
+
+    concatenated = concatenate_radio(radios)
+
+    assert len(concatenated.timestamps) == sum(len(radio.timestamps) for radio in radios)
+    assert concatenated.offsets[-1] == len(concatenated) == sum(len(radio) for radio in radios)
+    np.testing.assert_array_equal(concatenated.vocabulary, vocabulary.keys)
+
+    scan = 0
+    for radio in radios:
+        for index in range(len(radio.timestamps)):
+            start, end = concatenated.offsets[scan : scan + 2]
+            radio_start, radio_end = radio.offsets[index : index + 2]
+            assert concatenated.timestamps[scan] == radio.timestamps[index]
+            np.testing.assert_array_equal(
+                concatenated.keys()[start:end], radio.keys()[radio_start:radio_end]
+            )
+            np.testing.assert_array_equal(
+                concatenated.last_seen[start:end], radio.last_seen[radio_start:radio_end]
+            )
+            scan += 1
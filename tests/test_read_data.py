@@ -0,0 +1,71 @@
+import numpy as np
+
+from src.scripts.read_data import THREE_AXIS_SENSORS, read_data_file
+from src.scripts.synthetic_trace import write_synthetic_trace
+
+
+def read_data_file_by_line(filepath):
+
+    """
+    Line by line parser of the competition hosts, which read_data_file replaces.
+
+    :param filepath: Path of data text file
+    :return: Sensor readings keyed by sensor type, lists of split lines
+    """
+
+    sensors = {}
+
+    with filepath.open("r", encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line or line[0] == "#" or len(line.split("\t")) > 10:
+                continue
+            fields = line.split("\t")
+            sensors.setdefault(fields[1], []).append(fields)
+
+    return sensors
+
+
+def test_bulk_parser_matches_line_parser(tmp_path):
+    trace_file = tmp_path / "trace.txt"
+    write_synthetic_trace(trace_file, duration=5.0, rate=20.0)
+
+    # Comment, empty and erroneous (concatenated, more than 10 fields) lines are skipped
+    with trace_file.open("a", encoding="utf-8") as f:
+        f.write("# comment\n\n")
+        f.write("1578462618500\tTYPE_ACCELEROMETER\t1.0\t2.0\t3.0\t3" * 2 + "\n")
+
+    data = read_data_file(trace_file)
+    expected = read_data_file_by_line(trace_file)
+
+    for field, sensor in THREE_AXIS_SENSORS.items():
+        lines = np.array(expected[sensor])
+        np.testing.assert_array_equal(getattr(data, field), lines[:, [0, 2, 3, 4]].astype(float))
+
+    waypoints = np.array(expected["TYPE_WAYPOINT"])
+    np.testing.assert_array_equal(data.waypoint, waypoints[:, [0, 2, 3]].astype(float))
+
+    # Synthetic lines are in timestamp order, so readings keep the file order
+    wifi = np.array(expected["TYPE_WIFI"])
+    np.testing.assert_array_equal(data.wifi.reading_timestamps(), wifi[:, 0].astype(np.int64))
+    np.testing.assert_array_equal(data.wifi.keys(), wifi[:, 3])
+    np.testing.assert_array_equal(data.wifi.rssi, wifi[:, 4].astype(int))
+    np.testing.assert_array_equal(data.wifi.last_seen, wifi[:, 6].astype(np.int64))
+    assert len(data.wifi.timestamps) == len(np.unique(wifi[:, 0]))
+
+    beacons = np.array(expected["TYPE_BEACON"])
+    beacon_ids = beacons[:, 2] + "_" + beacons[:, 3] + "_" + beacons[:, 4]
+    np.testing.assert_array_equal(data.ibeacon.reading_timestamps(), beacons[:, 0].astype(int))
+    np.testing.assert_array_equal(data.ibeacon.keys(), beacon_ids)
+    np.testing.assert_array_equal(data.ibeacon.rssi, beacons[:, 6].astype(int))
+
+
+def test_missing_sensors_are_empty(tmp_path):
+    trace_file = tmp_path / "trace.txt"
+    trace_file.write_text("#\tSiteID:synthetic\n1578462618000\tTYPE_WAYPOINT\t1.5\t2.5\n")
+
+    data = read_data_file(trace_file)
+
+    np.testing.assert_array_equal(data.waypoint, [[1578462618000, 1.5, 2.5]])
+    assert data.acce.size == 0
+    assert len(data.wifi) == 0 and len(data.wifi.timestamps) == 0
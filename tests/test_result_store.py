@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from src.scripts.result_store import ResultReader, ResultWriter, list_results
+
+
+def random_results(samples, seed=0):
+    rng = np.random.default_rng(seed)
+    timestamps = 1578462618000 + 20 * np.arange(samples)
+    states = rng.normal(size=(samples, 8))
+    factors = rng.normal(size=(samples, 8, 8))
+
+    return timestamps, states, factors @ np.swapaxes(factors, -1, -2)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_round_trip_across_chunks(tmp_path, compact):
+    timestamps, states, covariances = random_results(250)
+    waypoints = np.array([[1578462618000, 1.5, 2.5]])
+
+    with ResultWriter(
+        "B", "F1", "trace", tmp_path, chunk_size=64, compact_covariances=compact
+    ) as writer:
+        writer.write_attributes(waypoints=waypoints)
+        # Appends of varying size fill, cross and end between chunk boundaries
+        for start, stop in ((0, 1), (1, 100), (100, 128), (128, 250)):
+            writer.append(
+                timestamps[start:stop],
+                states=states[start:stop],
+                covariances=covariances[start:stop],
+            )
+
+    reader = ResultReader("B", "F1", "trace", tmp_path)
+    assert len(reader.meta["chunks"]) == 4
+    assert reader.fields == ["covariances", "states", "timestamps"]
+    np.testing.assert_array_equal(reader.attributes()["waypoints"], waypoints)
+
+    results = reader.read()
+    np.testing.assert_array_equal(results["timestamps"], timestamps)
+    np.testing.assert_array_equal(results["states"], states)
+    if compact:
+        np.testing.assert_allclose(results["covariances"], covariances, rtol=1e-6, atol=1e-6)
+    else:
+        np.testing.assert_array_equal(results["covariances"], covariances)
+
+    # A time slice only returns its samples and the requested fields
+    sliced = reader.read(t_start=timestamps[60], t_end=timestamps[70], fields=["states"])
+    assert sorted(sliced) == ["states", "timestamps"]
+    np.testing.assert_array_equal(sliced["timestamps"], timestamps[60:71])
+    np.testing.assert_array_equal(sliced["states"], states[60:71])
+
+
+def test_unfinished_traces_are_not_listed(tmp_path):
+    timestamps, states, _ = random_results(10)
+
+    with ResultWriter("B", "F1", "done", tmp_path) as writer:
+        writer.append(timestamps, states=states)
+
+    with pytest.raises(RuntimeError):
+        with ResultWriter("B", "F2", "failed", tmp_path) as writer:
+            writer.append(timestamps, states=states)
+            raise RuntimeError("filter diverged")
+
+    assert list_results(tmp_path) == [("B", "F1", "done")]
+    assert list_results(tmp_path, floor="F2") == []
+
+    # A rerun drops the chunks of the earlier run
+    with ResultWriter("B", "F1", "done", tmp_path, chunk_size=4) as writer:
+        writer.append(timestamps[:5], states=states[:5])
+
+    results = ResultReader("B", "F1", "done", tmp_path).read()
+    np.testing.assert_array_equal(results["states"], states[:5])
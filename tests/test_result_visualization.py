@@ -0,0 +1,95 @@
+import numpy as np
+
+from PIL import Image
+
+from run_report import render_report
+from src.scripts.result_store import ResultWriter
+from src.scripts.synthetic_trace import write_synthetic_floor_info
+from src.visualization.result_visualization import lttb, trace_fix
+
+
+def trace_fix_by_loop(trajectory, colour_str):
+
+    """
+    Labels of the original trace_fix, which counted earlier points at the same position in a
+    dict keyed by the printed row.
+    """
+
+    position_count = {}
+    text_list = []
+    for i in range(trajectory.shape[0]):
+        if str(trajectory[i]) in position_count:
+            position_count[str(trajectory[i])] += 1
+        else:
+            position_count[str(trajectory[i])] = 0
+        text_list.append("        " * position_count[str(trajectory[i])] + f"{i}")
+    text_list[0] = "Start Point: 0"
+    text_list[-1] = f"End Point: {trajectory.shape[0] - 1}"
+
+    return [10] + [6] * (len(trajectory) - 2) + [10], [colour_str] * len(trajectory), text_list
+
+
+def test_lttb():
+    rng = np.random.default_rng(0)
+    t = np.linspace(0.0, 1.0, 5000)
+    trajectory = np.column_stack((t, 0.01 * rng.normal(size=len(t))))
+    # A sharp turn in an otherwise flat trajectory
+    trajectory[2345, 1] = 5.0
+
+    selected = lttb(trajectory, 100)
+
+    assert len(selected) == 100
+    assert selected[0] == 0 and selected[-1] == len(trajectory) - 1
+    assert np.all(np.diff(selected) > 0)
+    assert 2345 in selected
+
+    for threshold in (len(trajectory), len(trajectory) + 1):
+        np.testing.assert_array_equal(lttb(trajectory, threshold), np.arange(len(trajectory)))
+
+
+def test_trace_fix_matches_loop():
+    rng = np.random.default_rng(1)
+    # Few distinct positions, so most points repeat an earlier one
+    trajectory = rng.integers(0, 4, size=(60, 2)).astype(float) * 1.5
+
+    assert trace_fix(trajectory, "red") == trace_fix_by_loop(trajectory, "red")
+
+
+def test_render_report_writes_one_image_per_result(tmp_path, capsys):
+    results_path, metadata_path = tmp_path / "results", tmp_path / "metadata"
+    rng = np.random.default_rng(2)
+
+    for building, floor, trace in (("B", "F1", "a"), ("B", "F1", "b"), ("B", "F2", "c")):
+        timestamps = 1578462618000 + 20 * np.arange(50)
+        states = rng.uniform(0.0, 100.0, size=(50, 8))
+        waypoints = np.column_stack((timestamps[::10], states[::10, :2]))
+        with ResultWriter(building, floor, trace, results_path) as writer:
+            writer.write_attributes(waypoints=waypoints)
+            writer.append(timestamps, states=states)
+
+    for floor in ("F1", "F2"):
+        write_synthetic_floor_info(metadata_path / "B" / floor / "floor_info.json")
+        Image.new("RGB", (40, 30), "white").save(metadata_path / "B" / floor / "floor_image.png")
+
+    # A result on a floor without metadata is reported, the others are still written
+    with ResultWriter("B", "F3", "d", results_path) as writer:
+        writer.write_attributes(waypoints=waypoints)
+        writer.append(timestamps, states=states)
+
+    report_files = render_report(
+        output_dir=tmp_path / "reports",
+        image_format="png",
+        max_points=20,
+        workers=2,
+        results_path=results_path,
+        metadata_path=metadata_path,
+    )
+
+    reports = tmp_path / "reports" / "B"
+    expected = [reports / "F1" / "a.png", reports / "F1" / "b.png", reports / "F2" / "c.png"]
+    assert sorted(report_files) == expected
+    assert sorted((tmp_path / "reports").rglob("*.png")) == expected
+    for report_file in report_files:
+        with Image.open(report_file) as image:
+            assert image.format == "PNG"
+    assert "B/F3/d failed" in capsys.readouterr().err
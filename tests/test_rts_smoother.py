@@ -0,0 +1,108 @@
+import numpy as np
+
+from run_ukf import perform_ukf
+from src.model.fixed_lag_smoother import FixedLagSmoother
+from src.model.rts_smoother import rts_smoother, rts_smoother_from_predictions, smoothing_message
+from src.util.parameters import Params
+
+
+def position_error(states, measurements):
+    return np.mean(np.hypot(*(states[:, :2] - measurements[:, :2]).T))
+
+
+def test_smoother_from_predictions_matches_rts_smoother(
+    synthetic_traces, filter_parameters, sigma_parameters
+):
+    _, _, _, _, timestep, measurements = synthetic_traces[0]
+    Q = filter_parameters[3]
+
+    estimated_mu, estimated_cov, *predictions = perform_ukf(
+        measurements,
+        timestep,
+        *filter_parameters,
+        record_predictions=True,
+        rng=np.random.default_rng(2),
+        **sigma_parameters,
+    )
+    smoothed_mu, smoothed_cov, smoothed_fraction = rts_smoother_from_predictions(
+        estimated_mu, estimated_cov, *predictions
+    )
+    assert smoothed_fraction == 1.0 and smoothing_message(smoothed_fraction) is None
+
+    # Every estimate but the last is moved and gets a smaller covariance
+    moved = np.abs(smoothed_mu - estimated_mu).max(axis=1) > 1e-3
+    shrunk = np.trace(smoothed_cov, axis1=1, axis2=2) < np.trace(estimated_cov, axis1=1, axis2=2)
+    assert moved.mean() > 0.9 and shrunk.mean() > 0.9
+
+    # rts_smoother draws the angle noise of its state transitions from np.random
+    np.random.seed(2)
+    expected_mu, _ = rts_smoother(estimated_mu, estimated_cov, Q, timestep, **sigma_parameters)
+
+    assert np.all(np.isfinite(smoothed_cov))
+    assert position_error(smoothed_mu, measurements) < 1.5 * position_error(
+        expected_mu, measurements
+    )
+    np.testing.assert_allclose(smoothed_mu[:, :2], expected_mu[:, :2], atol=2.0)
+
+
+def test_smoother_from_predictions_with_indefinite_covariances(
+    synthetic_traces, filter_parameters, sigma_parameters
+):
+    _, _, _, _, timestep, measurements = synthetic_traces[0]
+    estimated_mu, estimated_cov, *predictions = perform_ukf(
+        measurements,
+        timestep,
+        *filter_parameters,
+        record_predictions=True,
+        rng=np.random.default_rng(2),
+        **sigma_parameters,
+    )
+
+    # Steps with an indefinite predicted covariance keep their filtered estimates, the others
+    # are still smoothed
+    predicted_cov = predictions[1].copy()
+    predicted_cov[1::2] *= -1.0
+    smoothed_mu, _, smoothed_fraction = rts_smoother_from_predictions(
+        estimated_mu, estimated_cov, predictions[0], predicted_cov, predictions[2]
+    )
+
+    steps = len(measurements) - 1
+    assert smoothed_fraction == (steps - len(measurements) // 2) / steps
+    assert smoothing_message(smoothed_fraction).startswith("Only 49.2% of the steps")
+    np.testing.assert_array_equal(smoothed_mu[0::2], estimated_mu[0::2])
+    assert np.all(np.abs(smoothed_mu[1:-1:2] - estimated_mu[1:-1:2]).max(axis=1) > 1e-3)
+
+
+def test_nothing_is_smoothed_with_default_parameters(synthetic_traces):
+    _, _, _, _, timestep, measurements = synthetic_traces[0]
+
+    # Drawn noise matrices and the default sigma weights make every predicted covariance
+    # indefinite, so the smoothers report that they left the filtered estimates unchanged
+    parameters = Params(seed=2)
+    filter_parameters = (
+        parameters.initial_mu_,
+        parameters.initial_covariance_,
+        parameters.R_,
+        parameters.process_noise,
+    )
+    estimated_mu, estimated_cov, *predictions = perform_ukf(
+        measurements,
+        timestep,
+        *filter_parameters,
+        record_predictions=True,
+        rng=parameters.generator(),
+    )
+    assert np.all(np.linalg.eigvalsh(predictions[1])[:, 0] < 0)
+
+    smoothed_mu, _, smoothed_fraction = rts_smoother_from_predictions(
+        estimated_mu, estimated_cov, *predictions
+    )
+
+    assert smoothed_fraction == 0.0
+    assert smoothing_message(smoothed_fraction).startswith("Nothing was smoothed")
+    np.testing.assert_array_equal(smoothed_mu, estimated_mu)
+
+    smoother = FixedLagSmoother(5, *filter_parameters, rng=parameters.generator())
+    list(smoother.filter(zip(measurements, timestep)))
+    assert smoother.linked_steps == len(measurements) - 1
+    assert smoother.smoothed_fraction == 0.0
@@ -0,0 +1,111 @@
+import functools
+import numpy as np
+import pytest
+
+import run_ukf_dataset
+from run_ukf import perform_ukf
+from src.scripts import build_fingerprint_index
+from src.scripts.build_fingerprint_index import trace_fingerprints, merge_fingerprints
+from src.scripts.dataset_catalog import DatasetCatalog
+from src.scripts.get_required_data import get_data
+from src.scripts.result_store import ResultReader, ResultWriter
+from src.scripts.synthetic_trace import write_synthetic_trace, write_synthetic_floor_info
+from src.model.wifi_fingerprint import (
+    FingerprintIndex,
+    fingerprint_index_path,
+    load_building_indices,
+    locate_position_fixes,
+)
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+
+    """
+    Training traces of two floors of building B with their fingerprint indices and a test
+    trace, which is the F2 trace stored flat without its waypoints.
+
+    :return: Dataset directory
+    """
+
+    uncached_get_data = functools.partial(get_data, cache=False)
+    monkeypatch.setattr(build_fingerprint_index, "get_data", uncached_get_data)
+
+    for seed, floor in enumerate(("F1", "F2")):
+        trace_file = tmp_path / "train" / "B" / floor / "trace.txt"
+        write_synthetic_trace(trace_file, duration=20.0, rate=10.0, seed=seed)
+        write_synthetic_floor_info(tmp_path / "metadata" / "B" / floor / "floor_info.json")
+        index = FingerprintIndex.fit(*merge_fingerprints([trace_fingerprints(trace_file)]))
+        index.save(fingerprint_index_path("B", floor, tmp_path / "fingerprints"))
+
+    lines = (tmp_path / "train" / "B" / "F2" / "trace.txt").read_text().splitlines(True)
+    (tmp_path / "test").mkdir()
+    (tmp_path / "test" / "unknown.txt").write_text(
+        "".join(line for line in lines if "TYPE_WAYPOINT" not in line).replace(
+            "SiteID:synthetic", "SiteID:B"
+        )
+    )
+
+    catalog = functools.partial(DatasetCatalog, tmp_path / "catalog.sqlite", tmp_path / "metadata")
+    monkeypatch.setattr(run_ukf_dataset, "DatasetCatalog", catalog)
+    monkeypatch.setattr(run_ukf_dataset, "METADATA_PATH", tmp_path / "metadata")
+    monkeypatch.setattr(run_ukf_dataset, "get_data", uncached_get_data)
+    monkeypatch.setattr(
+        run_ukf_dataset,
+        "locate_position_fixes",
+        functools.partial(locate_position_fixes, root=tmp_path / "fingerprints"),
+    )
+    monkeypatch.setattr(
+        run_ukf_dataset, "ResultWriter", functools.partial(ResultWriter, chunk_size=64)
+    )
+    load_building_indices.cache_clear()
+
+    return tmp_path
+
+
+def test_streamed_estimates_match_perform_ukf(dataset, filter_parameters, sigma_parameters):
+    trace_file = dataset / "train" / "B" / "F1" / "trace.txt"
+    _, _, _, timestep, measurements, _ = run_ukf_dataset.load_trace(trace_file)
+
+    run_ukf_dataset.process_trace(
+        trace_file,
+        dataset / "results",
+        *filter_parameters,
+        rng=np.random.default_rng(3),
+        **sigma_parameters,
+    )
+    expected_mu, expected_cov = perform_ukf(
+        measurements,
+        timestep,
+        *filter_parameters,
+        rng=np.random.default_rng(3),
+        **sigma_parameters,
+    )
+
+    # 200 samples span several chunks of 64 and a partial last chunk
+    results = ResultReader("B", "F1", "trace", dataset / "results").read()
+    np.testing.assert_allclose(results["states"], expected_mu)
+    np.testing.assert_allclose(results["covariances"], expected_cov)
+    np.testing.assert_array_equal(results["timesteps"], timestep)
+
+
+def test_test_trace_runs_on_located_floor(dataset, filter_parameters, sigma_parameters):
+    run_ukf_dataset.find_traces(dataset / "test")
+    trace_file = dataset / "test" / "unknown.txt"
+
+    building, floor, timestamps, _, measurements, attributes = run_ukf_dataset.load_trace(
+        trace_file
+    )
+    assert (building, floor) == ("B", "F2")
+    assert len(attributes["waypoints"]) == 0
+    assert len(attributes["position_fixes"]) > 0
+    assert len(measurements) == len(timestamps)
+
+    run_ukf_dataset.process_trace(
+        trace_file, dataset / "results", *filter_parameters, **sigma_parameters
+    )
+    results = ResultReader("B", "F2", "unknown", dataset / "results")
+    assert np.all(np.isfinite(results.read(fields=["states"])["states"]))
+    np.testing.assert_array_equal(
+        results.attributes()["position_fixes"], attributes["position_fixes"]
+    )
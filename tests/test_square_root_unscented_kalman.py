@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from run_ukf import perform_ukf
+from src.model.measurement_functions import hx
+from src.model.noise_stream import NoiseStream
+from src.model.square_root_unscented_kalman import cholupdate, compute_sigmas_sqrt
+from src.model.state_transition_functions import fx
+from src.model.unscented_filter import UnscentedFilter
+from src.model.unscented_kalman import perform_ut, update
+from src.util.metrics import MetricsObserver
+
+
+def test_cholupdate_downdate():
+    rng = np.random.default_rng(0)
+    A = rng.normal(size=(8, 8))
+    P = A @ A.T + 8 * np.eye(8)
+    v = rng.normal(size=8)
+
+    S = cholupdate(np.linalg.cholesky(P), v, -1.0)
+
+    np.testing.assert_allclose(S @ S.T, P - np.outer(v, v))
+    np.testing.assert_array_equal(S, np.tril(S))
+
+
+def test_square_root_step_matches_svd_step(synthetic_traces, filter_parameters, sigma_parameters):
+    _, _, _, _, timestep, measurements = synthetic_traces[2]
+    _, _, R, Q = filter_parameters
+    ukf = UnscentedFilter(*filter_parameters, square_root=True, **sigma_parameters)
+    noise = NoiseStream(np.random.default_rng(5), len(ukf.wm))
+
+    for measurement, dt in zip(measurements[:20], timestep):
+        fx_noise, hx_noise = noise.next()
+
+        # Covariance step of the SVD filter from the sigma points of the square root filter
+        sigmas = compute_sigmas_sqrt(ukf.lambda_, ukf.x, ukf.S)
+        mean, cov, sigmas_f = perform_ut(
+            sigmas, dt, fx, ukf.wm, ukf.wc, Q, True, angle_noise=fx_noise
+        )
+        expected_x, expected_P = update(
+            mean, cov, sigmas_f, dt, measurement, hx, ukf.wm, ukf.wc, R, angle_noise=hx_noise
+        )
+
+        ukf._step_square_root(measurement, dt, noise=(fx_noise, hx_noise))
+
+        # The update cancels most of a predicted covariance with entries of order 1e4
+        np.testing.assert_allclose(ukf.x, expected_x, rtol=1e-8, atol=1e-8)
+        np.testing.assert_allclose(ukf.P, expected_P, rtol=1e-6, atol=1e-6)
+
+
+def test_square_root_filter_follows_svd_filter(
+    synthetic_traces, filter_parameters, sigma_parameters
+):
+    _, _, _, _, timestep, measurements = synthetic_traces[2]
+    metrics = MetricsObserver()
+
+    sqrt_mu, sqrt_cov = perform_ukf(
+        measurements,
+        timestep,
+        *filter_parameters,
+        observer=metrics,
+        square_root=True,
+        rng=np.random.default_rng(5),
+        **sigma_parameters,
+    )
+    svd_mu, svd_cov = perform_ukf(
+        measurements, timestep, *filter_parameters, rng=np.random.default_rng(5), **sigma_parameters
+    )
+
+    # Every step took the square root path, none fell back to the SVD
+    assert metrics.stage_calls["update_sqrt"] == len(measurements)
+    assert metrics.stage_calls["perform_ut"] == 0
+
+    # Sigma points come from a Cholesky factor instead of the SVD, a different square root of
+    # the same covariance, so the nonlinear transforms and the runs only agree closely
+    np.testing.assert_allclose(sqrt_mu[:, :2], svd_mu[:, :2], atol=0.05)
+    np.testing.assert_allclose(sqrt_cov, svd_cov, atol=0.05)
+
+
+def test_square_root_rejects_negative_central_weight(filter_parameters):
+    with pytest.raises(ValueError, match="non-negative"):
+        UnscentedFilter(*filter_parameters, alpha=0.3, beta=2.0, kappa=-5, square_root=True)
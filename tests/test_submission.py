@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+import run_submission
+
+from src.scripts.submission import (
+    SubmissionWriter,
+    check_checkpoint_setup,
+    floor_number,
+    read_checkpoint,
+    read_sample_submission,
+    submission_rows,
+    write_checkpoint,
+)
+from src.util.parameters import Params
+
+
+def test_floor_number():
+    floors = {"B2": -2, "B1": -1, "F1": 0, "1F": 0, "F3": 2, "3F": 2}
+    assert {floor: floor_number(floor) for floor in floors} == floors
+
+    with pytest.raises(ValueError):
+        floor_number("L1")
+
+
+def test_checkpoints(tmp_path):
+    rows = submission_rows(
+        "B", "trace", np.array([1578462618000, 1578462619000]), -1, np.array([[1, 2], [3.5, 4]])
+    )
+    assert rows == [
+        "B_trace_1578462618000,-1,1.000000,2.000000",
+        "B_trace_1578462619000,-1,3.500000,4.000000",
+    ]
+
+    assert read_checkpoint(tmp_path / "checkpoints", "trace") is None
+    write_checkpoint(tmp_path / "checkpoints", "trace", rows)
+    assert read_checkpoint(tmp_path / "checkpoints", "trace") == rows
+    assert [path.name for path in (tmp_path / "checkpoints").iterdir()] == ["trace.csv"]
+
+
+def test_checkpoint_setup(tmp_path):
+    setup = {"parameters": "digest", "smooth": "False"}
+
+    check_checkpoint_setup(tmp_path, setup)
+    check_checkpoint_setup(tmp_path, setup)
+
+    with pytest.raises(ValueError, match="smooth"):
+        check_checkpoint_setup(tmp_path, dict(setup, smooth="True"))
+    with pytest.raises(ValueError, match="parameters"):
+        check_checkpoint_setup(tmp_path, dict(setup, parameters="other"))
+
+
+def test_submission_writer(tmp_path):
+    path = tmp_path / "submission.csv"
+
+    with SubmissionWriter(path) as writer:
+        writer.write(["a,0,1,2"])
+        writer.write(["b,0,3,4", "c,0,5,6"])
+    assert writer.rows == 3
+    assert path.read_text() == "site_path_timestamp,floor,x,y\na,0,1,2\nb,0,3,4\nc,0,5,6\n"
+
+    # An interrupted run leaves the earlier submission in place
+    with pytest.raises(KeyboardInterrupt):
+        with SubmissionWriter(path) as writer:
+            writer.write(["d,0,7,8"])
+            raise KeyboardInterrupt
+    assert path.read_text().splitlines()[1:] == ["a,0,1,2", "b,0,3,4", "c,0,5,6"]
+
+
+def test_inference_resumes_matching_checkpoints(tmp_path, monkeypatch):
+    monkeypatch.setattr(run_submission, "find_traces", lambda *args, **kwargs: [])
+    sample = tmp_path / "sample_submission.csv"
+    sample.write_text(
+        "site_path_timestamp,floor,x,y\n"
+        "B_done_0000000001000,0,75.0,75.0\n"
+        "B_done_0000000002000,0,75.0,75.0\n"
+        "B_missing_0000000001000,0,75.0,75.0\n"
+    )
+    timestamps, sample_rows = read_sample_submission(sample)["B", "done"]
+    np.testing.assert_array_equal(timestamps, [1000, 2000])
+
+    checkpoints, output = tmp_path / "checkpoints", tmp_path / "submission.csv"
+    parameters = Params(seed=0)
+    rows = submission_rows("B", "done", timestamps, 1, np.array([[1.0, 2.0], [3.0, 4.0]]))
+
+    # A new checkpoint directory records the setup of its run
+    assert run_submission.run_inference(sample, output, checkpoints, parameters) == [
+        "done",
+        "missing",
+    ]
+    write_checkpoint(checkpoints, "done", rows)
+
+    failed = run_submission.run_inference(sample, output, checkpoints, parameters, workers=1)
+    assert failed == ["missing"]
+    assert output.read_text().splitlines() == [
+        "site_path_timestamp,floor,x,y",
+        *rows,
+        "B_missing_0000000001000,0,75.0,75.0",
+    ]
+
+    # Checkpoints of other parameters or smoothing are not mixed into a submission
+    with pytest.raises(ValueError, match="parameters"):
+        run_submission.run_inference(sample, output, checkpoints, Params(seed=1))
+    with pytest.raises(ValueError, match="smooth"):
+        run_submission.run_inference(sample, output, checkpoints, parameters, smooth=True)
+    assert output.read_text().splitlines()[1:3] == rows
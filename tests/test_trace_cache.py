@@ -0,0 +1,87 @@
+import os
+import numpy as np
+
+from src.scripts import trace_cache
+from src.scripts.read_data import read_data_file
+from src.scripts.synthetic_trace import write_synthetic_trace
+
+
+def assert_same_data(data, expected):
+    for name, value in trace_cache.data_arrays(expected).items():
+        np.testing.assert_array_equal(trace_cache.data_arrays(data)[name], value)
+
+
+def test_cached_read_matches_parse(tmp_path, monkeypatch):
+    trace_file = tmp_path / "trace.txt"
+    write_synthetic_trace(trace_file, duration=3.0, rate=20.0)
+    cache_dir = tmp_path / "cache"
+
+    data = trace_cache.read_data_file_cached(trace_file, cache_dir)
+    assert_same_data(data, read_data_file(trace_file))
+    assert len(list(cache_dir.glob("*.npz"))) == 1
+
+    # The second read must come from the cache
+    def fail(filepath):
+        raise AssertionError("parsed again")
+
+    monkeypatch.setattr(trace_cache, "read_data_file", fail)
+    assert_same_data(trace_cache.read_data_file_cached(trace_file, cache_dir), data)
+
+
+def test_eviction_keeps_cache_in_budget(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    stale_file = cache_dir / "dead_writer.tmp"
+    stale_file.write_bytes(b"partial")
+    os.utime(stale_file, (0, 0))
+
+    trace_files = []
+    for i in range(4):
+        trace_files.append(tmp_path / f"trace_{i}.txt")
+        write_synthetic_trace(trace_files[-1], duration=3.0, rate=20.0, seed=i)
+
+    trace_cache.read_data_file_cached(trace_files[0], cache_dir)
+    max_bytes = int(2.5 * trace_cache.cache_size(cache_dir))
+    for trace_file in trace_files[1:]:
+        trace_cache.read_data_file_cached(trace_file, cache_dir, max_bytes)
+
+    assert trace_cache.cache_size(cache_dir) <= max_bytes
+    assert len(list(cache_dir.glob("*.npz"))) == 2
+    assert not stale_file.exists()
+
+
+def test_cache_write_error_returns_parsed_data(tmp_path, monkeypatch, capsys):
+    trace_file = tmp_path / "trace.txt"
+    write_synthetic_trace(trace_file, duration=3.0, rate=20.0)
+    cache_dir = tmp_path / "cache"
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(np, "savez", fail)
+    data = trace_cache.read_data_file_cached(trace_file, cache_dir)
+
+    assert_same_data(data, read_data_file(trace_file))
+    assert list(cache_dir.iterdir()) == []
+    assert "Could not cache" in capsys.readouterr().err
+
+
+def test_broken_or_untouchable_entries(tmp_path, monkeypatch):
+    trace_file = tmp_path / "trace.txt"
+    write_synthetic_trace(trace_file, duration=3.0, rate=20.0)
+    cache_dir = tmp_path / "cache"
+    data = trace_cache.read_data_file_cached(trace_file, cache_dir)
+    (cache_file,) = cache_dir.glob("*.npz")
+
+    # An entry which cannot be touched, e.g. in a read-only cache, is still a hit
+    def fail(path):
+        raise PermissionError(path)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(os, "utime", fail)
+        assert_same_data(trace_cache.load_cached_data(trace_file, cache_dir), data)
+
+    # A truncated entry is a miss
+    cache_file.write_bytes(cache_file.read_bytes()[: cache_file.stat().st_size // 2])
+    assert trace_cache.load_cached_data(trace_file, cache_dir) is None
+    assert_same_data(trace_cache.read_data_file_cached(trace_file, cache_dir), data)
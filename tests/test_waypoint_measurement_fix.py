@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from src.model.waypoint_measurement_fix import fix_waypoint, fix_waypoints
+
+
+@pytest.mark.parametrize("estimate", [False, True])
+def test_fix_waypoints_matches_fix_waypoint(estimate):
+    rng = np.random.default_rng(0)
+    timestamps, waypoints = [], []
+
+    for i in range(30):
+        # Sorted, unsorted and duplicate sample timestamps, waypoints also outside the trace
+        t = 1578462618000.0 + np.sort(rng.integers(0, 20000, rng.integers(1, 200)))
+        if i % 3 == 1:
+            t = rng.permutation(t)
+        way_t = rng.integers(t.min() - 3000, t.max() + 3000, rng.integers(1, 10))
+        timestamps.append(t)
+        waypoints.append(np.column_stack((way_t, rng.uniform(0, 200, (len(way_t), 2)))))
+
+    offsets = np.concatenate(([0], np.cumsum([len(t) for t in timestamps])))
+    waypoint_offsets = np.concatenate(([0], np.cumsum([len(way) for way in waypoints])))
+
+    fixed = fix_waypoints(
+        np.concatenate(timestamps), offsets, np.concatenate(waypoints), waypoint_offsets, estimate
+    )
+
+    for i, (t, way) in enumerate(zip(timestamps, waypoints)):
+        np.testing.assert_array_equal(
+            fixed[offsets[i] : offsets[i + 1]], fix_waypoint(t, way, estimate)
+        )